@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Benchmark the conversion pipeline on a synthetic, deterministic corpus.
+
+Times each stage (protocol encode with the native encoders and through
+pyIRDecoder, pack, compress, base64, decode) per code and reports
+codes/sec, p50/p99 latency, peak memory and script start-up time. With --jitter it also compares the compressed size and compress time
+of jittered signals before and after timing normalization. Results can be
+written as JSON and compared against an earlier run:
+
+  python3 benchmarks/benchmark.py -o before.json
+  python3 benchmarks/benchmark.py --baseline before.json --max-regression 0.15
+
+The protocol encode stages need pyIRDecoder and are skipped without it.
+"""
+
+import argparse
+import base64
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, os.path.abspath(SCRIPTS_DIR))
+sys.path.insert(0, os.path.expanduser("~/irdb_to_tuya/pyIRDecoder"))
+
+import tuya_codec
+from timing_normalize import DEFAULT_TOLERANCE, normalize_timings
+from tuya_codec import LEVELS, CodeCache, compress, decode_ir, pack_signals
+
+RESULTS_VERSION = 1
+
+# --- synthetic corpus -------------------------------------------------------
+
+def nec_frame(device, function):
+    timings = [9024, 4512]
+    for byte in (device, device ^ 0xFF, function, function ^ 0xFF):
+        for i in range(8):
+            timings += [564, 1692 if byte >> i & 1 else 564]
+    return timings + [564, 40884]
+
+def nec_repeated(device, function, repeats=3):
+    frame = nec_frame(device, function)
+    return frame + [9024, 2256, 564, 96156] * repeats + frame
+
+def ac_frame(rng, nbytes=18, frames=2):
+    state = [rng.randrange(256) for _ in range(nbytes)]
+    timings = []
+    for _ in range(frames):
+        timings += [3500, 1750]
+        for byte in state:
+            for i in range(8):
+                timings += [435, 1300 if byte >> i & 1 else 435]
+        timings += [435, 10000]
+        state[rng.randrange(nbytes)] ^= 1 << rng.randrange(8)
+    return timings
+
+def biphase(levels, unit):
+    """Merge a list of (level, units) half-bits into mark/space durations."""
+    timings = []
+    last = None
+    for level, units in levels:
+        if level == last:
+            timings[-1] += units * unit
+        else:
+            timings.append(units * unit)
+            last = level
+    if last == 0:
+        timings.pop()
+    return timings
+
+def rc5_frame(address, command, toggle=0):
+    bits = [1, 1, toggle] + [address >> i & 1 for i in range(4, -1, -1)] + \
+           [command >> i & 1 for i in range(5, -1, -1)]
+    halves = []
+    for bit in bits:
+        halves += [(0, 1), (1, 1)] if bit else [(1, 1), (0, 1)]
+    if halves[0][0] == 0:
+        halves.pop(0)
+    return biphase(halves, 889) + [89000]
+
+def rc6_frame(address, command, toggle=0):
+    halves = [(1, 6), (0, 2), (1, 1), (0, 1)]  # leader + start bit
+    for bit in (0, 0, 0):                      # mode 0
+        halves += [(1, 1), (0, 1)] if bit else [(0, 1), (1, 1)]
+    halves += [(1, 2), (0, 2)] if toggle else [(0, 2), (1, 2)]
+    for bit in [address >> i & 1 for i in range(7, -1, -1)] + [command >> i & 1 for i in range(7, -1, -1)]:
+        halves += [(1, 1), (0, 1)] if bit else [(0, 1), (1, 1)]
+    return biphase(halves, 444) + [83000]
+
+def build_corpus(seed=0, size=200):
+    """Return {kind: [signal, ...]} with `size` signals per kind."""
+    rng = random.Random(seed)
+    return {
+        "nec": [nec_frame(rng.randrange(256), rng.randrange(256)) for _ in range(size)],
+        "ac": [ac_frame(rng) for _ in range(size)],
+        "rc5": [rc5_frame(rng.randrange(32), rng.randrange(64), i & 1) for i in range(size)],
+        "rc6": [rc6_frame(rng.randrange(256), rng.randrange(256), i & 1) for i in range(size)],
+        "repeated": [nec_repeated(rng.randrange(256), rng.randrange(256)) for _ in range(size)],
+    }
+
+PROTOCOL_PARAMS = {
+    "NEC": lambda rng: (rng.randrange(256), -1, rng.randrange(256)),
+    "RC5": lambda rng: (rng.randrange(32), -1, rng.randrange(64)),
+    "RC6": lambda rng: (rng.randrange(256), -1, rng.randrange(256)),
+    "Sony12": lambda rng: (rng.randrange(32), -1, rng.randrange(128)),
+}
+
+# --- stages -----------------------------------------------------------------
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def summarize(latencies_ns):
+    latencies_ns = sorted(latencies_ns)
+    total = sum(latencies_ns)
+    return {
+        "codes": len(latencies_ns),
+        "codes_per_sec": len(latencies_ns) / (total / 1e9) if total else 0.0,
+        "p50_us": percentile(latencies_ns, 0.50) / 1e3,
+        "p99_us": percentile(latencies_ns, 0.99) / 1e3,
+    }
+
+def time_calls(func, items):
+    latencies = []
+    results = []
+    clock = time.perf_counter_ns
+    for item in items:
+        start = clock()
+        result = func(item)
+        latencies.append(clock() - start)
+        results.append(result)
+    return latencies, results
+
+def compress_payload(payload, level=2):
+    compress(out := io.BytesIO(), payload, level)
+    return out.getvalue()
+
+def run_codec_stages(signals, level=2):
+    """Time pack -> compress -> base64 -> decode for each signal."""
+    stages = {}
+    lat, payloads = time_calls(lambda s: pack_signals([s])[0], signals)
+    stages["pack"] = lat
+    lat, compressed = time_calls(lambda p: compress_payload(p, level), payloads)
+    stages["compress"] = lat
+    lat, codes = time_calls(lambda c: base64.b64encode(c).decode('ascii'), compressed)
+    stages["base64"] = lat
+    lat, decoded = time_calls(decode_ir, codes)
+    stages["decode"] = lat
+
+    for signal, back in zip(signals, decoded):
+        assert back == [min(abs(t), 65535) for t in signal], "round trip mismatch"
+    return stages, sum(map(len, payloads)), sum(map(len, compressed))
+
+class _NoNativeEncoders:
+    """Stands in for irdb_common.NATIVE_ENCODERS to force the pyIRDecoder path."""
+
+    def encode(self, *args):
+        return None
+
+def run_encode_stages(rng, count):
+    """
+    Time successful protocol encodes (uncached) of the same rows twice:
+    with the native encoders, for the protocols where they are verified,
+    and through pyIRDecoder. {stage: latencies}; None without pyIRDecoder.
+    """
+    if importlib.util.find_spec("pyIRDecoder") is None:
+        return None
+    import irdb_common
+    irdb_common.ENCODE_CACHE = irdb_common.EncodeCache(maxsize=0)
+    native = irdb_common.NATIVE_ENCODERS
+    protocols = [name for name in sorted(PROTOCOL_PARAMS) if irdb_common.get_protocol(name)]
+    if not protocols:
+        return None
+    rows = []
+    for _ in range(count):
+        protocol = rng.choice(protocols)
+        rows.append((protocol, *map(str, PROTOCOL_PARAMS[protocol](rng))))
+
+    stages = {}
+    verified = {name for name in protocols
+                if native.encoder(name, lambda name=name: irdb_common.get_protocol(name)[0]) is not None}
+    native_rows = [row for row in rows if row[0] in verified]
+    if native_rows:
+        latencies, results = time_calls(lambda row: irdb_common.generate_raw_signal(*row), native_rows)
+        stages["encode_native"] = [lat for lat, (rlc, _) in zip(latencies, results) if rlc is not None]
+        rows = native_rows  # compare like with like
+    irdb_common.NATIVE_ENCODERS = _NoNativeEncoders()
+    try:
+        latencies, results = time_calls(lambda row: irdb_common.generate_raw_signal(*row), rows)
+    finally:
+        irdb_common.NATIVE_ENCODERS = native
+    # rows pyIRDecoder rejects would only time the error path
+    stages["encode_pyirdecoder"] = [lat for lat, (rlc, _) in zip(latencies, results) if rlc is not None]
+    return {stage: lat for stage, lat in stages.items() if lat}
+
+def jittered(signals, rng, jitter):
+    """Copies of `signals` with every timing moved by up to +-`jitter` (a fraction)."""
+    return [[max(1, round(t * (1 + rng.uniform(-jitter, jitter)))) for t in signal] for signal in signals]
+
+def run_normalize_comparison(corpus, rng, jitter, tolerance, level=2):
+    """Compressed size and compress time of jittered signals before and after normalization."""
+    comparison = {}
+    for kind, kind_signals in corpus.items():
+        signals = jittered(kind_signals, rng, jitter)
+        norm_lat, normalized = time_calls(lambda s: normalize_timings(s, tolerance), signals)
+        row = {"normalize_us": sum(norm_lat) / 1e3}
+        for label, variant in (("raw", signals), ("normalized", normalized)):
+            payloads = [pack_signals([s])[0] for s in variant]
+            lat, compressed = time_calls(lambda p: compress_payload(p, level), payloads)
+            row[label] = {"compressed_bytes": sum(map(len, compressed)),
+                          "ratio": sum(map(len, compressed)) / sum(map(len, payloads)),
+                          "compress_us": sum(lat) / 1e3}
+        comparison[kind] = row
+    return comparison
+
+def run_level_comparison(corpus, levels=LEVELS):
+    """Compressed size and compress throughput of the corpus at each compression level."""
+    payloads = {kind: [pack_signals([s])[0] for s in kind_signals] for kind, kind_signals in corpus.items()}
+    comparison = {}
+    for level in levels:
+        row = {}
+        for kind, kind_payloads in payloads.items():
+            lat, compressed = time_calls(lambda p: compress_payload(p, level), kind_payloads)
+            size = sum(map(len, compressed))
+            row[kind] = {"compressed_bytes": size,
+                         "ratio": size / sum(map(len, kind_payloads)),
+                         "codes_per_sec": len(lat) / (sum(lat) / 1e9) if sum(lat) else 0.0}
+        comparison[level] = row
+    return comparison
+
+def measure_peak_memory(signals, level=2):
+    tracemalloc.start()
+    try:
+        tuya_codec.encode_ir_batch(signals, level, cache=CodeCache(maxsize=0))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+STARTUP_SNIPPETS = {
+    "interpreter": "pass",
+    "import_scripts": "import irdb_common, tuya_codec",
+    "list_protocols": "import irdb_common; irdb_common.known_protocols()",
+    "first_encode": ("import irdb_common; irdb_common.ENCODE_CACHE = irdb_common.EncodeCache(maxsize=0); "
+                     "irdb_common.generate_raw_signal('NEC', '0', '-1', '0')"),
+}
+
+def measure_startup(rounds=5):
+    """Median wall time (ms) of fresh interpreters running each snippet."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        p for p in (os.path.abspath(SCRIPTS_DIR), os.environ.get("PYTHONPATH")) if p))
+    have_decoder = importlib.util.find_spec("pyIRDecoder") is not None
+    results = {}
+    for name, snippet in STARTUP_SNIPPETS.items():
+        if name != "interpreter" and name != "import_scripts" and not have_decoder:
+            continue
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", snippet], env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+            times.append((time.perf_counter() - start) * 1e3)
+        results[name] = statistics.median(times)
+    return results
+
+def run_benchmark(seed=0, size=200, repeat=3, level=2, jitter=None, tolerance=DEFAULT_TOLERANCE,
+                  compare_levels=False):
+    corpus = build_corpus(seed, size)
+    signals = [signal for kind in corpus.values() for signal in kind]
+
+    latencies = {}
+    by_kind = {}
+    for _ in range(repeat):
+        for kind, kind_signals in corpus.items():
+            stages, raw_bytes, packed_bytes = run_codec_stages(kind_signals, level)
+            for stage, lat in stages.items():
+                latencies.setdefault(stage, []).extend(lat)
+            by_kind[kind] = {"payload_bytes": raw_bytes, "compressed_bytes": packed_bytes,
+                             "ratio": packed_bytes / raw_bytes if raw_bytes else 0.0}
+
+    latencies.update(run_encode_stages(random.Random(seed), len(signals)) or {})
+
+    stage_results = {stage: summarize(lat) for stage, lat in latencies.items()}
+    codec = [sum(per_code) for per_code in zip(*(latencies[s] for s in ("pack", "compress", "base64", "decode")))]
+    stage_results["pipeline"] = summarize(codec)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "numpy": tuya_codec.numpy_module() is not None,
+        "seed": seed,
+        "corpus": {kind: len(kind_signals) for kind, kind_signals in corpus.items()},
+        "level": level,
+        "stages": stage_results,
+        "compression": by_kind,
+        "peak_memory_kb": measure_peak_memory(signals, level) / 1024,
+        "startup_ms": measure_startup(),
+    }
+    if jitter is not None:
+        results["normalize"] = {
+            "jitter": jitter, "tolerance": tolerance,
+            "corpus": run_normalize_comparison(corpus, random.Random(seed), jitter, tolerance, level),
+        }
+    if compare_levels:
+        results["levels"] = run_level_comparison(corpus)
+    return results
+
+# --- reporting --------------------------------------------------------------
+
+def print_report(results, stream=sys.stdout):
+    stream.write(f"Python {results['python']}, NumPy {'yes' if results['numpy'] else 'no'}, "
+                 f"level {results['level']}, corpus {results['corpus']}\n\n")
+    stream.write(f"{'stage':<18}{'codes/s':>12}{'p50 us':>10}{'p99 us':>10}\n")
+    for stage, r in results["stages"].items():
+        stream.write(f"{stage:<18}{r['codes_per_sec']:>12.0f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}\n")
+    stages = results["stages"]
+    if "encode_pyirdecoder" not in stages:
+        stream.write("protocol encodes  skipped (pyIRDecoder not found)\n")
+    elif "encode_native" not in stages:
+        stream.write("encode_native     skipped (no native encoder verified)\n")
+    elif stages["encode_pyirdecoder"]["codes_per_sec"]:
+        speedup = stages["encode_native"]["codes_per_sec"] / stages["encode_pyirdecoder"]["codes_per_sec"]
+        stream.write(f"native encoders are {speedup:.1f}x faster than pyIRDecoder on these keys\n")
+    stream.write(f"\n{'corpus':<18}{'payload B':>12}{'packed B':>10}{'ratio':>10}\n")
+    for kind, r in results["compression"].items():
+        stream.write(f"{kind:<18}{r['payload_bytes']:>12}{r['compressed_bytes']:>10}{r['ratio']:>10.3f}\n")
+    if "normalize" in results:
+        norm = results["normalize"]
+        stream.write(f"\nNormalization (jitter {norm['jitter']:.0%}, tolerance {norm['tolerance']:.0%}):\n")
+        stream.write(f"{'corpus':<18}{'raw B':>10}{'norm B':>10}{'raw ratio':>11}{'norm ratio':>11}"
+                     f"{'raw ms':>9}{'norm ms':>9}{'snap ms':>9}\n")
+        for kind, r in norm["corpus"].items():
+            raw, normalized = r["raw"], r["normalized"]
+            stream.write(f"{kind:<18}{raw['compressed_bytes']:>10}{normalized['compressed_bytes']:>10}"
+                         f"{raw['ratio']:>11.3f}{normalized['ratio']:>11.3f}"
+                         f"{raw['compress_us'] / 1e3:>9.1f}{normalized['compress_us'] / 1e3:>9.1f}"
+                         f"{r['normalize_us'] / 1e3:>9.1f}\n")
+    if "levels" in results:
+        stream.write(f"\nCompression levels (packed bytes / compress codes/s):\n{'level':<8}")
+        kinds = list(results["compression"])
+        stream.write("".join(f"{kind:>22}" for kind in kinds) + "\n")
+        for level, row in results["levels"].items():
+            stream.write(f"{level:<8}" + "".join(
+                f"{row[kind]['compressed_bytes']:>12}{row[kind]['codes_per_sec']:>10.0f}" for kind in kinds) + "\n")
+    stream.write(f"\nPeak memory: {results['peak_memory_kb']:.1f} KiB\n")
+    stream.write("\nStart-up (median of fresh interpreters):\n")
+    for name, ms in results["startup_ms"].items():
+        stream.write(f"  {name:<16}{ms:>8.1f} ms\n")
+
+def find_regressions(results, baseline, max_regression):
+    """Stages whose codes/sec dropped more than `max_regression` (a fraction)."""
+    regressions = []
+    for stage, base in baseline.get("stages", {}).items():
+        now = results["stages"].get(stage)
+        if now is None or not base["codes_per_sec"]:
+            continue
+        change = now["codes_per_sec"] / base["codes_per_sec"] - 1
+        if change < -max_regression:
+            regressions.append((stage, base["codes_per_sec"], now["codes_per_sec"], change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the IRDB to Tuya conversion stages.")
+    parser.add_argument("-n", "--size", type=int, default=200, help="signals per corpus kind")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timing rounds")
+    parser.add_argument("-l", "--level", type=int, choices=LEVELS, default=2, help="Tuya compression level")
+    parser.add_argument("--compare-levels", action="store_true",
+                        help="also report packed size and compress speed at every compression level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jitter", type=float,
+                        help="also compare jittered signals (+-JITTER, a fraction) before and after "
+                             "timing normalization")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"normalization tolerance for --jitter (default {DEFAULT_TOLERANCE})")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="allowed codes/sec drop per stage vs. the baseline (default 0.15)")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.seed, args.size, args.repeat, args.level, args.jitter, args.tolerance,
+                            args.compare_levels)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.max_regression)
+        for stage, before, after, change in regressions:
+            print(f"[REGRESSION] {stage}: {before:.0f} -> {after:.0f} codes/s ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"\nNo stage regressed more than {args.max_regression:.0%} against {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Load-test tuya_service.py offline with the synthetic benchmark corpus.
+
+Starts a service on a private Unix socket (or uses a running one with
+--socket/--port), sends requests from concurrent client threads and
+reports client-side throughput and latency next to the service's own
+per-endpoint metrics:
+
+  python3 benchmarks/load_test.py -c 16 -n 5000
+  python3 benchmarks/load_test.py --endpoint decode --port 8765
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark import SCRIPTS_DIR, PROTOCOL_PARAMS, build_corpus, summarize
+
+from tuya_client import ServiceError, TuyaClient
+from tuya_codec import LEVELS, encode_ir
+
+
+def build_requests(endpoint, count, seed=0, level=2):
+    """[(method name, args)] cycling through the corpus (or random IRDB keys)."""
+    rng = random.Random(seed)
+    corpus = [s for kind in build_corpus(seed, min(max(1, count // 5), 200)).values() for s in kind]
+    rng.shuffle(corpus)
+    requests = []
+    for i in range(count):
+        kind = endpoint if endpoint != "mix" else rng.choice(("encode", "decode", "irdb"))
+        signal = corpus[i % len(corpus)]
+        if kind == "encode":
+            requests.append(("encode", (signal, level)))
+        elif kind == "decode":
+            requests.append(("decode", (encode_ir(signal, level),)))
+        else:
+            protocol = rng.choice(sorted(PROTOCOL_PARAMS))
+            requests.append(("irdb", (protocol, *PROTOCOL_PARAMS[protocol](rng), level)))
+    return requests
+
+def run_load(requests, concurrency, connect):
+    """Send `requests` from `concurrency` threads; returns (latencies_ns, errors, seconds)."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    position = iter(range(len(requests)))
+
+    def worker():
+        client = connect()
+        mine, failed = [], []
+        try:
+            while True:
+                with lock:
+                    i = next(position, None)
+                if i is None:
+                    break
+                method, args = requests[i]
+                start = time.perf_counter_ns()
+                try:
+                    getattr(client, method)(*args)
+                    mine.append(time.perf_counter_ns() - start)
+                except ServiceError as err:
+                    failed.append(err.message)
+        finally:
+            client.close()
+        with lock:
+            latencies.extend(mine)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - start
+
+def start_service(socket_path, workers=None):
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, "tuya_service.py"), "--socket", socket_path]
+    if workers:
+        cmd += ["-j", str(workers)]
+    proc = subprocess.Popen(cmd)
+    deadline = time.time() + 30
+    while not os.path.exists(socket_path):
+        if proc.poll() is not None or time.time() > deadline:
+            proc.kill()
+            sys.exit("[ERROR] The service did not start.")
+        time.sleep(0.05)
+    return proc
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Tuya conversion service.")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="total requests")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("-e", "--endpoint", choices=("encode", "decode", "irdb", "mix"), default="encode")
+    parser.add_argument("-l", "--level", type=int, choices=LEVELS, default=2, help="Tuya compression level")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes of a service started here")
+    parser.add_argument("--socket", help="Unix socket of a running service")
+    parser.add_argument("--port", type=int, help="TCP port of a running service on localhost")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    proc = None
+    socket_path = args.socket
+    if not socket_path and not args.port:
+        socket_path = os.path.join(tempfile.mkdtemp(), "tuya.sock")
+        proc = start_service(socket_path, args.workers)
+
+    def connect():
+        if socket_path:
+            return TuyaClient(socket_path=socket_path)
+        return TuyaClient(port=args.port)
+
+    try:
+        requests = build_requests(args.endpoint, args.requests, args.seed, args.level)
+        latencies, errors, elapsed = run_load(requests, args.concurrency, connect)
+        result = summarize(latencies)
+        print(f"{args.endpoint}: {len(latencies)} ok, {len(errors)} errors in {elapsed:.2f}s "
+              f"with {args.concurrency} clients")
+        print(f"  {len(latencies) / elapsed:.0f} req/s, p50 {result['p50_us'] / 1e3:.2f} ms, "
+              f"p99 {result['p99_us'] / 1e3:.2f} ms")
+        for message in sorted(set(errors))[:5]:
+            print(f"  [ERROR] {message}")
+
+        client = connect()
+        metrics = client.metrics()
+        client.close()
+        print("\nService metrics:")
+        for path, m in metrics["endpoints"].items():
+            if m["requests"]:
+                print(f"  {path:<10}{m['requests']:>8} req {m['errors']:>6} err "
+                      f"{m['mean_ms']:>8.2f} mean ms {m['p50_ms']:>8.2f} p50 {m['p99_ms']:>8.2f} p99")
+        for name, b in metrics["batches"].items():
+            if b["batches"]:
+                print(f"  {name} batches: {b['batches']}, mean size {b['mean_size']:.1f}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+if __name__ == "__main__":
+    main()
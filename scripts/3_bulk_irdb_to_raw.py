@@ -1,149 +1,301 @@
 #!/usr/bin/env python3
 
 import sys
-import pyIRDecoder.protocols as protocols
 import os
-import subprocess
 import io
+import argparse
 
-STATIC_PROTOCOLS = [
-    "AdNotham", "Aiwa", "Akai", "Akord", "Amino", "Amino56", "Anthem", "Apple",
-    "Archer", "Audiovox", "Barco", "Blaupunkt", "Bose", "Bryston", "CanalSat",
-    "CanalSatLD", "Denon2", "Denon", "Denon1", "DenonK", "Dgtec", "Digivision",
-    "DirecTV", "DishNetwork", "DishPlayer", "Dyson", "Dyson2", "Elan",
-    "Elunevision", "Emerson", "Entone", "F12", "F120", "F121", "F32", "Fujitsu",
-    "Fujitsu128", "Fujitsu56", "GICable", "GIRG", "GuangZhou", "GwtS", "GXB",
-    "Humax4Phase", "InterVideoRC201", "IODATAn", "Jerrold", "JVC", "JVC48",
-    "JVC56", "Kaseikyo", "Kaseikyo56", "Kathrein", "Konka", "Logitech",
-    "Lumagen", "Lutron", "Matsui", "MCE", "MCIR2kbd", "MCIR2mouse", "Metz19",
-    "Mitsubishi", "MitsubishiK", "Motorola", "NEC", "NEC48", "NECf16", "NECrnc",
-    "NECx", "NECxf16", "Nokia", "Nokia12", "Nokia32", "NovaPace", "NRC16",
-    "NRC1632", "NRC17", "Ortek", "OrtekMCE", "PaceMSS", "Panasonic", "Panasonic2",
-    "PanasonicOld", "PCTV", "PID0001", "PID0003", "PID0004", "PID0083", "Pioneer",
-    "Proton", "Proton40", "RC5", "RC57F", "RC57F57", "RC5x", "RC6", "RC6620",
-    "RC6624", "RC6632", "RC6M16", "RC6M28", "RC6M32", "RC6M56", "RCA", "RCA38",
-    "RCA38Old", "RCAOld", "RECS800045", "RECS800068", "RECS800090", "Revox",
-    "Roku", "RTIRelay", "Sampo", "Samsung20", "Samsung36", "SamsungSMTG", "ScAtl6",
-    "Sharp", "Sharp1", "Sharp2", "SharpDVD", "SIM2", "Sky", "SkyHD", "SkyPlus",
-    "Somfy", "Sony12", "Sony15", "Sony20", "Sony8", "StreamZap", "StreamZap57",
-    "Sunfire", "TDC38", "TDC56", "TeacK", "Thomson", "Thomson7", "Tivo",
-    "Viewstar", "XBox360", "XBoxOne"
-]
-
-def print_protocols_in_columns(protocols_list, columns=4):
-    max_length = max(len(p) for p in protocols_list) + 3
-    rows = (len(protocols_list) + columns - 1) // columns
-    for r in range(rows):
-        row_items = []
-        for c in range(columns):
-            idx = r + c * rows
-            if idx < len(protocols_list):
-                row_items.append(f"{protocols_list[idx]:<{max_length}}")
-        print("".join(row_items))
-
-def sanitize_protocol_name(proto_in_csv):
-    return proto_in_csv.replace("{", "").replace("}", "")
-
-def convert_to_positive(signal):
-    return [abs(x) for x in signal]
-
-def process_input(brand, base_dir, manual_protocol=None):
-    first_output = True
-    brand_dir = os.path.join(base_dir, brand)
+from irdb_common import (
+    BRANDS_USAGE, PROTOCOLS, PROTOCOL_ALIASES, known_protocols, print_protocols_in_columns,
+    sanitize_protocol_name, generate_raw_signal, check_native_encoders, resolve_protocol_aliases,
+)
+import instrument
+from irdb_index import IRDBIndex
+from key_search import KeyMatcher, read_key_file, search_rows
+from protocol_aliases import trial
+from raw_records import RawRecordWriter
+from worker_pool import RETRY_ERRORS, RETRY_FACTOR, ROW_TIMEOUT, TIMEOUT_ERROR, RowTimeout, WorkerPool, row_timeout
 
-    for line in sys.stdin:
-        line = line.strip()
-        if not line or ':' not in line:
-            continue
+class BlockPrinter:
+    """Prints '='-framed text blocks, the first one after a blank gap."""
 
-        filepath, command = line.split(":", 1)
-        parts = command.split(",")
-        if len(parts) != 5:
-            if first_output:
-                print("\n\n")
-                first_output = False
-            print("=" * 75)
-            print(f"[ERROR] Invalid format: {command}")
-            print("=" * 75)
-            continue
+    def __init__(self):
+        self.first = True
 
-        function_name, raw_proto, device, sub_device, function = parts
-        proto_name = manual_protocol if manual_protocol else sanitize_protocol_name(raw_proto)
-
-        proto_cls = getattr(protocols, proto_name, None)
-        if not proto_cls:
-            if first_output:
-                print("\n\n")
-                first_output = False
-            print("=" * 75)
-            print(f"[ERROR] Could NOT generate signal for '{function_name}'")
-            print(f" - Protocol : {proto_name}")
-            print(f" - Device   : {device}")
-            print(f" - SubDev   : {sub_device}")
-            print(f" - Function : {function}")
-            print(f" - Details  : [ERROR] Protocol '{proto_name}' not found.")
-            print("=" * 75)
-            continue
+    def __call__(self, lines):
+        if self.first:
+            print("\n\n")
+            self.first = False
+        print("=" * 75)
+        for line in lines:
+            print(line)
+        print("=" * 75)
 
-        try:
-            proto_obj = proto_cls(parent=None)
-            device_int = int(device)
-            function_int = int(function)
-
-            if hasattr(proto_obj, 'encode_parameters') and any(
-                param[0] == 'sub_device' for param in proto_obj.encode_parameters
-            ):
-                sub_device_int = 0 if sub_device == "-1" else int(sub_device)
-                encoded = proto_obj.encode(
-                    device=device_int,
-                    sub_device=sub_device_int,
-                    function=function_int
-                )
+def encode_row(proto_name, device, sub_device, function, timeout=None):
+    """
+    generate_raw_signal() with at most `timeout` seconds; running over comes
+    back as a [TIMEOUT] error. Top level so it can run in a worker process.
+    """
+    try:
+        with row_timeout(timeout):
+            return generate_raw_signal(proto_name, device, sub_device, function)
+    except RowTimeout:
+        instrument.count("row_timeouts")
+        return None, f"{TIMEOUT_ERROR} row took longer than {timeout}s"
+
+def print_row(printer, row, rlc, err_msg, writer=None):
+    """
+    Successful keys are printed as a text block, or written to `writer` (a
+    RawRecordWriter) when one is given; errors are always printed. Returns
+    whether the row converted.
+    """
+    brand, csv_file, function_name, proto_name, device, sub_device, function, keys = row
+    if rlc is not None and writer is not None:
+        with instrument.timer("write"):
+            writer.write(brand, csv_file, function_name, proto_name, rlc)
+        return True
+
+    with instrument.timer("print"):
+        if rlc is not None:
+            printer([f"Brand      : {brand}",
+                     f"CSV File   : {csv_file}",
+                     f"Function   : {function_name}",
+                     *([f"Key        : {', '.join(keys)}"] if keys else []),
+                     f"Protocol   : {proto_name}",
+                     f"Raw Timing : {rlc}"])
+        else:
+            printer([f"[ERROR] Could NOT generate signal for '{function_name}'",
+                     f" - Protocol : {proto_name}",
+                     f" - Device   : {device}",
+                     f" - SubDev   : {sub_device}",
+                     f" - Function : {function}",
+                     f" - Details  : {err_msg}"])
+    return rlc is not None
+
+def _report_alias(name, result):
+    if result:
+        state = "" if result["verified"] else " (not verified by decoding)"
+        print(f"Protocol {name!r} -> {result['protocol']}{state}", file=sys.stderr)
+
+def _encoded(rows, timeout, workers):
+    """
+    (row, (rlc, err_msg)) for `rows`, in order; on a WorkerPool when
+    `workers` is set. Unknown protocol names are resolved before their
+    rows run, outside the row timeout: with a pool the candidate trials
+    run on it while the other rows convert, and the rows wait for them.
+    """
+    if not workers:
+        for row in rows:
+            for name, result in resolve_protocol_aliases([row[3:7]]).items():
+                _report_alias(name, result)
+            yield row, encode_row(*row[3:7], timeout)
+        return
+    rows = iter(rows)
+    pending, results = {}, {}
+    waiting = {}    # protocol -> [indexes of rows waiting for its trials]
+    trials = {}     # protocol -> [sample rows, trials still running, scores]
+    submitted = emitted = 0
+    # the pool only kills rows that SIGALRM cannot interrupt; convert_rows() does the retrying
+    with WorkerPool(workers, timeout * 2 + 5 if timeout else None, retries=0) as pool:
+
+        def submit(index, proto_name):
+            row = pending[index]
+            if proto_name is None:
+                results[index] = None, f"[ERROR] Protocol '{row[3]}' not found in pyIRDecoder.protocols."
             else:
-                encoded = proto_obj.encode(
-                    device=device_int,
-                    function=function_int
-                )
-
-            rlc = convert_to_positive(encoded.original_rlc)
-            csv_file = os.path.relpath(filepath, brand_dir)
-
-            if first_output:
-                print("\n\n")
-                first_output = False
-            print("=" * 75)
-            print(f"Brand      : {brand}")
-            print(f"CSV File   : {csv_file}")
-            print(f"Function   : {function_name}")
-            print(f"Protocol   : {proto_name}")
-            print(f"Raw Timing : {rlc}")
-            print("=" * 75)
-
-        except Exception as e:
-            if first_output:
-                print("\n\n")
-                first_output = False
-            print("=" * 75)
-            print(f"[ERROR] Could NOT generate signal for '{function_name}'")
-            print(f" - Protocol : {proto_name}")
-            print(f" - Device   : {device}")
-            print(f" - SubDev   : {sub_device}")
-            print(f" - Function : {function}")
-            print(f" - Details  : [ERROR] {e}")
-            print("=" * 75)
+                pool.submit(("row", index), encode_row, proto_name, *row[4:7], timeout)
+
+        def trials_done(name):
+            samples, _, scores = trials.pop(name)
+            result = PROTOCOL_ALIASES.choose({name: samples}, scores)[name]
+            _report_alias(name, result)
+            for index in waiting.pop(name):
+                submit(index, result and result["protocol"])
+
+        while True:
+            for row in rows:
+                index, name = submitted, row[3]
+                pending[index] = row
+                submitted += 1
+                if name in waiting:
+                    waiting[name].append(index)
+                elif PROTOCOLS.entry(name):
+                    submit(index, name)
+                elif (result := PROTOCOL_ALIASES.cached(name)) is not False:
+                    submit(index, result and result["protocol"])
+                else:
+                    samples = [tuple(row[4:7])]
+                    jobs = PROTOCOL_ALIASES.trial_jobs({name: samples})
+                    waiting[name] = [index]
+                    trials[name] = [samples, len(jobs), {}]
+                    for job, sample_rows in jobs.items():
+                        pool.submit(("trial", *job), trial, job[1], sample_rows)
+                    if not jobs:
+                        trials_done(name)
+                if len(pool) >= workers * 16:
+                    break
+            done = pool.wait()
+            for (kind, *key), result, failure in done:
+                if kind == "trial":
+                    entry = trials[key[0]]
+                    entry[1] -= 1
+                    entry[2][tuple(key)] = result if failure is None else (0, 0, 0)
+                    if not entry[1]:
+                        trials_done(key[0])
+                else:
+                    results[key[0]] = result if failure is None else (None, failure.error())
+            while emitted in results:
+                yield pending.pop(emitted), results.pop(emitted)
+                emitted += 1
+            if not done:
+                return
+
+def convert_rows(printer, rows, writer=None, timeout=ROW_TIMEOUT, workers=None):
+    """
+    Encode and print `rows`, (brand, csv_file, function_name, protocol,
+    device, sub_device, function, keys) tuples, yielding (row, converted).
+    Rows running over `timeout` seconds (or whose worker died) are retried
+    after the others with RETRY_FACTOR times the limit. With `workers`,
+    rows run in that many processes, so a row that hangs or kills its
+    process fails on its own.
+    """
+    retry = []
+    for row, (rlc, err_msg) in _encoded(rows, timeout, workers):
+        if timeout and rlc is None and (err_msg or "").startswith(RETRY_ERRORS):
+            retry.append(row)
+            continue
+        yield row, print_row(printer, row, rlc, err_msg, writer)
+    if retry:
+        print(f"Retrying {len(retry)} rows that took longer than {timeout}s or crashed...", file=sys.stderr)
+        for row, (rlc, err_msg) in _encoded(retry, timeout * RETRY_FACTOR, workers):
+            yield row, print_row(printer, row, rlc, err_msg, writer)
+
+def process_input(brand, base_dir, manual_protocol=None, writer=None, timeout=ROW_TIMEOUT, workers=None):
+    """
+    Convert grep-style `path:row` lines from stdin. Successful keys are
+    printed as text blocks, or written to `writer` (a RawRecordWriter)
+    when one is given; errors are always printed.
+    """
+    printer = BlockPrinter()
+    brand_dir = os.path.join(base_dir, brand)
+
+    def rows():
+        for line in sys.stdin:
+            line = line.strip()
+            if not line or ':' not in line:
+                continue
+
+            filepath, command = line.split(":", 1)
+            parts = command.split(",")
+            if len(parts) != 5:
+                printer([f"[ERROR] Invalid format: {command}"])
+                continue
+
+            function_name, raw_proto, device, sub_device, function = parts
+            proto_name = manual_protocol if manual_protocol else sanitize_protocol_name(raw_proto)
+            yield (brand, os.path.relpath(filepath, brand_dir), function_name, proto_name,
+                   device, sub_device, function, ())
+
+    for _ in convert_rows(printer, rows(), writer, timeout, workers):
+        pass
+
+def search_and_convert(base_dir, matcher, brands=None, manual_protocol=None, writer=None,
+                       timeout=ROW_TIMEOUT, workers=None):
+    """
+    Convert every row of `brands` (default: all) whose function name
+    matches one of the keys in `matcher`, in a single pass over the IRDB
+    index. Returns {key: (hits, converted)}.
+    """
+    printer = BlockPrinter()
+    stats = {name: [0, 0] for name in matcher.keys}
+
+    def rows():
+        for keys, (brand, csv_file, function_name, raw_proto, device, sub_device, function) in \
+                instrument.timed_iter("search", search_rows(IRDBIndex(base_dir).rows(brands), matcher)):
+            proto_name = manual_protocol if manual_protocol else sanitize_protocol_name(raw_proto)
+            yield brand, csv_file, function_name, proto_name, device, sub_device, function, keys
+
+    for row, ok in convert_rows(printer, rows(), writer, timeout, workers):
+        for name in row[-1]:
+            stats[name][0] += 1
+            stats[name][1] += ok
+    return {name: tuple(counts) for name, counts in stats.items()}
+
+def run_search(args, base_dir):
+    """Non-interactive -k mode: search, convert, then report hits per key on stderr."""
+    brands = args.brand
+    if brands:
+        missing = [b for b in brands if not os.path.isdir(os.path.join(base_dir, b))]
+        if missing:
+            print(f"[ERROR] Brand folder(s) not found: {', '.join(missing)}", file=sys.stderr)
+            sys.exit(1)
+    matcher = KeyMatcher(args.key, args.aliases, args.exact)
+    with instrument.profiled(args.profile, args.profile_out):
+        if args.format == "binary":
+            with open(args.output, "wb") as out:
+                writer = RawRecordWriter(out)
+                stats = search_and_convert(base_dir, matcher, brands, args.protocol, writer,
+                                           args.timeout, args.workers)
+        else:
+            stats = search_and_convert(base_dir, matcher, brands, args.protocol,
+                                       timeout=args.timeout, workers=args.workers)
+
+    print("", file=sys.stderr)
+    for name, (hits, converted) in stats.items():
+        note = "" if hits else "  (no matching function names)"
+        print(f"{name:<20}{hits:>6} rows{converted:>6} converted{note}", file=sys.stderr)
+    if args.format == "binary":
+        print(f"Wrote {writer.count} records to {args.output}", file=sys.stderr)
+        print(f"Convert them with: 4_bulk_raw_to_tuya.py --format binary {args.output}", file=sys.stderr)
 
 def main():
+    parser = argparse.ArgumentParser(description="Search an IRDB brand for a key and convert it to raw timings.")
+    parser.add_argument("--format", choices=("text", "binary"), default="text",
+                        help="text blocks for 4_bulk_raw_to_tuya.py, or the compact binary raw format")
+    parser.add_argument("-o", "--output", help="file for --format binary output")
+    parser.add_argument("-t", "--timeout", type=float, default=ROW_TIMEOUT,
+                        help="seconds one row may take before it is retried at the end "
+                             f"(default {ROW_TIMEOUT}, 0 = none)")
+    parser.add_argument("-j", "--workers", type=int,
+                        help="encode rows in this many worker processes, isolating rows that hang or crash")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-stage timings and counters (JSON) to stderr after converting")
+    parser.add_argument("--profile-out", metavar="FILE", help="also write cProfile stats to FILE")
+    search = parser.add_argument_group("multi-key search (no prompts)")
+    search.add_argument("-k", "--key", action="append", default=[], metavar="KEY[=ALIAS,...]",
+                        help="key to search for, with optional aliases; repeat for more keys")
+    search.add_argument("--keys-file", metavar="FILE", help="file with one KEY[=ALIAS,...] per line")
+    search.add_argument("-b", "--brand", action="append", metavar="BRAND",
+                        help="brand to search; repeat for more (default: every downloaded brand)")
+    search.add_argument("--aliases", action="store_true",
+                        help="also match common spellings (power: PWR, KEY_POWER, ...; vol+: Volume Up, ...)")
+    search.add_argument("--exact", action="store_true",
+                        help="match whole function names instead of substrings")
+    search.add_argument("-p", "--protocol", help="manual protocol override for ALL keys")
+    args = parser.parse_args()
+    args.timeout = args.timeout or None
+    if args.format == "binary" and not args.output:
+        parser.error("--format binary needs --output FILE")
+    if args.keys_file:
+        try:
+            args.key += read_key_file(args.keys_file)
+        except OSError as err:
+            parser.error(str(err))
+
     home = os.path.expanduser("~")
     base_dir = os.path.join(home, "irdb_to_tuya", "IRDB", "irdb", "codes")
 
     if not os.path.isdir(base_dir) or not os.listdir(base_dir):
         print("You have not added any brands to your IRDB codes directory.")
         print('Please run "brands" first:\n')
-        print("""Usage:
-  brands get [Brand Name]   - Download IR codes for a brand
-  brands list               - List all brands in irdb database
-  brands list [Letter(s)]   - List brands by full or partial names - not case sensitive
-""")
+        print(BRANDS_USAGE)
+        return
+
+    # before any row runs under a row timeout, and before the workers start
+    check_native_encoders()
+
+    if args.key:
+        run_search(args, base_dir)
         return
 
     print("\nAvailable Brands:")
@@ -151,11 +303,7 @@ def main():
     if not brands:
         print("You have not added any brands to your IRDB codes directory.")
         print('Please run "brands" first:\n')
-        print("""Usage:
-  brands get [Brand Name]   - Download IR codes for a brand
-  brands list               - List all brands in irdb database
-  brands list [Letter(s)]   - List brands by full or partial names - not case sensitive
-""")
+        print(BRANDS_USAGE)
         return
 
     for b in brands:
@@ -164,9 +312,7 @@ def main():
     brand = input("\nEnter the brand folder name:\n> ").strip()
     key = input("\nEnter remote key name: ").strip()
 
-    cmd = ["grep", "-ri", "--include=*.csv", key, os.path.join(base_dir, brand)]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    lines_found = result.stdout.strip()
+    lines_found = "\n".join(IRDBIndex(base_dir).grep_lines(key, brand))
 
     if not lines_found:
         print(f"\n[ERROR] No lines found for '{key}' in '{brand}'. Exiting.")
@@ -194,7 +340,7 @@ def main():
     auto_list_str = ", ".join(protocols_in_grep) if protocols_in_grep else "(none)"
 
     print("\nHere are known valid protocols in pyIRDecoder:\n")
-    print_protocols_in_columns(STATIC_PROTOCOLS)
+    print_protocols_in_columns(known_protocols())
 
     print(f"\nUse automatic protocol(s) ({auto_list_str})? [Y/n]: ", end="")
     ans = input().strip().lower()
@@ -210,7 +356,15 @@ def main():
         manual_protocol = input("> ").strip()
 
     sys.stdin = io.StringIO(lines_found + "\n")
-    process_input(brand, base_dir, manual_protocol)
+    with instrument.profiled(args.profile, args.profile_out):
+        if args.format == "binary":
+            with open(args.output, "wb") as out:
+                writer = RawRecordWriter(out)
+                process_input(brand, base_dir, manual_protocol, writer, args.timeout, args.workers)
+            print(f"\nWrote {writer.count} records to {args.output}")
+            print(f"Convert them with: 4_bulk_raw_to_tuya.py --format binary {args.output}")
+        else:
+            process_input(brand, base_dir, manual_protocol, timeout=args.timeout, workers=args.workers)
 
 if __name__ == "__main__":
     main()
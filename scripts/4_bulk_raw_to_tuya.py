@@ -1,128 +1,185 @@
 #!/usr/bin/env python3
 
-import io
-import base64
 import sys
 import re
-from struct import pack
-
-def encode_ir(signal: list[int]) -> str:
+import argparse
+
+from tuya_codec import LEVELS, encode_ir, encode_payload
+import instrument
+from code_store import CodeStore
+from raw_records import open_records, iter_records
+from timing_normalize import DEFAULT_TOLERANCE, normalize_timings
+
+FIELD_PATTERN = re.compile(
+    r"^\s*(?P<label>Brand|CSV\s*File|Function|Protocol|Raw\s+Timing)\s*:\s*(?P<value>.*?)\s*$"
+)
+FIELD_NAMES = {"brand": "brand", "csvfile": "csv", "function": "function",
+               "protocol": "protocol", "rawtiming": "timings"}
+
+def _make_entry(fields):
+    if not all(k in fields for k in ("brand", "csv", "function", "timings")):
+        return None
+    try:
+        timings = [int(x) for x in re.split(r"[,\s]+", fields["timings"]) if x.strip()]
+    except ValueError:
+        return None
+    return fields["brand"], fields["csv"], fields["function"], fields.get("protocol", ""), timings
+
+def iter_entries(lines):
     """
-    Convert integer microsecond timings (clamped >65535) into a Tuya IR code string.
+    Incrementally parse the blocks printed by scripts 1 and 3, yielding
+    (brand, csv_file, function, protocol, timings) as soon as each '=====' block
+    closes (or a new block starts), so nothing is buffered beyond one entry.
     """
-    clamped = [min(t, 65535) for t in signal]
-    payload = b''.join(pack('<H', t) for t in clamped)
-    out = io.BytesIO()
-    compress(out, payload, level=2)
-    return base64.b64encode(out.getvalue()).decode('ascii')
+    fields = {}
+    timings_text = None
+    for line in lines:
+        if timings_text is not None:
+            # a Raw Timing list wrapped over several lines
+            timings_text += " " + line.strip()
+            if "]" in line:
+                fields["timings"] = timings_text.split("]", 1)[0]
+                timings_text = None
+            continue
 
-def compress(out: io.BytesIO, data: bytes, level=2):
-    """
-    Tuya's LZ-like compression used by many Tuya IR devices.
-    """
-    if level == 0:
-        emit_literal_blocks(out, data)
-        return
-
-    W = 2**13
-    L = 255 + 9
-
-    pos = 0
-    block_start = 0
-
-    def find_length_for_distance(start: int) -> int:
-        length = 0
-        limit = min(L, len(data) - pos)
-        while length < limit and data[pos + length] == data[start + length]:
-            length += 1
-        return length
-
-    def find_length_max():
-        candidates = (
-            (find_length_for_distance(pos - d), d)
-            for d in range(1, min(pos, W) + 1)
-        )
-        return max(candidates, key=lambda c: (c[0], -c[1]), default=None)
-
-    while pos < len(data):
-        match = find_length_max()
-        if match and match[0] >= 3:
-            emit_literal_blocks(out, data[block_start:pos])
-            emit_distance_block(out, match[0], match[1])
-            pos += match[0]
-            block_start = pos
-        else:
-            pos += 1
-
-    emit_literal_blocks(out, data[block_start:pos])
-
-def emit_literal_blocks(out: io.BytesIO, data: bytes):
-    for i in range(0, len(data), 32):
-        emit_literal_block(out, data[i:i+32])
-
-def emit_literal_block(out: io.BytesIO, data: bytes):
-    length = len(data) - 1
-    assert 0 <= length < (1 << 5)
-    out.write(bytes([length]))
-    out.write(data)
-
-def emit_distance_block(out: io.BytesIO, length: int, distance: int):
-    distance -= 1
-    length -= 2
-    block = bytearray()
-    if length >= 7:
-        block.append(length - 7)
-        length = 7
-    block.insert(0, (length << 5) | (distance >> 8))
-    block.append(distance & 0xFF)
-    out.write(block)
-
-def extract_entries(text: str):
-    pattern = re.compile(
-        r"Brand\s*:\s*(?P<brand>[^\r\n]+)\r?\n"
-        r"CSV\s*File\s*:\s*(?P<csv>[^\r\n]+)\r?\n"
-        r"Function\s*:\s*(?P<function>[^\r\n]+)\r?\n"
-        r"Protocol\s*:\s*[^\r\n]+\r?\n"
-        r"Raw\s+Timing\s*:\s*\[(?P<timings>[0-9,\s]+)\]",
-        flags=re.MULTILINE
-    )
-
-    results = []
-    for match in pattern.finditer(text):
-        brand = match.group("brand").strip()
-        csv_file = match.group("csv").strip()
-        function = match.group("function").strip()
-        timings_str = match.group("timings")
-
-        try:
-            timings = [int(x) for x in re.split(r"[,\s]+", timings_str) if x.strip()]
-        except ValueError:
+        stripped = line.strip()
+        if stripped and not stripped.strip("="):
+            entry = _make_entry(fields)
+            fields = {}
+            if entry:
+                yield entry
             continue
 
-        results.append((brand, csv_file, function, timings))
-    return results
+        match = FIELD_PATTERN.match(line)
+        if not match:
+            continue
+        name = FIELD_NAMES[re.sub(r"\s+", "", match.group("label")).lower()]
+        value = match.group("value")
+
+        if name == "brand" and "timings" in fields:
+            entry = _make_entry(fields)
+            fields = {}
+            if entry:
+                yield entry
+
+        if name == "timings":
+            value = value.lstrip("[")
+            if "]" in value:
+                fields["timings"] = value.split("]", 1)[0]
+            else:
+                timings_text = value
+        else:
+            fields[name] = value
 
-if __name__ == "__main__":
-    print("\nPaste your formatted IR data below, beginning with and ending with '=' per decimal section.")
-    print("Press CTRL+D twice when done. (CTRL+Z on Windows)\n")
+    entry = _make_entry(fields)
+    if entry:
+        yield entry
 
-    input_data = sys.stdin.read()
-    parsed = extract_entries(input_data)
+def print_code(brand, csv_file, function, code):
+    sep_line = "=" * 90
 
-    if not parsed:
-        print("No valid IR data found.")
-        sys.exit(1)
-
-    print("\n\n")
+    print(sep_line)
+    print(f"Brand                   : {brand}")
+    print(f"CSV File                : {csv_file}")
+    print(f"Function                : {function}")
+    print(f"Generated Tuya IR Code  : {code}")
+    print(sep_line, "\n", flush=True)
 
-    for brand, csv_file, function, timings in parsed:
-        code = encode_ir(timings)
+def iter_codes(source, fmt, normalize=None, level=2):
+    """
+    Yield (brand, csv_file, function, code) from a text dump or a binary raw
+    file, snapping the timings to canonical values first if `normalize`
+    (a tolerance) is given.
+    """
+    if fmt == "binary":
+        records = open_records(source) if isinstance(source, str) else iter_records(source.buffer.read())
+        for record in instrument.timed_iter("parse", records):
+            if normalize is not None:
+                code = encode_ir(normalize_timings(record.timings, normalize), level)
+            else:
+                # timings are already packed; compress them straight out of the mmap
+                code = encode_payload(record.payload, level)
+            yield record.brand, record.csv_file, record.function, code
+    else:
+        for brand, csv_file, function, _, timings in instrument.timed_iter("parse", iter_entries(source)):
+            if normalize is not None:
+                timings = normalize_timings(timings, normalize)
+            yield brand, csv_file, function, encode_ir(timings, level)
+
+def build_store(source, fmt, normalize=None, level=2):
+    """Load a text dump or binary raw file into a CodeStore and encode every record."""
+    store = CodeStore()
+    if fmt == "binary":
+        records = open_records(source) if isinstance(source, str) else iter_records(source.buffer.read())
+        for record in instrument.timed_iter("parse", records):
+            if normalize is not None:
+                store.add(record.brand, record.csv_file, record.function, record.protocol,
+                          normalize_timings(record.timings, normalize))
+            else:
+                store.add_payload(record.brand, record.csv_file, record.function, record.protocol, record.payload)
+    else:
+        for brand, csv_file, function, protocol, timings in instrument.timed_iter("parse", iter_entries(source)):
+            if normalize is not None:
+                timings = normalize_timings(timings, normalize)
+            store.add(brand, csv_file, function, protocol, timings)
+    with instrument.timer("encode"):
+        store.encode(level)
+    return store
 
-        sep_line = "=" * 90
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert raw timing dumps to Tuya IR codes.")
+    parser.add_argument("file", nargs="?", help="dump from script 1/3 (default: paste on stdin)")
+    parser.add_argument("--format", choices=("text", "binary"), default="text",
+                        help="input format: text blocks or the binary raw format from script 3")
+    parser.add_argument("-n", "--normalize", type=float, nargs="?", const=DEFAULT_TOLERANCE,
+                        metavar="TOLERANCE",
+                        help="snap jittered timings to canonical values within TOLERANCE "
+                             f"(a fraction, default {DEFAULT_TOLERANCE}) before compressing")
+    parser.add_argument("-l", "--level", type=int, choices=LEVELS, default=2,
+                        help="Tuya compression level: 0 none, 1 fast, 2 default, "
+                             "3 lazy matching, 4 smallest (slowest)")
+    parser.add_argument("--store", metavar="FILE",
+                        help="also save timings and codes to a compact store (see code_store.py); "
+                             "reads the whole input before printing")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-stage timings and counters (JSON) to stderr at the end")
+    parser.add_argument("--profile-out", metavar="FILE", help="also write cProfile stats to FILE")
+    args = parser.parse_args()
+    if args.normalize is not None and not 0 <= args.normalize < 1:
+        parser.error("--normalize tolerance must be in [0, 1)")
+
+    if args.file:
+        source = args.file if args.format == "binary" else open(args.file)
+    else:
+        source = sys.stdin
+        if args.format == "text":
+            print("\nPaste your formatted IR data below, beginning with and ending with '=' per decimal section.")
+            print("Press CTRL+D twice when done. (CTRL+Z on Windows)\n")
+
+    found = False
+    try:
+        with instrument.profiled(args.profile, args.profile_out):
+            if args.store:
+                store = build_store(source, args.format, args.normalize, args.level)
+                codes = ((store.field("brand", i), store.field("csv_file", i), store.field("function", i),
+                          store.code(i) or "") for i in range(len(store)))
+            else:
+                codes = iter_codes(source, args.format, args.normalize, args.level)
+            for brand, csv_file, function, code in codes:
+                with instrument.timer("print"):
+                    if not found:
+                        print("\n\n")
+                        found = True
+                    print_code(brand, csv_file, function, code)
+            if args.store:
+                store.save(args.store)
+    except (OSError, ValueError) as err:
+        print(f"[ERROR] {err}")
+        sys.exit(1)
+    finally:
+        if args.file and args.format == "text":
+            source.close()
 
-        print(sep_line)
-        print(f"Brand                   : {brand}")
-        print(f"CSV File                : {csv_file}")
-        print(f"Function                : {function}")
-        print(f"Generated Tuya IR Code  : {code}")
-        print(sep_line, "\n")
+    if not found:
+        print("No valid IR data found.")
+        sys.exit(1)
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Non-interactive IRDB to Tuya conversion in a single pass.
+
+Walks one or more brands (or the whole codes tree), encodes every CSV row
+with pyIRDecoder and compresses it to a Tuya code, spreading the CSV files
+across all cores. Records are written as JSONL or CSV as soon as each file
+finishes; progress and throughput go to stderr.
+
+Files run on a WorkerPool: each row has a time limit, rows that hit it
+are retried once the other files are done, and a file whose worker hangs
+or dies is split into one task per row on fresh workers, so only the rows
+at fault fail. What still fails can be written to an error
+report.
+
+Protocol names pyIRDecoder does not know are sent back by the workers
+with a few sample rows. Their alias candidates are tried on the same
+pool, and the waiting rows are converted again once a name is resolved.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from irdb_common import (
+    IRDB_PATH, BRANDS_USAGE, ENCODE_CACHE, CODE_CACHE_PATH, PROTOCOLS, PROTOCOL_ALIASES,
+    check_native_encoders, sanitize_protocol_name, generate_raw_signal, get_available_brands, get_csv_files, read_csv_rows,
+)
+import instrument
+from code_store import CodeStore
+from protocol_aliases import SAMPLE_ROWS, trial
+from protocol_registry import pyirdecoder_fingerprint
+from sync_manifest import SYNC_MANIFEST_PATH, SyncManifest
+from timing_normalize import DEFAULT_TOLERANCE, VERSION as NORMALIZE_VERSION, normalize_timings
+from tuya_codec import CODE_CACHE, ENCODER_VERSION, LEVELS, encode_ir_batch
+from worker_pool import (
+    RETRY_ERRORS, RETRY_FACTOR, ROW_TIMEOUT, TIMEOUT_ERROR, RowTimeout, WorkerPool, row_timeout,
+)
+
+FIELDS = ["brand", "csv_file", "function", "protocol", "device", "subdevice",
+          "function_code", "raw", "tuya", "error"]
+
+CACHE_COUNTERS = ("hits", "disk_hits", "misses")
+CACHES = {"encode": ENCODE_CACHE, "tuya": CODE_CACHE}
+
+FILE_TIMEOUT = 600      # seconds before a worker stuck on one file is killed
+
+def cache_counters():
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+def convert_csv(base_dir, brand, csv_file, level=2, manual_protocol=None, disk_cache=True,
+                normalize=None, profile=False, profile_out=None, timeout=None, rows=None,
+                defer_aliases=False):
+    """
+    Convert every row of one CSV file (or only the row numbers in `rows`),
+    giving each row at most `timeout` seconds. Runs inside a worker process
+    and returns the records, the cache counters it added, with `profile`
+    its instrumentation snapshot, and the protocols deferred to the parent.
+
+    With `defer_aliases`, rows whose protocol is unknown and has no cached
+    alias are not resolved here: they get a "not found" record and their
+    protocol is returned as {name: sample rows} for the parent to resolve.
+    """
+    if profile:
+        instrument.enable()
+        instrument.reset()
+    with instrument.worker_profile(profile_out):
+        records, cache_delta, deferred = _convert_csv(base_dir, brand, csv_file, level, manual_protocol,
+                                                      disk_cache, normalize, timeout, rows, defer_aliases)
+    return records, cache_delta, instrument.snapshot() if profile else None, deferred
+
+def row_record(brand, csv_file, row, proto_name, rlc=None, err_msg=None):
+    return {
+        "brand": brand,
+        "csv_file": csv_file,
+        "function": row.get('functionname', 'Unnamed'),
+        "protocol": proto_name,
+        "device": row.get('device', '0'),
+        "subdevice": row.get('subdevice', '-1'),
+        "function_code": row.get('function', '0'),
+        "raw": rlc,
+        "tuya": None,
+        "error": err_msg,
+    }
+
+def row_protocol(row, manual_protocol):
+    return manual_protocol if manual_protocol else sanitize_protocol_name(row.get('protocol', ''))
+
+def not_found_error(proto_name):
+    return f"[ERROR] Protocol '{proto_name}' not found in pyIRDecoder.protocols."
+
+def _convert_csv(base_dir, brand, csv_file, level, manual_protocol, disk_cache, normalize,
+                 timeout=None, rows=None, defer_aliases=False):
+    if not disk_cache:
+        ENCODE_CACHE.path = None
+    elif CODE_CACHE.path is None:
+        CODE_CACHE.path = CODE_CACHE_PATH
+    before = cache_counters()
+    records = []
+    deferred = {}
+    unknown = {}    # protocol -> whether this worker has to leave it to the parent
+    try:
+        wanted = None if rows is None else set(rows)
+        csv_rows = read_csv_rows(os.path.join(base_dir, brand, csv_file))
+        for i, row in enumerate(instrument.timed_iter("read_csv", csv_rows)):
+            if wanted is not None and i not in wanted:
+                continue
+            proto_name = row_protocol(row, manual_protocol)
+            device_str = row.get('device', '0')
+            subdev_str = row.get('subdevice', '-1')
+            func_str = row.get('function', '0')
+
+            if defer_aliases and not PROTOCOLS.entry(proto_name):
+                if proto_name not in unknown:
+                    unknown[proto_name] = PROTOCOL_ALIASES.cached(proto_name) is False
+                if unknown[proto_name]:
+                    samples = deferred.setdefault(proto_name, [])
+                    if len(samples) < SAMPLE_ROWS:
+                        samples.append((device_str, subdev_str, func_str))
+                    records.append(row_record(brand, csv_file, row, proto_name, err_msg=not_found_error(proto_name)))
+                    continue
+
+            try:
+                with row_timeout(timeout):
+                    rlc, err_msg = generate_raw_signal(proto_name, device_str, subdev_str, func_str)
+            except RowTimeout:
+                instrument.count("row_timeouts")
+                rlc, err_msg = None, f"{TIMEOUT_ERROR} row took longer than {timeout}s"
+            if rlc is not None and normalize is not None:
+                with instrument.timer("normalize"):
+                    rlc = normalize_timings(rlc, normalize)
+            records.append(row_record(brand, csv_file, row, proto_name, rlc, err_msg))
+        # compress the whole file as one packed batch
+        encoded = [r for r in records if r["raw"] is not None]
+        for record, code in zip(encoded, encode_ir_batch([r["raw"] for r in encoded], level)):
+            record["tuya"] = code
+    except Exception as exc:
+        records.append(dict.fromkeys(FIELDS, None) | {
+            "brand": brand, "csv_file": csv_file, "error": f"[ERROR] {exc}",
+        })
+    # worker processes exit without running atexit hooks
+    for cache in CACHES.values():
+        cache.flush()
+    after = cache_counters()
+    return records, {
+        cache: {name: after[cache][name] - before[cache][name] for name in CACHE_COUNTERS}
+        for cache in CACHES
+    }, deferred
+
+def alias_trial(candidate, rows, timeout=None):
+    """`trial()` of an alias candidate on sample rows, each row getting at most `timeout` seconds."""
+    with row_timeout(timeout and timeout * len(rows)):
+        return trial(candidate, rows)
+
+def iter_tasks(base_dir, brands):
+    for brand in brands:
+        for csv_file in sorted(get_csv_files(os.path.join(base_dir, brand))):
+            yield brand, csv_file
+
+class RecordWriter:
+    def __init__(self, out, fmt, store=None):
+        self.out = out
+        self.fmt = fmt
+        self.store = store
+        if fmt == "csv":
+            self.csv = csv.DictWriter(out, fieldnames=FIELDS)
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.fmt == "csv":
+            raw = record["raw"]
+            self.csv.writerow(record | {"raw": " ".join(map(str, raw)) if raw is not None else ""})
+        else:
+            self.out.write(json.dumps(record) + "\n")
+        if self.store is not None:
+            self.store.add_record(record)
+
+class Progress:
+    def __init__(self, total_files, stream=sys.stderr, interval=0.5):
+        self.total_files = total_files
+        self.stream = stream
+        self.interval = interval
+        self.files = self.rows = self.errors = 0
+        self.cache = {cache: dict.fromkeys(CACHE_COUNTERS, 0) for cache in CACHES}
+        self.start = self.last = time.perf_counter()
+        self.width = 0
+
+    def add_cache(self, cache_delta):
+        for cache, counters in cache_delta.items():
+            for name, count in counters.items():
+                self.cache[cache][name] += count
+
+    def update(self, records, cache_delta):
+        self.add_cache(cache_delta)
+        self.files += 1
+        self.rows += len(records)
+        self.errors += sum(1 for r in records if r["error"])
+        now = time.perf_counter()
+        if now - self.last >= self.interval or self.files == self.total_files:
+            self.last = now
+            line = self.line()
+            self.width = len(line)
+            self.stream.write(f"\r{line}")
+            self.stream.flush()
+
+    def note(self, text):
+        """Write `text` on a line of its own, over the progress line."""
+        self.stream.write(f"\r{text:<{self.width}}\n")
+        self.stream.flush()
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (f"[{self.files}/{self.total_files} files] {self.rows} rows, "
+                f"{self.errors} errors, {self.rows / elapsed:.1f} rows/s, "
+                f"{self.files / elapsed:.1f} files/s")
+
+    @staticmethod
+    def hit_ratio(counters):
+        lookups = sum(counters.values())
+        return (counters["hits"] + counters["disk_hits"]) / lookups if lookups else 0.0
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        self.stream.write(f"\r{self.line()}\n")
+        encode = self.cache["encode"]
+        self.stream.write(f"Encode cache: {encode['hits']} hits, {encode['disk_hits']} disk hits, "
+                          f"{encode['misses']} misses ({self.hit_ratio(encode):.1%} hit ratio)\n")
+        tuya = self.cache["tuya"]
+        lookups = sum(tuya.values())
+        # a payload is first seen in this run either as a miss or as a hit in the disk cache
+        distinct = tuya["misses"] + tuya["disk_hits"]
+        dedup = lookups / max(distinct, 1)
+        self.stream.write(f"Tuya codes: {lookups} signals, {distinct} distinct, dedup ratio {dedup:.2f}x; "
+                          f"{tuya['misses']} compressed, {tuya['disk_hits']} from the disk cache "
+                          f"({self.hit_ratio(tuya):.1%} hit ratio)\n")
+        self.stream.write(f"Done in {elapsed:.2f}s.\n")
+
+def file_failure(brand, csv_file, failure):
+    """The single record standing for a file whose task failed in the pool and whose rows cannot be read."""
+    return dict.fromkeys(FIELDS, None) | {"brand": brand, "csv_file": csv_file, "error": failure.error()}
+
+def split_file(base_dir, brand, csv_file, manual_protocol, failure):
+    """
+    One record per row of a file whose task failed, each carrying the
+    failure until its row is converted again on its own. None if the
+    file cannot be read or has no rows.
+    """
+    try:
+        rows = list(read_csv_rows(os.path.join(base_dir, brand, csv_file)))
+    except Exception:
+        return None
+    return [row_record(brand, csv_file, row, row_protocol(row, manual_protocol), err_msg=failure.error())
+            for row in rows] or None
+
+def write_error_report(path, records, recycled):
+    """Failed rows and files as JSON, grouped by error kind."""
+    failed = [r for r in records if r["error"]]
+    kinds = {}
+    for record in failed:
+        kind = record["error"].split("]", 1)[0].lstrip("[")
+        kinds[kind] = kinds.get(kind, 0) + 1
+    report = {"failures": len(failed), "by_kind": kinds, "workers_recycled": recycled,
+              "files": [r for r in failed if r["function"] is None],
+              "rows": [{k: v for k, v in r.items() if k not in ("raw", "tuya")}
+                       for r in failed if r["function"] is not None]}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+
+def run(base_dir, brands, out, fmt="jsonl", workers=None, level=2, manual_protocol=None,
+        disk_cache=True, normalize=None, profile_out=None, sync=None, all_brands=False,
+        timeout=ROW_TIMEOUT, max_tasks=None, max_memory=None, error_report=None, store=None):
+    """
+    Convert `brands` and write their records to `out`. With a SyncManifest
+    as `sync`, only added or changed CSV files are converted; the output is
+    then written in full from the manifest, without the files that are gone.
+    Rows that time out are retried with RETRY_FACTOR times the `timeout`
+    after the other files, and a file whose task fails is retried row by
+    row; failed rows and files go to `error_report`. Records with a code
+    are also added to `store` (a CodeStore) if one is given.
+    """
+    writer = RecordWriter(out, fmt, store)
+    if sync is not None:
+        tasks, unchanged, stale = sync.plan(brands, all_brands)
+        sync.drop(stale)
+        sys.stderr.write(f"Sync: {len(tasks)} new or changed CSV files, {unchanged} unchanged, "
+                         f"{len(stale)} removed.\n")
+    else:
+        tasks = list(iter_tasks(base_dir, brands))
+    progress = Progress(len(tasks))
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 4
+    failures = []
+    retried = 0
+
+    def finish(brand, csv_file, records):
+        nonlocal retried
+        failures.extend(r for r in records if r["error"])
+        if sync is not None:
+            # a file that failed as a whole, or has rows that timed out or crashed, is stored
+            # for this run's output but converted again on the next sync
+            retry = any(r["function"] is None or (r["error"] or "").startswith(RETRY_ERRORS) for r in records)
+            sync.store(brand, csv_file, records, retry)
+            retried += retry
+        else:
+            with instrument.timer("write"):
+                for record in records:
+                    writer.write(record)
+
+    # Keep a bounded number of files in flight so results stream out in
+    # completion order without queueing the whole tree up front.
+    held = {}       # (brand, csv_file) -> [records, rows still being retried or waiting for an alias]
+    trials = {}     # protocol -> [sample rows, trials still running, scores, rows waiting for it]
+
+    def submit_rows(brand, csv_file, rows, row_timeout):
+        for i in rows:
+            # each on its own, so one hanging row cannot use up the others' time
+            pool.submit(("file", brand, csv_file, i), convert_csv, base_dir, brand, csv_file,
+                        level, manual_protocol, disk_cache, normalize,
+                        instrument.ENABLED, profile_out, row_timeout, (i,))
+
+    def rows_settled(brand, csv_file, count=1):
+        waiting = held[brand, csv_file]
+        waiting[1] -= count
+        if not waiting[1]:
+            records = held.pop((brand, csv_file))[0]
+            finish(brand, csv_file, records)
+            progress.update(records, {})
+
+    def alias_settled(name, result, rows):
+        if result:
+            for brand, csv_file, i in rows:
+                submit_rows(brand, csv_file, (i,), timeout)
+        else:
+            # the rows keep their "not found" records
+            for brand, csv_file, i in rows:
+                rows_settled(brand, csv_file)
+
+    def wait_for_alias(name, samples, rows):
+        result = PROTOCOL_ALIASES.aliases().get(name, False)
+        if result is not False:
+            alias_settled(name, result, rows)
+        elif name in trials:
+            trials[name][3].extend(rows)
+        else:
+            jobs = PROTOCOL_ALIASES.trial_jobs({name: samples})
+            trials[name] = [samples, len(jobs), {}, list(rows)]
+            for (_, candidate), sample_rows in jobs.items():
+                pool.submit(("alias", name, candidate), alias_trial, candidate, sample_rows, timeout)
+            if not jobs:
+                trial_done(name)
+
+    def trial_done(name, candidate=None, score=None):
+        entry = trials[name]
+        if candidate is not None:
+            entry[1] -= 1
+            entry[2][name, candidate] = score
+        if entry[1]:
+            return
+        samples, _, scores, rows = trials.pop(name)
+        with instrument.timer("protocol_alias"):
+            result = PROTOCOL_ALIASES.choose({name: samples}, scores)[name]
+        if result:
+            state = "" if result["verified"] else " (not verified by decoding)"
+            progress.note(f"Protocol {name!r} -> {result['protocol']}{state}")
+        else:
+            progress.note(f"Protocol {name!r}: no pyIRDecoder match")
+        alias_settled(name, result, rows)
+
+    def file_done(brand, csv_file, row, result, failure):
+        if failure is None:
+            records, cache_delta, stats, deferred = result
+            if stats:
+                instrument.merge(stats)
+            progress.add_cache(cache_delta)
+        elif row is None:
+            # convert the rows one by one, so only those at fault fail
+            records = split_file(base_dir, brand, csv_file, manual_protocol, failure)
+            if records is None:
+                records = [file_failure(brand, csv_file, failure)]
+                finish(brand, csv_file, records)
+                progress.update(records, {})
+                return
+            held[brand, csv_file] = [records, len(records)]
+            submit_rows(brand, csv_file, range(len(records)), timeout)
+            return
+
+        if row is not None:
+            # a retried row
+            record = held[brand, csv_file][0][row]
+            if failure is not None:
+                record["error"] = failure.error()
+            elif records:
+                held[brand, csv_file][0][row] = records[0]
+            rows_settled(brand, csv_file)
+            return
+        timed_out = []
+        if failure is None and timeout:
+            timed_out = [i for i, r in enumerate(records) if (r["error"] or "").startswith(TIMEOUT_ERROR)]
+        waiting = {name: [i for i, r in enumerate(records) if r["protocol"] == name] for name in deferred}
+        if not timed_out and not waiting:
+            finish(brand, csv_file, records)
+            progress.update(records, {})
+            return
+        held[brand, csv_file] = [records, len(timed_out) + sum(map(len, waiting.values()))]
+        submit_rows(brand, csv_file, timed_out, timeout * RETRY_FACTOR)
+        for name, rows in waiting.items():
+            wait_for_alias(name, deferred[name], [(brand, csv_file, i) for i in rows])
+
+    task_iter = iter(tasks)
+    with WorkerPool(workers, FILE_TIMEOUT, max_tasks, max_memory) as pool:
+        while True:
+            for brand, csv_file in task_iter:
+                # no pool retry: a failed file is retried row by row instead
+                pool.submit(("file", brand, csv_file, None), convert_csv, base_dir, brand, csv_file,
+                            level, manual_protocol, disk_cache, normalize,
+                            instrument.ENABLED, profile_out, timeout, None, True, retries=0)
+                if len(pool) >= max_in_flight:
+                    break
+            done = pool.wait()
+            if not done:
+                break
+            for (kind, *key), result, failure in done:
+                if kind == "alias":
+                    trial_done(*key, result if failure is None else (0, 0, 0))
+                else:
+                    file_done(*key, result, failure)
+        recycled = pool.recycled
+    if sync is not None:
+        sync.commit()
+        with instrument.timer("write"):
+            for record in sync.iter_records(brands):
+                writer.write(record)
+    progress.finish()
+    if failures or recycled:
+        sys.stderr.write(f"{len(failures)} failed rows or files, {recycled} workers recycled.\n")
+    if retried:
+        sys.stderr.write(f"Sync: {retried} CSV files with timed-out or crashed rows will be converted again next time.\n")
+    if error_report:
+        write_error_report(error_report, failures, recycled)
+    return progress
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert IRDB brands straight to Tuya IR codes.")
+    parser.add_argument("brands", nargs="*", help="brand folder names (default: every downloaded brand)")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("-f", "--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("-l", "--level", type=int, choices=LEVELS, default=2,
+                        help="Tuya compression level (default 2, 4 is smallest)")
+    parser.add_argument("-p", "--protocol", help="manual protocol override for ALL keys")
+    parser.add_argument("-n", "--normalize", type=float, nargs="?", const=DEFAULT_TOLERANCE,
+                        metavar="TOLERANCE",
+                        help="snap jittered timings to canonical values within TOLERANCE "
+                             f"(a fraction, default {DEFAULT_TOLERANCE}) before compressing")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-stage timings and counters (JSON) to stderr at the end")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="also write cProfile stats of the workers to FILE")
+    parser.add_argument("--sync", nargs="?", const=SYNC_MANIFEST_PATH, metavar="MANIFEST",
+                        help="only reconvert CSV files added or changed since the last sync, reusing "
+                             f"the rest from MANIFEST (default {SYNC_MANIFEST_PATH})")
+    parser.add_argument("-t", "--timeout", type=float, default=ROW_TIMEOUT,
+                        help=f"seconds one row may take before it is retried later (default {ROW_TIMEOUT}, 0 = none)")
+    parser.add_argument("--max-tasks", type=int, metavar="N",
+                        help="replace each worker process after N CSV files")
+    parser.add_argument("--max-memory", type=float, metavar="MB",
+                        help="replace a worker process once its peak memory passes MB")
+    parser.add_argument("--error-report", metavar="FILE",
+                        help="write the rows and files that failed (after retries) to FILE as JSON")
+    parser.add_argument("--store", metavar="FILE",
+                        help="also save the converted codes to a compact store (see code_store.py)")
+    parser.add_argument("--irdb", default=IRDB_PATH, help="IRDB codes directory")
+    parser.add_argument("--no-disk-cache", action="store_true",
+                        help="do not read or write the persistent encode and Tuya code caches")
+    args = parser.parse_args()
+    if args.normalize is not None and not 0 <= args.normalize < 1:
+        parser.error("--normalize tolerance must be in [0, 1)")
+
+    if not os.path.isdir(args.irdb) or not get_available_brands(args.irdb):
+        print("You have not added any brands to your IRDB codes directory.", file=sys.stderr)
+        print('Please run "brands" first:\n', file=sys.stderr)
+        print(BRANDS_USAGE, file=sys.stderr)
+        sys.exit(1)
+
+    brands = args.brands or sorted(get_available_brands(args.irdb))
+    for brand in brands:
+        if not os.path.isdir(os.path.join(args.irdb, brand)):
+            print(f"[ERROR] Invalid brand folder: {brand}", file=sys.stderr)
+            sys.exit(1)
+
+    # build the protocol manifest and check the native encoders once here rather than in every worker
+    PROTOCOLS.manifest()
+    check_native_encoders()
+
+    sync = None
+    if args.sync:
+        sync = SyncManifest(args.irdb, {
+            "level": args.level, "protocol": args.protocol, "normalize": args.normalize,
+            "encoder": ENCODER_VERSION, "pyirdecoder": pyirdecoder_fingerprint(),
+            **({"normalizer": NORMALIZE_VERSION} if args.normalize is not None else {}),
+        }, args.sync)
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    store = CodeStore() if args.store else None
+    try:
+        with instrument.profiled(args.profile, args.profile_out):
+            run(args.irdb, brands, out, args.format, args.workers, args.level, args.protocol,
+                disk_cache=not args.no_disk_cache, normalize=args.normalize,
+                profile_out=args.profile_out, sync=sync, all_brands=not args.brands,
+                timeout=args.timeout or None, max_tasks=args.max_tasks, max_memory=args.max_memory,
+                error_report=args.error_report, store=store)
+        if store is not None:
+            store.save(args.store)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if sync is not None:
+            sync.close()
+
+if __name__ == "__main__":
+    main()
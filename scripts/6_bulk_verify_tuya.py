@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Audit a library of stored Tuya IR codes without any prompts.
+
+Streams codes from files or stdin and decodes them across all cores. Each
+code is re-encoded, and the result is decoded again to check the round
+trip. Input lines may be bare codes, JSONL records from
+5_batch_irdb_to_tuya.py (the "tuya" field) or the text blocks printed by
+4_bulk_raw_to_tuya.py. Code store files (see code_store.py) are read as
+a whole.
+
+Every code gets one status:
+  ok          re-encoding gives the same code
+  equivalent  same timings, but this encoder packs them differently
+  mismatch    the re-encoded code decodes to different timings
+  error       the code is malformed (see "reason")
+
+Problem codes (or every code with --all) are written as JSONL to -o; the
+summary with counts and throughput goes to stderr and, with --summary, to
+a JSON file.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+from code_store import CodeStore, is_store
+from tuya_codec import LEVELS, CodeCache, decode_ir, encode_ir, iter_decode_ir
+
+CHUNK_SIZE = 256
+TEXT_FIELDS = {"Brand": "brand", "CSV File": "csv_file", "Function": "function"}
+CODE_LABEL = "Generated Tuya IR Code"
+
+def iter_codes(lines, source="<stdin>"):
+    """
+    Yield (source, line_no, label, code) from bare codes, JSONL records or
+    script 4 text blocks. `label` holds brand/csv_file/function when known.
+    """
+    label = {}
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#") or not line.strip("="):
+            continue
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield source, line_no, {}, line
+                continue
+            if record.get("tuya"):
+                yield source, line_no, {k: record.get(k) for k in TEXT_FIELDS.values()}, record["tuya"]
+            continue
+        name, sep, value = line.partition(":")
+        name = " ".join(name.split())
+        if sep and name in TEXT_FIELDS:
+            if name == "Brand":
+                label = {}
+            label[TEXT_FIELDS[name]] = value.strip()
+        elif sep and name == CODE_LABEL:
+            yield source, line_no, label, value.strip()
+        elif not sep and " " not in line:
+            yield source, line_no, {}, line
+
+def verify_code(code, level=2, cache=None):
+    """Return (status, details) for one code; never raises for bad input."""
+    return verify_decoded(*next(iter_decode_ir([code])), level, cache)
+
+def verify_decoded(code, timings, err, level=2, cache=None):
+    """verify_code() for a (code, timings, error) result of iter_decode_ir()."""
+    if err is not None:
+        return "error", {"reason": err.reason, "message": str(err), "offset": err.offset}
+    if not timings:
+        return "error", {"reason": "empty", "message": "code decodes to no timings", "offset": None}
+    recoded = encode_ir(timings, level, cache)
+    details = {"timings": len(timings), "code_length": len(code)}
+    if recoded == code:
+        return "ok", details
+    if decode_ir(recoded) != timings:
+        return "mismatch", details | {"recoded": recoded}
+    return "equivalent", details | {"recoded_length": len(recoded)}
+
+def verify_chunk(chunk, level=2):
+    """Verify a list of (source, line_no, label, code) in a worker process."""
+    # each code is compressed for real rather than served from the code cache
+    cache = CodeCache(maxsize=0)
+    decoded = iter_decode_ir(code for *_, code in chunk)
+    return [{"source": source, "line": line_no, **label, "code": code,
+             **dict(zip(("status", "details"), verify_decoded(code, timings, err, level, cache)))}
+            for (source, line_no, label, _), (code, timings, err) in zip(chunk, decoded)]
+
+def iter_chunks(items, size=CHUNK_SIZE):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+def iter_inputs(paths):
+    if not paths:
+        yield from iter_codes(sys.stdin)
+        return
+    for path in paths:
+        if is_store(path):
+            store = CodeStore.load(path)
+            for i, code in store.iter_codes():
+                yield path, i + 1, {k: store.field(k, i) for k in TEXT_FIELDS.values()}, code
+            continue
+        with open(path) as f:
+            yield from iter_codes(f, path)
+
+class Summary:
+    def __init__(self, stream=sys.stderr, interval=0.5):
+        self.stream = stream
+        self.interval = interval
+        self.status = Counter()
+        self.reasons = Counter()
+        self.timings = self.code_chars = 0
+        self.start = self.last = time.perf_counter()
+
+    @property
+    def total(self):
+        return sum(self.status.values())
+
+    def update(self, results):
+        for result in results:
+            self.status[result["status"]] += 1
+            details = result["details"]
+            if result["status"] == "error":
+                self.reasons[details["reason"]] += 1
+            else:
+                self.timings += details["timings"]
+                self.code_chars += details["code_length"]
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.stream.write(f"\r{self.line()}")
+            self.stream.flush()
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (f"{self.total} codes, {self.status['error']} malformed, "
+                f"{self.status['mismatch']} mismatches, {self.total / elapsed:.0f} codes/s")
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        decoded = self.total - self.status["error"]
+        return {
+            "codes": self.total,
+            "status": {name: self.status[name] for name in ("ok", "equivalent", "mismatch", "error")},
+            "errors": dict(self.reasons.most_common()),
+            "mean_timings": self.timings / decoded if decoded else 0.0,
+            "mean_code_length": self.code_chars / decoded if decoded else 0.0,
+            "elapsed_s": elapsed,
+            "codes_per_sec": self.total / elapsed if elapsed else 0.0,
+        }
+
+def run(inputs, out=None, workers=None, level=2, write_all=False):
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 4
+    summary = Summary()
+
+    pending = set()
+    chunks = iter_chunks(inputs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for chunk in chunks:
+                pending.add(pool.submit(verify_chunk, chunk, level))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                results = fut.result()
+                summary.update(results)
+                if out is not None:
+                    for result in results:
+                        if write_all or result["status"] in ("mismatch", "error"):
+                            out.write(json.dumps(result) + "\n")
+    summary.stream.write(f"\r{summary.line()}\n")
+    return summary.report()
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode and round-trip check stored Tuya IR codes.")
+    parser.add_argument("files", nargs="*", help="code files (default: stdin)")
+    parser.add_argument("-o", "--output", help="write problem codes as JSONL to this file")
+    parser.add_argument("--all", action="store_true", help="write every code to --output, not only problems")
+    parser.add_argument("--summary", help="also write the summary report as JSON to this file")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("-l", "--level", type=int, choices=LEVELS, default=2,
+                        help="compression level to re-encode with")
+    args = parser.parse_args()
+
+    out = open(args.output, "w") if args.output else None
+    try:
+        report = run(iter_inputs(args.files), out, args.workers, args.level, args.all)
+    except (OSError, ValueError) as err:
+        print(f"[ERROR] {err}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if out is not None:
+            out.close()
+
+    text = json.dumps(report, indent=2)
+    print(text, file=sys.stderr)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(text + "\n")
+    if report["status"]["mismatch"] or report["status"]["error"]:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory store for converted code sets.
+
+Records are kept column by column instead of as tuples and dicts: brand,
+CSV file, function and protocol are ids into one interned string table,
+all timings live in a single little-endian `array('H')` with an offsets
+index, and the Tuya codes are their compressed bytes in one buffer. That
+is two bytes per timing and a few bytes per code instead of a Python int
+or string each, and a whole-IRDB set is a handful of objects for the
+garbage collector.
+
+Stores can be saved to and loaded from a single file:
+
+  code_store.py import all_codes.jsonl -o irdb.store     - From script 5 JSONL or script 3 binary
+  code_store.py query irdb.store -b Sony -f Power        - Matching records as JSONL
+  code_store.py query irdb.store -p NEC --format codes   - Only the Tuya codes
+  code_store.py stats irdb.store
+
+5_batch_irdb_to_tuya.py and 4_bulk_raw_to_tuya.py can write a store with
+--store, and 6_bulk_verify_tuya.py and protocol_decode.py read one in
+place of a code file.
+"""
+
+import argparse
+import base64
+import binascii
+import json
+import struct
+import sys
+from array import array
+from typing import NamedTuple
+
+from raw_records import MAGIC as RAW_MAGIC, open_records
+from tuya_codec import decode_ir, encode_payload, numpy_module
+
+VERSION = 1
+MAGIC = b"IRSTORE" + bytes([VERSION])
+_HEADER = struct.Struct("<IIQQ")    # records, strings, timings, code bytes
+FIELDS = ("brand", "csv_file", "function", "protocol")
+
+
+class StoredRecord(NamedTuple):
+    brand: str
+    csv_file: str
+    function: str
+    protocol: str
+    timings: list
+    tuya: str
+
+
+def is_store(path):
+    """True if `path` is a code store file."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def _le(values):
+    """`values` (an array) in little-endian order."""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class CodeStore:
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.columns = {field: array('I') for field in FIELDS}
+        self.timing_offsets = array('Q', [0])
+        self.timings_le = array('H')        # little-endian, so slices are Tuya payloads as-is
+        self.code_offsets = array('Q', [0])
+        self.codes = bytearray()            # compressed Tuya payloads (the base64-decoded codes)
+
+    def __len__(self):
+        return len(self.columns["brand"])
+
+    def intern(self, text):
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    # --- adding records -----------------------------------------------------------
+
+    def add(self, brand, csv_file, function, protocol, timings=None, code=None):
+        """
+        Append one record. Give the timings, the Tuya code or both; a code
+        without timings is decoded. Returns the record index.
+        """
+        for field, value in zip(FIELDS, (brand, csv_file, function, protocol)):
+            self.columns[field].append(self.intern(value or ""))
+        if timings is None and code:
+            timings = decode_ir(code)
+        if timings:
+            values = array('H', [min(abs(t), 65535) for t in timings])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            self.timings_le += values
+        self.timing_offsets.append(len(self.timings_le))
+        if code:
+            self.codes += binascii.a2b_base64(code)
+        self.code_offsets.append(len(self.codes))
+        return len(self) - 1
+
+    def add_payload(self, brand, csv_file, function, protocol, payload):
+        """Append a record whose timings are already packed little-endian uint16 (a raw record payload)."""
+        for field, value in zip(FIELDS, (brand, csv_file, function, protocol)):
+            self.columns[field].append(self.intern(value or ""))
+        self.timings_le.frombytes(payload)
+        self.timing_offsets.append(len(self.timings_le))
+        self.code_offsets.append(len(self.codes))
+        return len(self) - 1
+
+    # --- reading records ----------------------------------------------------------
+
+    def field(self, field, i):
+        return self.strings[self.columns[field][i]]
+
+    def payload(self, i):
+        """The packed timings of record `i`, a view into the store."""
+        return memoryview(self.timings_le)[self.timing_offsets[i]:self.timing_offsets[i + 1]].cast('B')
+
+    def timings(self, i):
+        values = self.timings_le[self.timing_offsets[i]:self.timing_offsets[i + 1]]
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tolist()
+
+    def code(self, i):
+        """The Tuya code of record `i`, or None if it has not been encoded."""
+        start, end = self.code_offsets[i], self.code_offsets[i + 1]
+        if start == end:
+            return None
+        return base64.b64encode(self.codes[start:end]).decode('ascii')
+
+    def iter_codes(self, indexes=None):
+        """(index, Tuya code) of the records that have a code."""
+        for i in range(len(self)) if indexes is None else indexes:
+            code = self.code(i)
+            if code:
+                yield i, code
+
+    def record(self, i):
+        return StoredRecord(*(self.field(f, i) for f in FIELDS), self.timings(i), self.code(i))
+
+    def __iter__(self):
+        return (self.record(i) for i in range(len(self)))
+
+    # --- queries --------------------------------------------------------------------
+
+    def _ids(self, values, ignore_case):
+        values = {values} if isinstance(values, str) else set(values)
+        if ignore_case:
+            wanted = {v.casefold() for v in values}
+            return {i for i, s in enumerate(self.strings) if s.casefold() in wanted}
+        return {self.string_ids[v] for v in values if v in self.string_ids}
+
+    def select(self, brand=None, csv_file=None, function=None, protocol=None, ignore_case=False):
+        """
+        Indexes of the records matching every given field. Each field is a
+        string or a collection of strings (any of them matches).
+        """
+        wanted = {field: self._ids(values, ignore_case)
+                  for field, values in zip(FIELDS, (brand, csv_file, function, protocol)) if values is not None}
+        if any(not ids for ids in wanted.values()):
+            return []
+        np = numpy_module()
+        if np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            for field, ids in wanted.items():
+                column = np.frombuffer(self.columns[field], dtype=np.uint32) if len(self) else np.zeros(0, np.uint32)
+                mask &= np.isin(column, np.fromiter(ids, dtype=np.uint32))
+            return np.flatnonzero(mask).tolist()
+        indexes = range(len(self))
+        for field, ids in wanted.items():
+            column = self.columns[field]
+            indexes = [i for i in indexes if column[i] in ids]
+        return list(indexes)
+
+    # --- encode / export ------------------------------------------------------------
+
+    def encode(self, level=2, force=False):
+        """
+        Compress the timings of every record without a code (or of all
+        records with `force`) into its Tuya code. Returns how many were encoded.
+        """
+        codes = bytearray()
+        offsets = array('Q', [0])
+        encoded = 0
+        for i in range(len(self)):
+            start, end = self.code_offsets[i], self.code_offsets[i + 1]
+            if start == end or force:
+                if self.timing_offsets[i] != self.timing_offsets[i + 1]:
+                    codes += binascii.a2b_base64(encode_payload(self.payload(i), level))
+                    encoded += 1
+            else:
+                codes += self.codes[start:end]
+            offsets.append(len(codes))
+        self.codes, self.code_offsets = codes, offsets
+        return encoded
+
+    def iter_dicts(self, indexes=None):
+        """Records as the JSON objects of 5_batch_irdb_to_tuya.py (subset of its fields)."""
+        for i in range(len(self)) if indexes is None else indexes:
+            record = self.record(i)
+            yield {"brand": record.brand, "csv_file": record.csv_file, "function": record.function,
+                   "protocol": record.protocol, "raw": record.timings or None, "tuya": record.tuya}
+
+    # --- files ----------------------------------------------------------------------
+
+    def save(self, path):
+        text = [s.encode("utf-8") for s in self.strings]
+        string_offsets = array('I', [0])
+        for s in text:
+            string_offsets.append(string_offsets[-1] + len(s))
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(_HEADER.pack(len(self), len(self.strings), len(self.timings_le), len(self.codes)))
+            for values in (string_offsets, *self.columns.values(), self.timing_offsets, self.code_offsets):
+                f.write(_le(values).tobytes())
+            f.write(b"".join(text))
+            f.write(self.timings_le.tobytes())
+            f.write(self.codes)
+
+    @classmethod
+    def load(cls, path):
+        store = cls()
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a code store (bad magic or unsupported version)")
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError(f"{path} is truncated")
+            count, string_count, timing_count, code_bytes = _HEADER.unpack(header)
+
+            def read_array(typecode, n):
+                values = array(typecode)
+                values.frombytes(f.read(n * values.itemsize))
+                if len(values) != n:
+                    raise ValueError(f"{path} is truncated")
+                return _le(values)
+
+            string_offsets = read_array('I', string_count + 1)
+            for field in FIELDS:
+                store.columns[field] = read_array('I', count)
+            store.timing_offsets = read_array('Q', count + 1)
+            store.code_offsets = read_array('Q', count + 1)
+            text = f.read(string_offsets[-1])
+            store.strings = [str(text[string_offsets[i]:string_offsets[i + 1]], "utf-8")
+                             for i in range(string_count)]
+            store.string_ids = {s: i for i, s in enumerate(store.strings)}
+            store.timings_le.frombytes(f.read(2 * timing_count))
+            store.codes = bytearray(f.read(code_bytes))
+            if len(store.timings_le) != timing_count or len(store.codes) != code_bytes:
+                raise ValueError(f"{path} is truncated")
+        return store
+
+    def add_record(self, record):
+        """Append a script 5 record (dict) if it has timings or a code."""
+        if record.get("raw") or record.get("tuya"):
+            self.add(record.get("brand"), record.get("csv_file"), record.get("function"),
+                     record.get("protocol"), record.get("raw"), record.get("tuya"))
+
+    def import_file(self, path):
+        """Append the records of script 5 JSONL output or a script 3 binary raw file."""
+        with open(path, "rb") as f:
+            binary = f.read(len(RAW_MAGIC)) == RAW_MAGIC
+        if binary:
+            for record in open_records(path):
+                self.add_payload(record.brand, record.csv_file, record.function, record.protocol, record.payload)
+            return
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                self.add_record(json.loads(line))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query compact stores of converted IR codes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("import", help="build a store from script 5 JSONL or script 3 binary raw files")
+    build.add_argument("files", nargs="+")
+    build.add_argument("-o", "--output", required=True, help="store file to write")
+    build.add_argument("-l", "--level", type=int, default=2, help="compression level for records without a code")
+    query = sub.add_parser("query", help="print matching records")
+    query.add_argument("store")
+    query.add_argument("-b", "--brand", action="append")
+    query.add_argument("-c", "--csv-file", action="append")
+    query.add_argument("-f", "--function", action="append")
+    query.add_argument("-p", "--protocol", action="append")
+    query.add_argument("--format", choices=("jsonl", "codes"), default="jsonl")
+    stats = sub.add_parser("stats", help="record, string and byte counts")
+    stats.add_argument("store")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "import":
+            store = CodeStore()
+            for path in args.files:
+                store.import_file(path)
+            encoded = store.encode(args.level)
+            store.save(args.output)
+            print(f"Stored {len(store)} records ({encoded} newly encoded) in {args.output}")
+            return
+        store = CodeStore.load(args.store)
+    except (OSError, ValueError) as err:
+        print(f"[ERROR] {err}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == "stats":
+        print(f"{len(store)} records, {len(store.strings)} distinct strings, "
+              f"{len(store.timings_le)} timings ({2 * len(store.timings_le)} bytes), "
+              f"{len(store.codes)} bytes of compressed codes")
+        return
+    indexes = store.select(args.brand, args.csv_file, args.function, args.protocol, ignore_case=True)
+    if args.format == "codes":
+        for i in indexes:
+            print(store.code(i) or "")
+    else:
+        for record in store.iter_dicts(indexes):
+            print(json.dumps(record))
+
+if __name__ == "__main__":
+    main()
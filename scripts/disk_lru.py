@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+In-memory LRU cache with an optional SQLite tier that survives between runs.
+"""
+
+import os
+import sqlite3
+import sys
+from collections import OrderedDict
+
+
+class DiskLRU:
+    """
+    Bounded LRU of `key -> value` with an optional SQLite file behind it.
+
+    Subclasses turn keys into text and values into bytes for the disk tier
+    by overriding `db_key()`, `dumps()` and `loads()`. The disk tier is
+    tagged with `version()` and emptied whenever that changes. Writes are
+    batched; call `flush()` before a worker process exits.
+    """
+
+    table = "entries"
+
+    def __init__(self, maxsize=65536, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = self.disk_hits = self.misses = 0
+        self._db = None
+        self._pid = None
+        self._pending = []
+
+    def version(self):
+        return ""
+
+    def db_key(self, key):
+        return str(key)
+
+    def dumps(self, value):
+        return value
+
+    def loads(self, blob):
+        return blob
+
+    def _open(self):
+        if self._db is not None and self._pid != os.getpid():
+            # SQLite handles must not cross a fork
+            self._db = None
+            self._pending = []
+        if self._db is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=30)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+                db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB)")
+                version = self.version()
+                row = db.execute("SELECT value FROM meta WHERE name = ?", (self.table,)).fetchone()
+                if row is None or row[0] != version:
+                    db.execute(f"DELETE FROM {self.table}")
+                    db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (self.table, version))
+                db.commit()
+            except (OSError, sqlite3.Error) as exc:
+                print(f"[WARNING] Disk cache disabled ({self.path}): {exc}", file=sys.stderr)
+                self.path = None
+                return None
+            self._db = db
+            self._pid = os.getpid()
+        return self._db
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+        db = self._open()
+        if db is not None:
+            row = db.execute(f"SELECT value FROM {self.table} WHERE key = ?", (self.db_key(key),)).fetchone()
+            if row is not None:
+                value = self.loads(row[0])
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.path:
+            self._pending.append((self.db_key(key), self.dumps(value)))
+            if len(self._pending) >= 256:
+                self.flush()
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def flush(self):
+        """Write pending entries to the disk tier."""
+        db = self._open()
+        if db is not None and self._pending:
+            db.executemany(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?)", self._pending)
+            db.commit()
+        self._pending = []
+
+    def clear(self):
+        self.entries.clear()
+        self._pending = []
+        db = self._open()
+        if db is not None:
+            db.execute(f"DELETE FROM {self.table}")
+            db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self.entries),
+        }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Per-stage timers and counters for the conversion scripts (--profile).
+
+Call sites use `with instrument.timer("compress"):` and
+`instrument.count("rows")`. Both do nothing until `enable()` is called;
+a disabled timer is one shared no-op object, so the hooks can stay in the
+hot paths. `profiled()` wraps a whole run: it enables the counters,
+optionally runs cProfile, and prints a JSON summary to stderr at the end.
+
+Worker processes collect their own numbers; send `snapshot()` back with
+each result and `merge()` it in the parent.
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+ENABLED = False
+
+_timers = {}            # name -> [calls, total ns]
+_counters = Counter()
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        entry = _timers.get(self.name)
+        if entry is None:
+            _timers[self.name] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+def timer(name):
+    """Context manager adding the time spent in its block to stage `name`."""
+    return _Timer(name) if ENABLED else _NULL_TIMER
+
+def count(name, n=1):
+    if ENABLED:
+        _counters[name] += n
+
+def timed_iter(name, iterable):
+    """Iterate `iterable`, charging the time spent producing each item to `name`."""
+    if not ENABLED:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with timer(name):
+            item = next(iterator, _NULL_TIMER)
+        if item is _NULL_TIMER:
+            return
+        yield item
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+
+def snapshot():
+    """Picklable copy of the numbers collected so far."""
+    return {"timers": {name: list(entry) for name, entry in _timers.items()},
+            "counters": dict(_counters)}
+
+def merge(snap):
+    for name, (calls, total) in snap["timers"].items():
+        entry = _timers.setdefault(name, [0, 0])
+        entry[0] += calls
+        entry[1] += total
+    _counters.update(snap["counters"])
+
+def summary(wall_s=None):
+    timers = {
+        name: {"calls": calls, "total_s": total / 1e9, "mean_us": total / calls / 1e3}
+        for name, (calls, total) in sorted(_timers.items(), key=lambda item: -item[1][1])
+    }
+    result = {"timers": timers, "counters": dict(sorted(_counters.items()))}
+    payload, compressed = _counters.get("payload_bytes"), _counters.get("compressed_bytes")
+    if payload:
+        result["compression_ratio"] = compressed / payload
+    if wall_s is not None:
+        result["wall_s"] = wall_s
+    return result
+
+# --- cProfile ---------------------------------------------------------------------
+
+_worker_profile = None
+
+@contextmanager
+def worker_profile(dump_path):
+    """
+    Profile one task in a worker process. Each worker accumulates its own
+    profile in `<dump_path>.<pid>`; `merge_profiles()` combines them.
+    """
+    global _worker_profile
+    if not dump_path:
+        yield
+        return
+    if _worker_profile is None:
+        import cProfile
+        _worker_profile = cProfile.Profile()
+    _worker_profile.enable()
+    try:
+        yield
+    finally:
+        _worker_profile.disable()
+        _worker_profile.dump_stats(f"{dump_path}.{os.getpid()}")
+
+def _profile_parts(dump_path):
+    return [p for p in glob.glob(glob.escape(dump_path) + ".*") if p.rsplit(".", 1)[1].isdigit()]
+
+def merge_profiles(dump_path):
+    """Fold the per-worker profiles into `dump_path` and remove them."""
+    import pstats
+    parts = _profile_parts(dump_path)
+    if not parts:
+        return
+    stats = pstats.Stats(*parts)
+    if os.path.exists(dump_path):
+        stats.add(dump_path)
+    stats.dump_stats(dump_path)
+    for part in parts:
+        os.remove(part)
+
+@contextmanager
+def profiled(enabled, dump_path=None, stream=sys.stderr):
+    """
+    Run the enclosed block with instrumentation on when `enabled`, with
+    cProfile too when `dump_path` is given, then write the JSON summary to
+    `stream` and the pstats file to `dump_path`.
+    """
+    if not enabled and not dump_path:
+        yield
+        return
+    enable()
+    profile = None
+    if dump_path:
+        import cProfile
+        for part in _profile_parts(dump_path):
+            os.remove(part)  # left over from an interrupted run
+        profile = cProfile.Profile()
+    start = time.perf_counter()
+    if profile:
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(dump_path)
+            merge_profiles(dump_path)
+        stream.write("\n" + json.dumps(summary(time.perf_counter() - start), indent=2) + "\n")
+        if dump_path:
+            stream.write(f"Profile written to {dump_path} "
+                         f"(python3 -m pstats {dump_path})\n")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+IRDB helpers shared by the conversion scripts: locating the codes tree,
+reading its CSV files and turning a row into raw timings with pyIRDecoder.
+"""
+
+import os
+import csv
+import atexit
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+from disk_lru import DiskLRU
+from native_encoders import NativeEncoders
+from protocol_aliases import SAMPLE_ROWS, ProtocolAliases
+from protocol_registry import ProtocolRegistry, pyirdecoder_fingerprint, supports_sub_device
+
+IRDB_PATH = os.path.expanduser("~/irdb_to_tuya/IRDB/irdb/codes")
+CACHE_DIR = os.path.expanduser("~/irdb_to_tuya/cache")
+ENCODE_CACHE_PATH = os.path.join(CACHE_DIR, "encode_cache.sqlite3")
+CODE_CACHE_PATH = os.path.join(CACHE_DIR, "tuya_codes.sqlite3")
+PROTOCOL_MANIFEST_PATH = os.path.join(CACHE_DIR, "protocol_manifest.json")
+NATIVE_ENCODERS_PATH = os.path.join(CACHE_DIR, "native_encoders.json")
+PROTOCOL_ALIASES_PATH = os.path.join(CACHE_DIR, "protocol_aliases.json")
+
+BRANDS_USAGE = """Usage:
+  brands get [Brand Name]   - Download IR codes for a brand
+  brands list               - List all brands in irdb database
+  brands list [Letter(s)]   - List brands by full or partial names - not case sensitive
+"""
+
+# Only used to list protocols when pyIRDecoder is not installed
+STATIC_PROTOCOLS = [
+    "AdNotham", "Aiwa", "Akai", "Akord", "Amino", "Amino56", "Anthem", "Apple",
+    "Archer", "Audiovox", "Barco", "Blaupunkt", "Bose", "Bryston", "CanalSat",
+    "CanalSatLD", "Denon2", "Denon", "Denon1", "DenonK", "Dgtec", "Digivision",
+    "DirecTV", "DishNetwork", "DishPlayer", "Dyson", "Dyson2", "Elan",
+    "Elunevision", "Emerson", "Entone", "F12", "F120", "F121", "F32", "Fujitsu",
+    "Fujitsu128", "Fujitsu56", "GICable", "GIRG", "GuangZhou", "GwtS", "GXB",
+    "Humax4Phase", "InterVideoRC201", "IODATAn", "Jerrold", "JVC", "JVC48",
+    "JVC56", "Kaseikyo", "Kaseikyo56", "Kathrein", "Konka", "Logitech",
+    "Lumagen", "Lutron", "Matsui", "MCE", "MCIR2kbd", "MCIR2mouse", "Metz19",
+    "Mitsubishi", "MitsubishiK", "Motorola", "NEC", "NEC48", "NECf16", "NECrnc",
+    "NECx", "NECxf16", "Nokia", "Nokia12", "Nokia32", "NovaPace", "NRC16",
+    "NRC1632", "NRC17", "Ortek", "OrtekMCE", "PaceMSS", "Panasonic", "Panasonic2",
+    "PanasonicOld", "PCTV", "PID0001", "PID0003", "PID0004", "PID0083", "Pioneer",
+    "Proton", "Proton40", "RC5", "RC57F", "RC57F57", "RC5x", "RC6", "RC6620",
+    "RC6624", "RC6632", "RC6M16", "RC6M28", "RC6M32", "RC6M56", "RCA", "RCA38",
+    "RCA38Old", "RCAOld", "RECS800045", "RECS800068", "RECS800090", "Revox",
+    "Roku", "RTIRelay", "Sampo", "Samsung20", "Samsung36", "SamsungSMTG", "ScAtl6",
+    "Sharp", "Sharp1", "Sharp2", "SharpDVD", "SIM2", "Sky", "SkyHD", "SkyPlus",
+    "Somfy", "Sony12", "Sony15", "Sony20", "Sony8", "StreamZap", "StreamZap57",
+    "Sunfire", "TDC38", "TDC56", "TeacK", "Thomson", "Thomson7", "Tivo",
+    "Viewstar", "XBox360", "XBoxOne"
+]
+
+def print_protocols_in_columns(protocols_list, columns=4):
+    max_length = max(len(p) for p in protocols_list) + 3
+    rows = (len(protocols_list) + columns - 1) // columns
+    for r in range(rows):
+        row_items = []
+        for c in range(columns):
+            idx = r + c * rows
+            if idx < len(protocols_list):
+                row_items.append(f"{protocols_list[idx]:<{max_length}}")
+        print("".join(row_items))
+
+def sanitize_protocol_name(proto_in_csv):
+    return proto_in_csv.replace("{", "").replace("}", "")
+
+def convert_to_positive(signal):
+    return list(map(abs, signal))
+
+PROTOCOLS = ProtocolRegistry(PROTOCOL_MANIFEST_PATH, STATIC_PROTOCOLS)
+
+def known_protocols():
+    return PROTOCOLS.names()
+
+PROTOCOL_ALIASES = ProtocolAliases(PROTOCOL_ALIASES_PATH, known_protocols)
+
+def resolve_protocol_aliases(rows, workers=None):
+    """
+    Resolve the unknown protocol names of `rows` ((protocol, device,
+    subdevice, function) strings) in one batch before the rows are
+    encoded, so generate_raw_signal() finds them cached. The candidate
+    trials run in up to `workers` processes (default: all cores).
+    Returns {name: result} for the names it tried.
+    """
+    samples = {}
+    for name, *row in rows:
+        if name in samples:
+            if len(samples[name]) < SAMPLE_ROWS:
+                samples[name].append(tuple(row))
+        elif not PROTOCOLS.entry(name) and PROTOCOL_ALIASES.cached(name) is False:
+            samples[name] = [tuple(row)]
+    if not samples:
+        return {}
+    jobs = len(PROTOCOL_ALIASES.trial_jobs(samples))
+    workers = min(jobs, workers or os.cpu_count() or 1)
+    with instrument.timer("protocol_alias"):
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return PROTOCOL_ALIASES.resolve_many(samples, pool.map)
+        return PROTOCOL_ALIASES.resolve_many(samples)
+
+_protocol_cache = {}
+
+def get_protocol(protocol_name):
+    """
+    Return (proto_obj, supports_sub_device) for a pyIRDecoder protocol, or
+    None if it does not exist. Instances are created once per protocol.
+    """
+    if protocol_name not in _protocol_cache:
+        with instrument.timer("protocol_import"):
+            proto_cls = PROTOCOLS.get_class(protocol_name)
+        if not proto_cls:
+            _protocol_cache[protocol_name] = None
+        else:
+            proto_obj = proto_cls(parent=None)
+            _protocol_cache[protocol_name] = (proto_obj, supports_sub_device(proto_obj))
+    return _protocol_cache[protocol_name]
+
+
+class EncodeCache(DiskLRU):
+    """
+    Encoded timings keyed by (protocol, device, sub_device, function). The
+    disk tier is tagged with the pyIRDecoder fingerprint and emptied when
+    the checkout changes.
+    """
+
+    table = "encoded_timings"
+
+    def version(self):
+        return pyirdecoder_fingerprint() or ""
+
+    def db_key(self, key):
+        return "\t".join(map(str, key))
+
+    def dumps(self, rlc):
+        return array('I', rlc).tobytes()
+
+    def loads(self, blob):
+        return tuple(array('I', blob))
+
+    def put(self, key, rlc):
+        super().put(key, tuple(rlc))
+
+
+ENCODE_CACHE = EncodeCache(path=ENCODE_CACHE_PATH)
+atexit.register(ENCODE_CACHE.flush)
+
+NATIVE_ENCODERS = NativeEncoders(NATIVE_ENCODERS_PATH)
+
+def _protocol_object(protocol_name):
+    proto = get_protocol(protocol_name)
+    return proto[0] if proto else None
+
+def check_native_encoders():
+    """Run the pending native encoder checks up front, before rows are encoded under a row timeout."""
+    NATIVE_ENCODERS.prepare(_protocol_object)
+
+def encode_protocol(protocol_name, entry, device_str, sub_device_str, function_str):
+    """
+    (timings, None) for one row with a pyIRDecoder protocol and its
+    manifest `entry`; encoder errors propagate.
+    """
+    dev = int(device_str) if device_str else 0
+    func = int(function_str) if function_str else 0
+
+    # Only pass sub_device when the protocol supports it
+    if entry["sub_device"]:
+        if sub_device_str in [None, "", "-1"]:
+            subdev = 0
+        else:
+            subdev = int(sub_device_str)
+    else:
+        subdev = None
+
+    # the hot protocols are cheaper to build than to look up
+    with instrument.timer("native_encode"):
+        rlc = NATIVE_ENCODERS.encode(protocol_name, dev, subdev, func,
+                                     lambda: _protocol_object(protocol_name))
+    if rlc is not None:
+        instrument.count("native_encodes")
+        return rlc, None
+
+    # cache hits never need the protocol module itself
+    key = (protocol_name, dev, subdev, func)
+    rlc = ENCODE_CACHE.get(key)
+    if rlc is None:
+        proto = get_protocol(protocol_name)
+        if not proto:
+            return None, f"[ERROR] Protocol '{protocol_name}' not found in pyIRDecoder.protocols."
+        proto_obj = proto[0]
+        with instrument.timer("protocol_encode"):
+            if subdev is not None:
+                encoded = proto_obj.encode(device=dev, sub_device=subdev, function=func)
+            else:
+                encoded = proto_obj.encode(device=dev, function=func)
+        rlc = convert_to_positive(encoded.original_rlc)
+        ENCODE_CACHE.put(key, rlc)
+    else:
+        instrument.count("encode_cache_hits")
+    return list(rlc), None
+
+def generate_raw_signal(protocol_name, device_str, sub_device_str, function_str):
+    instrument.count("rows")
+    try:
+        entry = PROTOCOLS.entry(protocol_name)
+        if not entry:
+            # IRDB spellings such as NEC1 map to a pyIRDecoder protocol
+            with instrument.timer("protocol_alias"):
+                alias = PROTOCOL_ALIASES.resolve(protocol_name, [(device_str, sub_device_str, function_str)])
+            entry = PROTOCOLS.entry(alias) if alias else None
+            if not entry:
+                instrument.count("protocol_failures")
+                return None, f"[ERROR] Protocol '{protocol_name}' not found in pyIRDecoder.protocols."
+            instrument.count("protocol_aliases")
+            protocol_name = alias
+        rlc, err_msg = encode_protocol(protocol_name, entry, device_str, sub_device_str, function_str)
+        if rlc is None:
+            instrument.count("protocol_failures")
+        return rlc, err_msg
+    except Exception as exc:
+        instrument.count("protocol_failures")
+        return None, f"[ERROR] {exc}"
+
+def get_available_brands(base_path):
+    return [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d))]
+
+def get_csv_files(brand_path):
+    csv_files = []
+    for rootdir, _, files in os.walk(brand_path):
+        for fname in files:
+            if fname.endswith(".csv"):
+                rel = os.path.relpath(rootdir, brand_path)
+                csv_files.append(os.path.join(rel, fname))
+    return csv_files
+
+def read_csv_rows(csv_path):
+    """Yield the IRDB rows of one CSV file as dicts keyed by its header."""
+    with open(csv_path, newline='') as cf:
+        yield from csv.DictReader(cf)
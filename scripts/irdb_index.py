@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Persistent index of the IRDB codes tree.
+
+Every CSV is parsed once into a SQLite store (brand, device type, file,
+function name, protocol and parameters), so listing a brand's files or
+searching for a remote key no longer walks or greps the tree. Updates are
+incremental: files are re-read only when their mtime/size changed and
+their content hash differs.
+
+Usage:
+  irdb_index.py update [Brand ...]   - Build or refresh the index
+  irdb_index.py search KEY [Brand]   - Search function names (grep-style output)
+"""
+
+import csv
+import difflib
+import hashlib
+import os
+import sqlite3
+import sys
+
+from irdb_common import IRDB_PATH, CACHE_DIR
+
+INDEX_PATH = os.path.join(CACHE_DIR, "irdb_index.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS brands (
+    brand TEXT PRIMARY KEY,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    brand TEXT,
+    csv_file TEXT,
+    mtime_ns INTEGER,
+    size INTEGER,
+    sha1 TEXT,
+    PRIMARY KEY (brand, csv_file)
+);
+CREATE TABLE IF NOT EXISTS rows (
+    brand TEXT,
+    device_type TEXT,
+    csv_file TEXT,
+    functionname TEXT,
+    protocol TEXT,
+    device TEXT,
+    subdevice TEXT,
+    function TEXT
+);
+CREATE INDEX IF NOT EXISTS rows_file ON rows (brand, csv_file);
+CREATE INDEX IF NOT EXISTS rows_function ON rows (functionname COLLATE NOCASE);
+"""
+
+ROW_FIELDS = ("functionname", "protocol", "device", "subdevice", "function")
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class IRDBIndex:
+    def __init__(self, base_dir=IRDB_PATH, path=INDEX_PATH):
+        self.base_dir = base_dir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.executescript(SCHEMA)
+        self.fresh = set()      # brands checked against the tree by this instance
+
+    def close(self):
+        self.db.close()
+
+    def update(self, brands=None):
+        """
+        Bring the index in line with the tree for `brands` (default: every
+        brand on disk). Returns (added_or_changed, removed) file counts.
+        """
+        on_disk = sorted(d for d in os.listdir(self.base_dir)
+                         if os.path.isdir(os.path.join(self.base_dir, d)))
+        if brands is None:
+            brands = on_disk
+            for (gone,) in self.db.execute("SELECT brand FROM brands").fetchall():
+                if gone not in on_disk:
+                    self._drop_brand(gone)
+
+        changed = removed = 0
+        for brand in brands:
+            c, r = self._update_brand(brand)
+            changed += c
+            removed += r
+        self.db.commit()
+        return changed, removed
+
+    def _drop_brand(self, brand):
+        self.db.execute("DELETE FROM rows WHERE brand = ?", (brand,))
+        self.db.execute("DELETE FROM files WHERE brand = ?", (brand,))
+        self.db.execute("DELETE FROM brands WHERE brand = ?", (brand,))
+
+    def _update_brand(self, brand):
+        brand_path = os.path.join(self.base_dir, brand)
+        known = {
+            csv_file: (mtime_ns, size, sha1)
+            for csv_file, mtime_ns, size, sha1 in self.db.execute(
+                "SELECT csv_file, mtime_ns, size, sha1 FROM files WHERE brand = ?", (brand,))
+        }
+        changed = 0
+        seen = set()
+        for rootdir, _, files in os.walk(brand_path):
+            for fname in files:
+                if not fname.endswith(".csv"):
+                    continue
+                path = os.path.join(rootdir, fname)
+                csv_file = os.path.relpath(path, brand_path)
+                seen.add(csv_file)
+                st = os.stat(path)
+                old = known.get(csv_file)
+                if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+                    continue
+                sha1 = file_sha1(path)
+                if old and old[2] == sha1:
+                    self.db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE brand = ? AND csv_file = ?",
+                                    (st.st_mtime_ns, st.st_size, brand, csv_file))
+                    continue
+                self._index_file(brand, csv_file, path)
+                self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                (brand, csv_file, st.st_mtime_ns, st.st_size, sha1))
+                changed += 1
+
+        stale = [csv_file for csv_file in known if csv_file not in seen]
+        for csv_file in stale:
+            self.db.execute("DELETE FROM rows WHERE brand = ? AND csv_file = ?", (brand, csv_file))
+            self.db.execute("DELETE FROM files WHERE brand = ? AND csv_file = ?", (brand, csv_file))
+
+        if os.path.isdir(brand_path):
+            self.db.execute("INSERT OR REPLACE INTO brands VALUES (?, ?)",
+                            (brand, os.stat(brand_path).st_mtime_ns))
+        else:
+            self._drop_brand(brand)
+        return changed, len(stale)
+
+    def _index_file(self, brand, csv_file, path):
+        self.db.execute("DELETE FROM rows WHERE brand = ? AND csv_file = ?", (brand, csv_file))
+        device_type = csv_file.split(os.sep, 1)[0] if os.sep in csv_file else ""
+        with open(path, newline='', errors="replace") as cf:
+            self.db.executemany(
+                "INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((brand, device_type, csv_file, *(row.get(f) or "" for f in ROW_FIELDS))
+                 for row in csv.DictReader(cf)),
+            )
+
+    def ensure_brand(self, brand):
+        """
+        Bring `brand` in line with the tree before the first query on it.
+        The folder mtime does not change when a CSV is added to a device
+        type folder or edited in place, so every file is stat()ed; only
+        files whose mtime/size changed are hashed and re-read.
+        """
+        if brand not in self.fresh:
+            self.update([brand])
+            self.fresh.add(brand)
+
+    def csv_files(self, brand):
+        self.ensure_brand(brand)
+        return [csv_file for (csv_file,) in self.db.execute(
+            "SELECT csv_file FROM files WHERE brand = ? ORDER BY csv_file", (brand,))]
+
+    def search(self, key, brand=None, fuzzy=True):
+        """
+        Rows whose function name contains `key` (case-insensitive). When
+        nothing matches and `fuzzy` is set, fall back to close spellings.
+        Each row is (brand, csv_file, functionname, protocol, device, subdevice, function).
+        """
+        where, params = "", []
+        if brand is not None:
+            self.ensure_brand(brand)
+            where, params = "brand = ? AND ", [brand]
+        query = ("SELECT brand, csv_file, functionname, protocol, device, subdevice, function "
+                 f"FROM rows WHERE {where}functionname LIKE ? ESCAPE '\\' ORDER BY brand, csv_file, rowid")
+        escaped = key.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        results = self.db.execute(query, params + [f"%{escaped}%"]).fetchall()
+        if results or not fuzzy:
+            return results
+
+        names = [name for (name,) in self.db.execute(
+            f"SELECT DISTINCT functionname FROM rows WHERE {where}1", params)]
+        lowered = {name.lower(): name for name in names}
+        close = difflib.get_close_matches(key.lower(), list(lowered), n=10, cutoff=0.6)
+        if not close:
+            return []
+        marks = ",".join("?" * len(close))
+        return self.db.execute(
+            "SELECT brand, csv_file, functionname, protocol, device, subdevice, function "
+            f"FROM rows WHERE {where}functionname IN ({marks}) ORDER BY brand, csv_file, rowid",
+            params + [lowered[c] for c in close]).fetchall()
+
+    def rows(self, brands=None):
+        """
+        Every row of `brands` (default: every brand on disk) in the search()
+        form, ordered by brand, file and CSV line.
+        """
+        if brands is None:
+            self.update()
+            where, params = "", []
+        else:
+            for brand in brands:
+                self.ensure_brand(brand)
+            where, params = f"WHERE brand IN ({','.join('?' * len(brands))}) ", list(brands)
+        return self.db.execute(
+            "SELECT brand, csv_file, functionname, protocol, device, subdevice, function "
+            f"FROM rows {where}ORDER BY brand, csv_file, rowid", params)
+
+    def grep_lines(self, key, brand=None):
+        """search() results in the `path:functionname,protocol,device,subdevice,function` form grep gave."""
+        return [
+            f"{os.path.join(self.base_dir, b, csv_file)}:{','.join(fields)}"
+            for b, csv_file, *fields in self.search(key, brand)
+        ]
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "update":
+        index = IRDBIndex()
+        changed, removed = index.update(sys.argv[2:] or None)
+        print(f"Indexed {changed} new or changed CSV files, removed {removed}.")
+    elif len(sys.argv) in (3, 4) and sys.argv[1] == "search":
+        index = IRDBIndex()
+        for line in index.grep_lines(sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None):
+            print(line)
+    else:
+        print(__doc__.split("Usage:\n", 1)[1].rstrip())
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Find many remote keys across many brands in one pass.
+
+A key is given as a name with optional aliases, `power=KEY_POWER,PWR`.
+All names and aliases go into one Aho-Corasick automaton, so each
+function name in the IRDB index is scanned once no matter how many keys
+are searched. Matching is case-insensitive and by substring, like the
+single-key search; with `exact` a function name has to equal a pattern.
+"""
+
+from collections import deque
+
+# common spellings of frequently wanted keys, used with --aliases
+DEFAULT_ALIASES = {
+    "power": ("power", "pwr", "key_power", "on/off", "standby"),
+    "power on": ("power on", "poweron", "pwr on", "discrete on"),
+    "power off": ("power off", "poweroff", "pwr off", "discrete off"),
+    "vol+": ("vol+", "vol +", "vol up", "volume up", "volume+", "key_volumeup"),
+    "vol-": ("vol-", "vol -", "vol down", "volume down", "volume-", "key_volumedown"),
+    "mute": ("mute", "key_mute"),
+    "ch+": ("ch+", "ch +", "ch up", "channel up", "channel+", "key_channelup"),
+    "ch-": ("ch-", "ch -", "ch down", "channel down", "channel-", "key_channeldown"),
+    "input": ("input", "source", "av/tv", "tv/av", "key_input"),
+    "menu": ("menu", "key_menu"),
+}
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; `search()` returns the values of every pattern found."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [frozenset()]
+        for pattern, value in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(frozenset())
+                state = nxt
+            self.out[state] |= {value}
+
+        # breadth-first, so every fail link points at a finished state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(ch, 0)
+                self.out[nxt] |= self.out[self.fail[nxt]]
+
+    def search(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+def parse_key_spec(spec, aliases=False):
+    """`name[=alias,alias...]` -> (name, patterns), with DEFAULT_ALIASES added when `aliases`."""
+    name, _, rest = spec.partition("=")
+    name = name.strip()
+    patterns = [name] + [a.strip() for a in rest.split(",") if a.strip()]
+    if aliases:
+        patterns += DEFAULT_ALIASES.get(name.lower(), ())
+    return name, list(dict.fromkeys(p.lower() for p in patterns if p))
+
+def read_key_file(path):
+    """Key specs from a file, one per line; blank lines and # comments are skipped."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+class KeyMatcher:
+    """Which of the requested keys a function name matches."""
+
+    def __init__(self, specs, aliases=False, exact=False):
+        self.keys = {}
+        for spec in specs:
+            name, patterns = parse_key_spec(spec, aliases)
+            known = self.keys.setdefault(name, [])
+            known += [p for p in patterns if p not in known]
+        self.exact = exact
+        pairs = [(pattern, name) for name, patterns in self.keys.items() for pattern in patterns]
+        if exact:
+            self.table = {}
+            for pattern, name in pairs:
+                self.table.setdefault(pattern, set()).add(name)
+        else:
+            self.automaton = AhoCorasick(pairs)
+        self._seen = {}
+
+    def match(self, functionname):
+        """Sorted tuple of key names matching `functionname` (empty if none)."""
+        keys = self._seen.get(functionname)
+        if keys is None:
+            text = functionname.strip().lower()
+            found = self.table.get(text, ()) if self.exact else self.automaton.search(text)
+            keys = self._seen[functionname] = tuple(sorted(found))
+        return keys
+
+def search_rows(rows, matcher):
+    """Yield (keys, row) for the index rows (brand, csv_file, functionname, ...) matching any key."""
+    for row in rows:
+        keys = matcher.match(row[2])
+        if keys:
+            yield keys, row
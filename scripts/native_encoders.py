@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Table-driven encoders for the protocols most IRDB rows use.
+
+NEC, NECx, RC5, RC6 and Sony12/15/20 frames are built from per-field
+timing templates that are precomputed once per bit layout, instead of
+running a full pyIRDecoder protocol object for every key. The field
+layouts follow the protocols' IRP notation.
+
+A native encoder is only used once it matches pyIRDecoder's own output
+over the whole device/function range of the installed checkout. The
+first use of a protocol runs that check (a quick spot check first, so a
+disagreeing protocol is rejected fast); `native_encoders.py verify` runs
+it ahead of time. Results are kept per pyIRDecoder fingerprint, and any
+protocol that disagrees, was only spot-checked, or is out of range for a
+key goes through pyIRDecoder as before.
+
+Usage:
+  native_encoders.py verify [PROTOCOL ...]   - Compare against pyIRDecoder on the full range
+  native_encoders.py verify --quick          - Spot check only
+  native_encoders.py status                  - Show the recorded results
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+from protocol_registry import pyirdecoder_fingerprint
+
+SPOT_CHECK_SAMPLES = 48
+
+
+@functools.lru_cache(maxsize=None)
+def pulse_table(bits, zero, one, lsb=True):
+    """(timings, duration) for every value of a `bits`-wide pulse-distance field."""
+    table = []
+    for value in range(1 << bits):
+        timings = []
+        for i in (range(bits) if lsb else range(bits - 1, -1, -1)):
+            timings += one if value >> i & 1 else zero
+        table.append((tuple(timings), sum(timings)))
+    return table
+
+@functools.lru_cache(maxsize=None)
+def biphase_table(bits, zero, one):
+    """Half-bit levels (mark, duration) for every value of a `bits`-wide MSB-first biphase field."""
+    return [tuple(level for i in range(bits - 1, -1, -1) for level in (one if value >> i & 1 else zero))
+            for value in range(1 << bits)]
+
+
+class PulseDistance:
+    """
+    Lead-in, then fixed-width fields of (mark, space) bits and an optional
+    stop mark. The last space is stretched to fill the frame to `frame_us`.
+
+    `fields` lists (parameter, bits); the parameter "~function" is the
+    inverted function byte.
+    """
+
+    def __init__(self, params, lead_in, zero, one, fields, frame_us, stop=None, lsb=True):
+        self.params = params
+        self.lead_in = tuple(lead_in)
+        self.fields = [(name, bits, pulse_table(bits, tuple(zero), tuple(one), lsb)) for name, bits in fields]
+        self.stop = stop
+        self.frame_us = frame_us
+        self.lead_duration = sum(lead_in) + (stop or 0)
+
+    def __call__(self, device, sub_device, function):
+        values = {"device": device, "sub_device": sub_device, "function": function,
+                  "~function": function ^ 0xFF}
+        rlc = list(self.lead_in)
+        total = self.lead_duration
+        for name, bits, table in self.fields:
+            value = values[name]
+            if not 0 <= value < 1 << bits:
+                raise ValueError(f"{name} {value} out of range")
+            timings, duration = table[value]
+            rlc += timings
+            total += duration
+        if self.stop:
+            rlc += (self.stop, self.frame_us - total)
+        else:
+            rlc[-1] += self.frame_us - total
+        return rlc
+
+
+class Biphase:
+    """
+    Manchester-coded frames (RC5, RC6): a fixed prefix of half-bit levels,
+    then MSB-first fields. Adjacent half-bits of the same level merge into
+    one duration, and the final space fills the frame to `frame_us`.
+
+    `fields` lists (parameter, bits, zero, one) with the half-bit levels of
+    each bit value as ((mark, duration), ...); a parameter of None is the
+    constant 0 (the toggle bit of a first press).
+    """
+
+    def __init__(self, params, prefix, fields, frame_us, limits):
+        self.params = params
+        self.prefix = tuple(prefix)
+        self.fields = [(name, bits, biphase_table(bits, zero, one)) for name, bits, zero, one in fields]
+        self.frame_us = frame_us
+        self.limits = limits
+
+    def __call__(self, device, sub_device, function):
+        values = {"device": device, "function": function}
+        for name, high in self.limits.items():
+            if not 0 <= values[name] <= high:
+                raise ValueError(f"{name} {values[name]} out of range")
+        levels = list(self.prefix)
+        for name, bits, table in self.fields:
+            if name is None:
+                value = 0
+            elif name == "~function6":
+                value = (function >> 6 & 1) ^ 1
+            else:
+                value = values[name] & ((1 << bits) - 1)
+            levels += table[value]
+
+        rlc = []
+        mark = None
+        for level, duration in levels:
+            if level == mark:
+                rlc[-1] += duration
+            elif rlc or level:      # a frame starts with its first mark
+                rlc.append(duration)
+                mark = level
+        total = sum(rlc)
+        if mark:
+            rlc.append(self.frame_us - total)
+        else:
+            rlc[-1] += self.frame_us - total
+        return rlc
+
+
+NEC_UNIT = 564
+NEC_BITS = dict(zero=(NEC_UNIT, NEC_UNIT), one=(NEC_UNIT, 3 * NEC_UNIT))
+NEC_FIELDS = [("device", 8), ("sub_device", 8), ("function", 8), ("~function", 8)]
+
+RC5_UNIT = 889
+RC5_ZERO = ((True, RC5_UNIT), (False, RC5_UNIT))
+RC5_ONE = ((False, RC5_UNIT), (True, RC5_UNIT))
+
+RC6_UNIT = 444
+RC6_ZERO = ((False, RC6_UNIT), (True, RC6_UNIT))
+RC6_ONE = ((True, RC6_UNIT), (False, RC6_UNIT))
+
+SONY_UNIT = 600
+SONY_BITS = dict(zero=(SONY_UNIT, SONY_UNIT), one=(2 * SONY_UNIT, SONY_UNIT))
+SONY_LEAD = (4 * SONY_UNIT, SONY_UNIT)
+
+ENCODERS = {
+    # {38.0k,564}<1,-1|1,-3>(16,-8,D:8,S:8,F:8,~F:8,1,^108m)
+    "NEC": PulseDistance(("device", "sub_device", "function"), (16 * NEC_UNIT, 8 * NEC_UNIT),
+                         fields=NEC_FIELDS, stop=NEC_UNIT, frame_us=108000, **NEC_BITS),
+    # {38.0k,564}<1,-1|1,-3>(8,-8,D:8,S:8,F:8,~F:8,1,^108m)
+    "NECx": PulseDistance(("device", "sub_device", "function"), (8 * NEC_UNIT, 8 * NEC_UNIT),
+                          fields=NEC_FIELDS, stop=NEC_UNIT, frame_us=108000, **NEC_BITS),
+    # {36k,msb,889}<1,-1|-1,1>(1,~F:1:6,T:1,D:5,F:6,^114m)
+    "RC5": Biphase(("device", "function"), RC5_ONE,
+                   [("~function6", 1, RC5_ZERO, RC5_ONE), (None, 1, RC5_ZERO, RC5_ONE),
+                    ("device", 5, RC5_ZERO, RC5_ONE), ("function", 6, RC5_ZERO, RC5_ONE)],
+                   frame_us=114000, limits={"device": 31, "function": 127}),
+    # {36k,444,msb}<-1,1|1,-1>(6,-2,1:1,0:3,<-2,2|2,-2>(T:1),D:8,F:8,^107m)
+    "RC6": Biphase(("device", "function"), ((True, 6 * RC6_UNIT), (False, 2 * RC6_UNIT)) + RC6_ONE,
+                   [(None, 3, RC6_ZERO, RC6_ONE),
+                    (None, 1, ((False, 2 * RC6_UNIT), (True, 2 * RC6_UNIT)),
+                     ((True, 2 * RC6_UNIT), (False, 2 * RC6_UNIT))),
+                    ("device", 8, RC6_ZERO, RC6_ONE), ("function", 8, RC6_ZERO, RC6_ONE)],
+                   frame_us=107000, limits={"device": 255, "function": 255}),
+    # {40k,600}<1,-1|2,-1>(4,-1,F:7,D:5,^45m)
+    "Sony12": PulseDistance(("device", "function"), SONY_LEAD, fields=[("function", 7), ("device", 5)],
+                            frame_us=45000, **SONY_BITS),
+    # {40k,600}<1,-1|2,-1>(4,-1,F:7,D:8,^45m)
+    "Sony15": PulseDistance(("device", "function"), SONY_LEAD, fields=[("function", 7), ("device", 8)],
+                            frame_us=45000, **SONY_BITS),
+    # {40k,600}<1,-1|2,-1>(4,-1,F:7,D:5,S:8,^45m)
+    "Sony20": PulseDistance(("device", "sub_device", "function"), SONY_LEAD,
+                            fields=[("function", 7), ("device", 5), ("sub_device", 8)],
+                            frame_us=45000, **SONY_BITS),
+}
+
+
+# --- verification against pyIRDecoder -------------------------------------------
+
+def reference_rlc(proto_obj, device, sub_device, function):
+    """What generate_raw_signal() gets from pyIRDecoder for the same arguments."""
+    if sub_device is not None:
+        encoded = proto_obj.encode(device=device, sub_device=sub_device, function=function)
+    else:
+        encoded = proto_obj.encode(device=device, function=function)
+    return list(map(abs, encoded.original_rlc))
+
+def parameter_grid(proto_obj, full=False, samples=SPOT_CHECK_SAMPLES, seed=0):
+    """
+    Argument tuples (device, sub_device, function) to compare. The full
+    grid is every device x function pair, with the sub_device swept over
+    its range separately; the spot check is the range ends plus `samples`
+    random tuples.
+    """
+    ranges = {name: range(low, high + 1) for name, low, high, *_ in proto_obj.encode_parameters}
+    if "device" not in ranges or "function" not in ranges:
+        return []
+    sub = ranges.get("sub_device")
+    rng = random.Random(seed)
+
+    def pick(r):
+        return None if r is None else rng.choice(r)
+
+    if full:
+        grid = [(d, pick(sub), f) for d, f in itertools.product(ranges["device"], ranges["function"])]
+        if sub is not None:
+            grid += [(pick(ranges["device"]), s, pick(ranges["function"])) for s in sub]
+        return grid
+    ends = [(ranges["device"][i], None if sub is None else sub[i], ranges["function"][i]) for i in (0, -1)]
+    return ends + [(pick(ranges["device"]), pick(sub), pick(ranges["function"])) for _ in range(samples)]
+
+def compare(name, proto_obj, grid):
+    """Return (checked, first mismatching tuple or None)."""
+    encoder = ENCODERS[name]
+    checked = 0
+    for args in grid:
+        try:
+            expected = reference_rlc(proto_obj, *args)
+        except Exception:
+            continue  # pyIRDecoder rejects these arguments itself
+        try:
+            got = encoder(*args)
+        except ValueError:
+            got = None
+        if got != expected:
+            return checked, args
+        checked += 1
+    return checked, None
+
+
+class NativeEncoders:
+    """
+    The native encoders that agree with the installed pyIRDecoder. Check
+    results live in a small JSON file tagged with the pyIRDecoder
+    fingerprint, so they are redone when the checkout changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._results = None
+        self._enabled = {}
+
+    def results(self):
+        if self._results is None:
+            self._results = self._load()
+        return self._results
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("fingerprint") == pyirdecoder_fingerprint():
+                return data["protocols"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def record(self, name, checked, mismatch, full):
+        # nothing checked (pyIRDecoder rejected every tuple, or no grid) proves nothing
+        result = {"ok": mismatch is None and checked > 0, "checked": checked, "full": full}
+        if mismatch is not None:
+            result["mismatch"] = list(mismatch)
+        # other processes may have recorded protocols since this one loaded
+        self._results = self._load()
+        self._results[name] = result
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"fingerprint": pyirdecoder_fingerprint(), "protocols": self._results}, f)
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            print(f"[WARNING] Could not save native encoder checks: {exc}", file=sys.stderr)
+        self._enabled.pop(name, None)
+        return result
+
+    def needs_check(self, name):
+        """True if `name` has no result yet, or only a passed spot check."""
+        result = self.results().get(name)
+        return result is None or (result["ok"] and not result["full"])
+
+    def check(self, name, obj):
+        """
+        Compare `name` with pyIRDecoder's protocol object `obj`: a spot
+        check first, then the full range. Records and returns the result.
+        """
+        checked, mismatch = compare(name, obj, parameter_grid(obj))
+        if mismatch is None and checked:
+            result = self.record(name, *compare(name, obj, parameter_grid(obj, full=True)), full=True)
+        else:
+            result = self.record(name, checked, mismatch, full=False)
+        if "mismatch" in result:
+            print(f"[WARNING] The native {name} encoder disagrees with pyIRDecoder "
+                  f"for {tuple(result['mismatch'])}; using pyIRDecoder.", file=sys.stderr)
+        elif not result["ok"]:
+            print(f"[WARNING] No {name} key could be checked against pyIRDecoder; "
+                  f"using pyIRDecoder.", file=sys.stderr)
+        return result
+
+    def prepare(self, proto_obj):
+        """
+        Check every native protocol that needs it now, rather than on its
+        first key (where a row timeout could cut the check short).
+        `proto_obj(name)` returns pyIRDecoder's protocol object or None.
+        """
+        for name in ENCODERS:
+            if self.needs_check(name):
+                obj = proto_obj(name)
+                if obj is not None:
+                    print(f"Checking the native {name} encoder against pyIRDecoder "
+                          f"(once per pyIRDecoder checkout)...", file=sys.stderr)
+                    self.check(name, obj)
+
+    def encoder(self, name, proto_obj=None):
+        """
+        The native encoder for `name` if it matches pyIRDecoder on the full
+        range, else None. A protocol without a full-range result is checked
+        against `proto_obj()` (a callable, so pyIRDecoder is only loaded
+        when needed).
+        """
+        if name not in self._enabled:
+            encoder = ENCODERS.get(name)
+            if encoder is not None:
+                result = self.results().get(name)
+                if self.needs_check(name):
+                    obj = proto_obj() if proto_obj else None
+                    if obj is None:
+                        return None
+                    result = self.check(name, obj)
+                if not (result["ok"] and result["checked"] and result["full"]):
+                    encoder = None
+            self._enabled[name] = encoder
+        return self._enabled[name]
+
+    def encode(self, name, device, sub_device, function, proto_obj=None):
+        """Timings for one key, or None when pyIRDecoder has to do it."""
+        encoder = self.encoder(name, proto_obj)
+        if encoder is None or (sub_device is None) != ("sub_device" not in encoder.params):
+            return None
+        try:
+            return encoder(device, sub_device, function)
+        except ValueError:
+            return None  # out of range: let pyIRDecoder report it
+
+
+def main():
+    from irdb_common import NATIVE_ENCODERS, get_protocol
+
+    parser = argparse.ArgumentParser(description="Check the native protocol encoders against pyIRDecoder.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    verify = sub.add_parser("verify", help="compare native and pyIRDecoder timings")
+    verify.add_argument("protocols", nargs="*", help=f"protocols to check (default: {', '.join(ENCODERS)})")
+    verify.add_argument("--quick", action="store_true", help="spot check instead of the full range")
+    sub.add_parser("status", help="show the recorded check results")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        results = NATIVE_ENCODERS.results()
+        for name in ENCODERS:
+            result = results.get(name)
+            if result is None:
+                state = "not checked"
+            elif result["ok"] and result["checked"] and result["full"]:
+                state = f"ok ({result['checked']} keys, full range)"
+            elif result["ok"] and result["checked"]:
+                state = f"not used yet, spot check passed ({result['checked']} keys)"
+            elif "mismatch" in result:
+                state = f"disabled, differs for {tuple(result['mismatch'])}"
+            else:
+                state = "disabled, no key could be checked"
+            print(f"{name:<8}{state}")
+        return
+
+    failed = False
+    for name in args.protocols or ENCODERS:
+        if name not in ENCODERS:
+            print(f"{name:<8}no native encoder")
+            continue
+        proto = get_protocol(name)
+        if not proto:
+            print(f"{name:<8}not in pyIRDecoder, skipped")
+            continue
+        start = time.perf_counter()
+        checked, mismatch = compare(name, proto[0], parameter_grid(proto[0], full=not args.quick))
+        NATIVE_ENCODERS.record(name, checked, mismatch, full=not args.quick)
+        elapsed = time.perf_counter() - start
+        if mismatch is None and checked:
+            print(f"{name:<8}ok, {checked} keys match ({elapsed:.1f}s)")
+        elif mismatch is None:
+            failed = True
+            print(f"{name:<8}NOT VERIFIED, pyIRDecoder encoded none of the keys; pyIRDecoder will be used")
+        else:
+            failed = True
+            print(f"{name:<8}MISMATCH for (device, sub_device, function) = {mismatch}; "
+                  f"pyIRDecoder will be used")
+    if failed:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Map IRDB protocol names that pyIRDecoder does not know (NEC1, RC6-M-28,
+Denon-K, ...) to pyIRDecoder protocols.
+
+Candidates come from a small alias table and from name rules (ignore case
+and punctuation, then drop a trailing variant number, then the longest
+known prefix). Each candidate is tried on sample rows of the IRDB name:
+the rows are encoded and the timings decoded back with the same protocol
+to check that device, sub_device and function survive. A candidate that
+decodes to different values is rejected. Of the rest, candidates with a
+verified round trip beat those that could not be checked; then the one
+encoding the most rows wins, ties going to the higher-ranked candidate. The
+mapping is cached per pyIRDecoder fingerprint and VERSION. A name without
+a match is only remembered for the current process, so a new alias or a
+renamed pyIRDecoder protocol is picked up on the next run. A caller with
+its own worker pool runs the trials from `trial_jobs()` there and hands
+the scores to `choose()`, or passes the pool's map to `resolve_many()`.
+"""
+
+import json
+import os
+import re
+import sys
+
+from protocol_registry import pyirdecoder_fingerprint
+
+SAMPLE_ROWS = 4
+VERSION = 3             # bump when the ranking or ALIASES change, so cached picks are redone
+
+# IRDB spellings that the name rules alone would rank wrongly or miss
+ALIASES = {
+    "NEC1": ("NEC", "NECx"),
+    "NEC2": ("NEC", "NECx"),
+    "NECx1": ("NECx", "NEC"),
+    "NECx2": ("NECx", "NEC"),
+    "NEC1-f16": ("NECf16",),
+    "NECx1-f16": ("NECxf16",),
+    "NEC1-rnc": ("NECrnc",),
+    "NEC-Shirrif": ("NEC",),
+    "Sony": ("Sony12", "Sony15", "Sony20"),
+    "Samsung": ("Samsung36", "Samsung20"),
+    "RCA(Old)": ("RCAOld",),
+    "RCA-38(Old)": ("RCA38Old",),
+    "Panasonic_Old": ("PanasonicOld",),
+    "48-NEC1": ("NEC48",),
+    "48-NEC2": ("NEC48",),
+}
+
+
+def _squash(name):
+    return re.sub(r"[^0-9a-z]", "", name.lower())
+
+def candidates(name, known):
+    """Ranked pyIRDecoder protocols to try for the IRDB protocol `name`."""
+    by_squashed = {}
+    for proto in known:
+        by_squashed.setdefault(_squash(proto), proto)
+    ranked = [proto for proto in ALIASES.get(name, ()) if proto in known]
+    squashed = _squash(name)
+    for key in (squashed, squashed.rstrip("0123456789")):
+        if key in by_squashed:
+            ranked.append(by_squashed[key])
+    prefixes = sorted((k for k in by_squashed if len(k) >= 3 and squashed.startswith(k)), key=len, reverse=True)
+    ranked += [by_squashed[k] for k in prefixes]
+    return list(dict.fromkeys(p for p in ranked if p != name))
+
+
+def _parse_row(device_str, sub_device_str, function_str):
+    return (int(device_str) if device_str else 0,
+            None if sub_device_str in (None, "", "-1") else int(sub_device_str),
+            int(function_str) if function_str else 0)
+
+def decode_check(proto_obj, rlc, device, sub_device, function):
+    """
+    Decode `rlc` with `proto_obj` and compare the parameters. Returns
+    True/False, or None when the protocol cannot decode at all.
+    """
+    decode = getattr(proto_obj, "decode", None)
+    if decode is None:
+        return None
+    signed = [t if i % 2 == 0 else -t for i, t in enumerate(rlc)]
+    try:
+        code = decode(signed)
+    except (NotImplementedError, TypeError):
+        return None
+    except Exception:
+        return False
+    expected = {"device": device, "function": function}
+    if sub_device is not None:
+        expected["sub_device"] = sub_device
+    for param, value in expected.items():
+        got = getattr(code, param, None)
+        if got is not None and got != value:
+            return False
+    return True
+
+def trial(candidate, rows):
+    """
+    Encode the (device, subdevice, function) string `rows` with
+    `candidate` and decode each back. Returns (encoded, verified,
+    mismatched) row counts. Top level so it can run in a worker process.
+    """
+    from irdb_common import PROTOCOLS, encode_protocol, get_protocol
+
+    entry = PROTOCOLS.entry(candidate)
+    proto = get_protocol(candidate)
+    if not entry or not proto:
+        return 0, 0, 0
+    encoded = verified = mismatched = 0
+    for row in rows:
+        try:
+            rlc, _ = encode_protocol(candidate, entry, *row)
+            if rlc is None:
+                continue
+            encoded += 1
+            device, sub_device, function = _parse_row(*row)
+            check = decode_check(proto[0], rlc, device, sub_device if entry["sub_device"] else None, function)
+            verified += check is True
+            mismatched += check is False
+        except Exception:
+            continue
+    return encoded, verified, mismatched
+
+
+class ProtocolAliases:
+    """Resolved IRDB protocol names, kept in a JSON file tagged with the pyIRDecoder fingerprint."""
+
+    def __init__(self, path, known):
+        self.path = path
+        self.known = known      # callable returning the pyIRDecoder protocol names
+        self._aliases = None
+
+    def aliases(self):
+        if self._aliases is None:
+            self._aliases = self._load()
+        return self._aliases
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("fingerprint") == pyirdecoder_fingerprint() and data.get("version") == VERSION:
+                return data["aliases"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _save(self, resolved):
+        # merge with what other processes resolved meanwhile
+        self._aliases = self._load() | resolved
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"fingerprint": pyirdecoder_fingerprint(), "version": VERSION, "aliases": self._aliases},
+                          f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            print(f"[WARNING] Could not save protocol aliases: {exc}", file=sys.stderr)
+
+    def cached(self, name):
+        """The cached result for `name` (None: no match), or False if it was never resolved."""
+        result = self.aliases().get(name, False)
+        if result is False:
+            # another process (e.g. the parent of this worker) may have resolved it
+            self._aliases = self._load() | self.aliases()
+            result = self.aliases().get(name, False)
+        return result
+
+    def resolve(self, name, rows):
+        """pyIRDecoder protocol for IRDB protocol `name`, or None. `rows` are sample row strings."""
+        result = self.cached(name)
+        if result is False:
+            result = self.resolve_many({name: rows})[name]
+        return result["protocol"] if result else None
+
+    def resolve_many(self, samples, map_fn=map):
+        """
+        Resolve every IRDB name in `samples` ({name: [(device, subdevice,
+        function) strings]}) that is not cached yet, running the trials
+        through `map_fn` (e.g. a process pool's map). Returns {name: result}.
+        """
+        jobs = self.trial_jobs(samples)
+        scores = map_fn(trial, [candidate for _, candidate in jobs], list(jobs.values()))
+        return self.choose(samples, dict(zip(jobs, scores)))
+
+    def trial_jobs(self, samples):
+        """{(name, candidate): sample rows} for the trials the uncached names in `samples` need."""
+        known = set(self.known())
+        return {(name, candidate): samples[name][:SAMPLE_ROWS]
+                for name in samples if name not in self.aliases()
+                for candidate in candidates(name, known)}
+
+    def choose(self, samples, scores):
+        """
+        Pick and cache the best candidate of every uncached name in
+        `samples`, given the `trial()` results of `trial_jobs(samples)` as
+        {(name, candidate): (encoded, verified, mismatched)}. Returns {name: result}.
+        """
+        known = set(self.known())
+        todo = {name: candidates(name, known) for name in samples if name not in self.aliases()}
+        resolved, failed = {}, {}
+        for name, ranked in todo.items():
+            best = None
+            for rank, candidate in enumerate(ranked):
+                encoded, verified, mismatched = scores[name, candidate]
+                score = (verified > 0, encoded, -rank)
+                if encoded and not mismatched and (best is None or score > best[0]):
+                    best = (score, candidate, verified)
+            if best:
+                resolved[name] = {"protocol": best[1], "verified": best[2] > 0}
+            else:
+                # the samples may just be out of range, or a later alias table or
+                # pyIRDecoder may know the name; only this run skips it
+                failed[name] = None
+        if resolved:
+            self._save(resolved)
+        self.aliases().update(failed)
+        return {name: self.aliases().get(name) for name in samples}
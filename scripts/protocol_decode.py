@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Decode Tuya codes (or raw timings) to protocol parameters.
+
+Trying every pyIRDecoder decoder on a code is slow, so each protocol gets
+a cheap signature, built once per pyIRDecoder checkout by encoding a few
+parameter sets spread over its ranges:
+
+  lead     the first mark and space, when every sample starts the same
+           way (biphase protocols such as RC5 have no fixed leader)
+  length   the shortest and longest first frame, in timings
+  ratios   the distinct timings divided by the shortest one, which do not
+           depend on the carrier or a constant timing offset
+
+A code is only handed to the decoders of the protocols whose signature it
+fits, best leader match first. Protocols that could not be encoded have
+no signature and are tried only when no other protocol decodes the code.
+
+Usage:
+  protocol_decode.py CODE [CODE ...]          - Decode Tuya codes
+  protocol_decode.py --raw 9000 4500 ...      - Decode raw timings
+  protocol_decode.py -f learned.txt -j 4      - One code per line (or script 5 JSONL, a code store), in parallel
+"""
+
+import argparse
+import bisect
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import NamedTuple
+
+from code_store import CodeStore, is_store
+from irdb_common import CACHE_DIR, PROTOCOLS, encode_protocol, get_protocol
+from protocol_registry import pyirdecoder_fingerprint
+from reverse_index import first_frame
+from tuya_codec import FRAME_GAP, decode_ir, iter_decode_ir
+
+DECODE_SIGNATURES_PATH = os.path.join(CACHE_DIR, "decode_signatures.json")
+DEFAULT_TOLERANCE = 0.25    # learned codes are often 10-20% off
+RATIO_CLUSTER = 0.05        # timings this close (relative) count as one ratio
+LENGTH_SLACK = 2            # learned frames may lose or gain a timing at the edges
+PATTERNS = (0x5555_5555, 0xAAAA_AAAA)
+CHUNK_SIZE = 256            # codes per worker task
+
+
+class DecodedCode(NamedTuple):
+    protocol: str
+    device: int
+    sub_device: object      # None when the protocol has no sub_device
+    function: int
+
+
+def _samples(ranges):
+    """Parameter sets spread over `ranges` ({param: (low, high)}): all low, all high, middle and bit patterns."""
+    picks = [lambda lo, hi: lo, lambda lo, hi: hi, lambda lo, hi: (lo + hi) // 2]
+    picks += [lambda lo, hi, p=p: max(lo, p & hi) for p in PATTERNS]
+    for pick in picks:
+        yield {param: pick(lo, hi) for param, (lo, hi) in ranges.items()}
+
+def _ratios(frame):
+    """Distinct timings of `frame` divided by its shortest one, clustered."""
+    unit = min(frame)
+    ratios = []
+    for value in sorted(t / unit for t in frame):
+        if not ratios or value > ratios[-1][0] * (1 + RATIO_CLUSTER):
+            ratios.append([value, value])
+        else:
+            ratios[-1][1] = value
+    return [round((lo + hi) / 2, 3) for lo, hi in ratios]
+
+def build_signature(name):
+    """Signature of pyIRDecoder protocol `name`, or None if it encodes nothing."""
+    entry = PROTOCOLS.entry(name)
+    proto = get_protocol(name)
+    if not entry or not proto:
+        return None
+    ranges = {param[0]: (param[1], param[2]) for param in proto[0].encode_parameters
+              if param[0] in ("device", "sub_device", "function")}
+    frames = []
+    for params in _samples(ranges):
+        try:
+            rlc, _ = encode_protocol(name, entry, str(params.get("device", 0)),
+                                     str(params.get("sub_device", 0)), str(params.get("function", 0)))
+        except Exception:
+            continue
+        frame = first_frame(rlc) if rlc else None
+        if frame and min(frame) > 0:
+            frames.append(frame)
+    if not frames:
+        return None
+    leads = {tuple(frame[:2]) for frame in frames}
+    lengths = [len(frame) for frame in frames]
+    return {
+        "lead": list(leads.pop()) if len(leads) == 1 and len(frames[0]) > 2 else None,
+        "length": [min(lengths), max(lengths)],
+        "ratios": _ratios([t for frame in frames for t in frame]),
+    }
+
+
+def _close(value, expected, tolerance):
+    return abs(value - expected) <= tolerance * expected
+
+def _fits(signature, frame, ratios, tolerance):
+    """Leader deviation of `frame` from `signature`, or None if the frame cannot be that protocol."""
+    lo, hi = signature["length"]
+    slack = LENGTH_SLACK if lo == hi else max(LENGTH_SLACK, hi - lo)
+    if not lo - slack <= len(frame) <= hi + slack:
+        return None
+    deviation = 0.0
+    lead = signature["lead"]
+    if lead is not None:
+        if not (_close(frame[0], lead[0], tolerance) and _close(frame[1], lead[1], tolerance)):
+            return None
+        deviation = abs(frame[0] - lead[0]) / lead[0] + abs(frame[1] - lead[1]) / lead[1]
+    known = signature["ratios"]
+    for ratio in ratios:
+        i = bisect.bisect_left(known, ratio)
+        if not any(_close(ratio, known[j], tolerance) for j in (i - 1, i) if 0 <= j < len(known)):
+            return None
+    return deviation
+
+def _decode_with(name, signed):
+    """DecodedCode if `name`'s pyIRDecoder decoder accepts the signed timings, else None."""
+    proto = get_protocol(name)
+    decode = getattr(proto[0], "decode", None) if proto else None
+    if decode is None:
+        return None
+    try:
+        code = decode(signed)
+    except Exception:
+        return None
+    device, function = getattr(code, "device", None), getattr(code, "function", None)
+    if device is None or function is None:
+        return None
+    return DecodedCode(name, device, getattr(code, "sub_device", None) if proto[1] else None, function)
+
+
+class ProtocolDecoder:
+    """Protocol signatures, kept in a JSON file tagged with the pyIRDecoder fingerprint."""
+
+    def __init__(self, path=DECODE_SIGNATURES_PATH):
+        self.path = path
+        self._signatures = None
+
+    def signatures(self):
+        """{protocol: signature or None}; empty when pyIRDecoder is not installed."""
+        if self._signatures is None:
+            fingerprint = pyirdecoder_fingerprint()
+            if fingerprint is None:
+                self._signatures = {}
+                return self._signatures
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get("fingerprint") == fingerprint:
+                    self._signatures = data["signatures"]
+            except (OSError, ValueError, KeyError):
+                pass
+            if self._signatures is None:
+                self._signatures = {name: build_signature(name) for name in PROTOCOLS.names()}
+                self._save(fingerprint)
+        return self._signatures
+
+    def _save(self, fingerprint):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"fingerprint": fingerprint, "signatures": self._signatures}, f)
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            print(f"[WARNING] Could not save decode signatures: {exc}", file=sys.stderr)
+
+    def candidates(self, timings, tolerance=DEFAULT_TOLERANCE):
+        """Protocols whose signature the first frame of `timings` fits, best leader match first."""
+        frame = [abs(t) for t in first_frame(timings)]
+        if not frame or min(frame) == 0:
+            return []
+        ratios = _ratios(frame)
+        scored = []
+        for name, signature in self.signatures().items():
+            if signature is not None:
+                deviation = _fits(signature, frame, ratios, tolerance)
+                if deviation is not None:
+                    scored.append((deviation, name))
+        return [name for _, name in sorted(scored)]
+
+    def decode(self, timings, tolerance=DEFAULT_TOLERANCE, find_all=False):
+        """
+        DecodedCode for raw `timings` (the first protocol that decodes it,
+        or every one with `find_all`); an empty list if none does.
+        """
+        frame = first_frame(timings)
+        # the decoders expect one frame followed by its lead-out
+        gap = abs(timings[len(frame)]) if len(frame) < len(timings) else FRAME_GAP * 20
+        signed = [abs(t) if i % 2 == 0 else -abs(t) for i, t in enumerate(frame)] + [-gap]
+
+        found = []
+        for names in (self.candidates(timings, tolerance),
+                      [name for name, signature in self.signatures().items() if signature is None]):
+            for name in names:
+                result = _decode_with(name, signed)
+                if result is not None:
+                    found.append(result)
+                    if not find_all:
+                        return found
+            if found:
+                break
+        return found
+
+    def decode_code(self, code, tolerance=DEFAULT_TOLERANCE, find_all=False):
+        return self.decode(decode_ir(code), tolerance, find_all)
+
+
+DECODER = ProtocolDecoder()
+
+def _iter_decode(codes, tolerance, find_all):
+    """Yield (code, [DecodedCode], error) for Tuya codes, decoding them one at a time."""
+    for code, timings, err in iter_decode_ir(codes):
+        if err is not None:
+            yield code, [], str(err)
+            continue
+        try:
+            yield code, DECODER.decode(timings, tolerance, find_all), None
+        except ValueError as err:
+            yield code, [], str(err)
+
+def _decode_chunk(codes, tolerance, find_all):
+    """_iter_decode() of a list of codes as a list. Top level so it can run in a worker process."""
+    return list(_iter_decode(codes, tolerance, find_all))
+
+def decode_many(codes, tolerance=DEFAULT_TOLERANCE, find_all=False, workers=1):
+    """
+    Yield (code, [DecodedCode], error) for many Tuya codes, in order, using
+    `workers` processes. Codes are read and decoded CHUNK_SIZE at a time
+    with a bounded number of chunks in flight, so a dump of any size is
+    decoded in constant memory.
+    """
+    DECODER.signatures()  # build them once here rather than in every worker
+    if workers <= 1:
+        yield from _iter_decode(codes, tolerance, find_all)
+        return
+    codes = iter(codes)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while chunk := list(islice(codes, CHUNK_SIZE)):
+            pending.append(pool.submit(_decode_chunk, chunk, tolerance, find_all))
+            if len(pending) >= workers * 4:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def iter_code_file(path):
+    """Tuya codes from a file with one code per line, script 5 JSONL (the "tuya" field) or a code store."""
+    if is_store(path):
+        yield from (code for _, code in CodeStore.load(path).iter_codes())
+        return
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line).get("tuya") or ""
+            if line:
+                yield line
+
+def format_result(result):
+    sub_device = "" if result.sub_device is None else f" sub_device {result.sub_device}"
+    return f"{result.protocol} device {result.device}{sub_device} function {result.function}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode Tuya codes or raw timings to protocol parameters.")
+    parser.add_argument("code", nargs="*", help="Tuya codes, or timings with --raw")
+    parser.add_argument("--raw", action="store_true", help="the arguments are raw timings")
+    parser.add_argument("-f", "--file", help="file with one Tuya code per line, script 5 JSONL or a code store")
+    parser.add_argument("-t", "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"largest relative timing deviation when pruning protocols (default {DEFAULT_TOLERANCE})")
+    parser.add_argument("-a", "--all", action="store_true", help="list every protocol that decodes the code")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="worker processes for many codes")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per code")
+    args = parser.parse_args()
+    if not args.code and not args.file:
+        parser.error("give codes, --raw timings or -f FILE")
+    if pyirdecoder_fingerprint() is None:
+        print("[ERROR] pyIRDecoder is not installed; run setup.sh first.")
+        sys.exit(1)
+
+    if args.raw:
+        try:
+            timings = [int(t) for arg in args.code for t in arg.replace(",", " ").split()]
+        except ValueError:
+            parser.error("--raw needs integer timings")
+        results = [(" ".join(args.code), DECODER.decode(timings, args.tolerance, args.all), None)]
+    else:
+        codes = iter_code_file(args.file) if args.file else args.code
+        results = decode_many(codes, args.tolerance, args.all, args.workers)
+
+    decoded = 0
+    try:
+        for code, found, error in results:
+            decoded += bool(found)
+            if args.json:
+                print(json.dumps({"code": code, "decoded": [r._asdict() for r in found], "error": error}))
+            elif error:
+                print(f"{code}: [ERROR] {error}")
+            elif not found:
+                print(f"{code}: no protocol decodes it")
+            else:
+                print(f"{code}: {'; '.join(format_result(r) for r in found)}")
+    except (OSError, ValueError) as err:
+        # reading the code file, which is streamed
+        print(f"[ERROR] {err}")
+        sys.exit(1)
+    if not decoded:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
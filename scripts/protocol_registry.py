@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Lazy registry of pyIRDecoder protocols.
+
+Importing `pyIRDecoder.protocols` pulls in every protocol module, which
+dominates the start-up time of short script runs. The registry keeps a
+manifest of protocol names, their modules and sub_device support, built
+once per pyIRDecoder checkout, and imports only the modules actually used.
+"""
+
+import functools
+import hashlib
+import importlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import sys
+import types
+
+PYIRDECODER_PATH = os.path.expanduser("~/irdb_to_tuya/pyIRDecoder")
+sys.path.insert(0, PYIRDECODER_PATH)
+
+PACKAGE = "pyIRDecoder.protocols"
+
+
+def pyirdecoder_dir():
+    """Directory of the pyIRDecoder package, found without importing it."""
+    spec = importlib.util.find_spec("pyIRDecoder")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return list(spec.submodule_search_locations)[0]
+
+@functools.lru_cache(maxsize=None)
+def pyirdecoder_fingerprint():
+    """Hash of the pyIRDecoder checkout (file names, sizes, mtimes)."""
+    package_dir = pyirdecoder_dir()
+    if package_dir is None:
+        return None
+    digest = hashlib.sha1()
+    for rootdir, dirs, files in os.walk(package_dir):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.endswith(".py"):
+                path = os.path.join(rootdir, fname)
+                st = os.stat(path)
+                digest.update(f"{os.path.relpath(path, package_dir)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def supports_sub_device(proto_obj):
+    return hasattr(proto_obj, 'encode_parameters') and any(
+        param[0] == 'sub_device' for param in proto_obj.encode_parameters
+    )
+
+
+class ProtocolRegistry:
+    def __init__(self, manifest_path, fallback_names=()):
+        self.manifest_path = manifest_path
+        self.fallback_names = list(fallback_names)
+        self._manifest = None
+        self._classes = {}
+        self._package = None
+        self._stubs = []
+
+    # --- full import (slow path) -------------------------------------------
+
+    def load_package(self):
+        """Import the whole pyIRDecoder.protocols package."""
+        if self._package is None:
+            self._drop_stubs()
+            try:
+                import pyIRDecoder.protocols as protocols
+            except ImportError as err:
+                print("[FATAL] Could NOT import pyIRDecoder.protocols. Check folder structure and PYTHONPATH.")
+                print("Details:", err)
+                sys.exit(1)
+            self._package = protocols
+        return self._package
+
+    # --- manifest ------------------------------------------------------------
+
+    def manifest(self):
+        """{name: {"module": ..., "sub_device": bool}}, rebuilt when pyIRDecoder changes."""
+        if self._manifest is None:
+            fingerprint = pyirdecoder_fingerprint()
+            if fingerprint is None:
+                self.load_package()  # reports the missing checkout and exits
+            try:
+                with open(self.manifest_path) as f:
+                    data = json.load(f)
+                if data.get("fingerprint") == fingerprint:
+                    self._manifest = data["protocols"]
+            except (OSError, ValueError, KeyError):
+                pass
+            if self._manifest is None:
+                self._manifest = self._build_manifest()
+                self._save_manifest(fingerprint)
+        return self._manifest
+
+    def _build_manifest(self):
+        protocols = self.load_package()
+        manifest = {}
+        for name in dir(protocols):
+            cls = getattr(protocols, name)
+            if name.startswith("_") or not isinstance(cls, type) or not hasattr(cls, "encode"):
+                continue
+            try:
+                proto_obj = cls(parent=None)
+            except Exception:
+                continue
+            if not getattr(proto_obj, "encode_parameters", None):
+                continue  # base classes
+            self._classes[name] = cls
+            manifest[name] = {"module": cls.__module__, "sub_device": supports_sub_device(proto_obj)}
+        return manifest
+
+    def _save_manifest(self, fingerprint):
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"fingerprint": fingerprint, "protocols": self._manifest}, f)
+            os.replace(tmp, self.manifest_path)
+        except OSError as exc:
+            print(f"[WARNING] Could not save protocol manifest: {exc}", file=sys.stderr)
+
+    def names(self):
+        """Sorted protocol names; the static list when pyIRDecoder is not installed."""
+        if pyirdecoder_fingerprint() is None:
+            return self.fallback_names
+        return sorted(self.manifest(), key=str.lower)
+
+    def entry(self, name):
+        return self.manifest().get(name)
+
+    # --- lazy class loading ----------------------------------------------------
+
+    def get_class(self, name):
+        """Protocol class for `name`, or None. Imports only its own module when possible."""
+        if name not in self._classes:
+            entry = self.entry(name)
+            cls = None
+            if entry is not None:
+                if self._package is None:
+                    cls = self._import_alone(entry["module"], name)
+                if cls is None:
+                    cls = getattr(self.load_package(), name, None)
+            self._classes[name] = cls
+        return self._classes[name]
+
+    def _import_alone(self, module_name, name):
+        """
+        Import one protocol module without running the package __init__
+        files, by registering bare package modules for its parents. Returns
+        None (and undoes the stubs) if the module needs the full package.
+        """
+        try:
+            package_dir = os.path.dirname(pyirdecoder_dir())
+            parts = module_name.split(".")
+            for i in range(1, len(parts)):
+                pkg = ".".join(parts[:i])
+                if pkg in sys.modules:
+                    continue
+                stub = types.ModuleType(pkg)
+                stub.__path__ = [os.path.join(package_dir, *parts[:i])]
+                stub.__package__ = pkg
+                stub.__spec__ = importlib.machinery.ModuleSpec(pkg, None, is_package=True)
+                stub.__spec__.submodule_search_locations = stub.__path__
+                sys.modules[pkg] = stub
+                self._stubs.append(pkg)
+            return getattr(importlib.import_module(module_name), name)
+        except Exception:
+            self._drop_stubs(purge=True)
+            return None
+
+    def _drop_stubs(self, purge=False):
+        """Remove the bare packages (and, with `purge`, modules loaded under them)."""
+        for pkg in self._stubs:
+            sys.modules.pop(pkg, None)
+            if purge:
+                for mod in [m for m in sys.modules if m.startswith(pkg + ".")]:
+                    sys.modules.pop(mod, None)
+        self._stubs = []
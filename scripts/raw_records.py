@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Binary interchange format for raw timing records between the IRDB and
+Tuya stages (3_bulk_irdb_to_raw.py -> 4_bulk_raw_to_tuya.py).
+
+File layout (all integers little-endian):
+
+  magic    8 bytes  b"IRRAW\\x00\\x00\\x01" (last byte is the format version)
+  records, each:
+    uint32  record size in bytes, excluding this field
+    uint16  brand, csv_file, function, protocol lengths
+    uint32  timing count
+    utf-8   brand, csv_file, function, protocol
+    0/1     padding byte so the timings start on an even offset
+    uint16  timings (clamped to 65535, like the Tuya encoder does)
+
+The timings are already the payload the Tuya compressor takes, so a reader
+can hand them over straight from an mmap without parsing or repacking.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterator, NamedTuple
+
+VERSION = 1
+MAGIC = b"IRRAW\x00\x00" + bytes([VERSION])
+_HEADER = struct.Struct("<IHHHHI")
+
+
+class RawRecord(NamedTuple):
+    brand: str
+    csv_file: str
+    function: str
+    protocol: str
+    payload: memoryview     # packed <H timings, a view into the source buffer
+
+    @property
+    def timings(self) -> list[int]:
+        values = array('H')
+        values.frombytes(self.payload)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tolist()
+
+
+class RawRecordWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+        stream.write(MAGIC)
+
+    def write(self, brand, csv_file, function, protocol, timings):
+        strings = [s.encode("utf-8") for s in (brand, csv_file, function, protocol)]
+        values = array('H', [min(abs(t), 65535) for t in timings])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        text = b"".join(strings)
+        # records start on even offsets, so pad the strings to an even length
+        padding = b"\x00" * (len(text) % 2)
+        body_size = _HEADER.size - 4 + len(text) + len(padding) + 2 * len(values)
+        self.stream.write(_HEADER.pack(body_size, *map(len, strings), len(values)))
+        self.stream.write(text)
+        self.stream.write(padding)
+        self.stream.write(values.tobytes())
+        self.count += 1
+
+
+def iter_records(buffer) -> Iterator[RawRecord]:
+    """Yield the records of an in-memory or mmap'd buffer without copying the timings."""
+    view = memoryview(buffer)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a raw timing file (bad magic or unsupported version)")
+    pos = len(MAGIC)
+    end = len(view)
+    while pos < end:
+        if pos + _HEADER.size > end:
+            raise ValueError(f"truncated record header at offset {pos}")
+        size, *lengths, count = _HEADER.unpack_from(view, pos)
+        record_end = pos + 4 + size
+        if record_end > end:
+            raise ValueError(f"truncated record at offset {pos}")
+        offset = pos + _HEADER.size
+        strings = []
+        for length in lengths:
+            strings.append(str(view[offset:offset + length], "utf-8"))
+            offset += length
+        offset += offset % 2
+        yield RawRecord(*strings, view[offset:offset + 2 * count])
+        pos = record_end
+
+
+def open_records(path) -> Iterator[RawRecord]:
+    """
+    mmap `path` and iterate its records. The mapping is released once the
+    iterator and every yielded payload view are gone.
+    """
+    with open(path, "rb") as f:
+        if not f.seek(0, 2):
+            raise ValueError(f"{path} is empty")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return iter_records(mm)
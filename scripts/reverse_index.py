@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Reverse lookup from a Tuya code (or raw timings) to IRDB keys.
+
+Built from the JSONL output of 5_batch_irdb_to_tuya.py. Every key is
+reduced to its first frame (up to the first long space), since learned
+codes usually carry a different number of repeats. The frame is indexed
+two ways:
+
+  exact      a hash of the frame after timing normalization and log-scale
+             quantization, kept as a sorted uint64 array for binary search
+  tolerance  the frame timings themselves, grouped by frame length, so a
+             query compares against one contiguous block of equal-length
+             frames (vectorized with NumPy when it is installed)
+
+The index is a single file that is memory-mapped on open, so a lookup
+touches only the hashes it bisects and the one length group it scans.
+
+Usage:
+  reverse_index.py build codes.jsonl [...]       - Build from script 5 output (or stdin)
+  reverse_index.py lookup CODE [-t TOL] [-n N]   - Look up a Tuya code
+  reverse_index.py lookup --raw 9000 4500 ...    - Look up raw timings
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import NamedTuple
+
+from irdb_common import CACHE_DIR
+from timing_normalize import normalize_timings
+from tuya_codec import FRAME_GAP, TuyaCodeError, decode_ir, numpy_module
+
+REVERSE_INDEX_PATH = os.path.join(CACHE_DIR, "reverse_index.bin")
+
+VERSION = 2
+MAGIC = b"IRREV\x00\x00" + bytes([VERSION])
+_HEADER = struct.Struct("<IIII")    # entries, groups, timings, label bytes
+_GROUP = struct.Struct("<IIII")     # frame length, first entry, entries, timing offset
+QUANT_STEP = 0.1                    # width of a fingerprint bucket, relative
+DEFAULT_TOLERANCE = 0.2             # learned codes are often 10-20% off
+LABEL_FIELDS = ("brand", "csv_file", "function", "protocol", "device", "subdevice", "function_code")
+
+
+class Match(NamedTuple):
+    score: float        # mean relative deviation per timing, 0.0 for exact matches
+    brand: str
+    csv_file: str
+    function: str
+    protocol: str
+    device: str
+    subdevice: str
+    function_code: str
+
+
+def first_frame(timings):
+    """Timings up to the first long space (exclusive), or without the trailing gap."""
+    for i in range(1, len(timings), 2):
+        if timings[i] >= FRAME_GAP:
+            return list(timings[:i])
+    return list(timings[:-1] if len(timings) % 2 == 0 else timings)
+
+def fingerprint(frame) -> int:
+    step = math.log1p(QUANT_STEP)
+    buckets = array('H', (round(math.log(max(t, 1)) / step) for t in normalize_timings(frame)))
+    return int.from_bytes(hashlib.blake2b(buckets.tobytes(), digest_size=8).digest(), "little")
+
+
+# --- building -----------------------------------------------------------------
+
+def build_index(records, path=REVERSE_INDEX_PATH):
+    """Write an index of `records` (dicts with "raw" and the label fields). Returns the entry count."""
+    entries = []
+    for record in records:
+        raw = record.get("raw")
+        if not raw:
+            continue
+        frame = [min(abs(t), 65535) for t in first_frame(raw)]
+        if frame:
+            label = "\t".join(str(record.get(f) or "") for f in LABEL_FIELDS)
+            entries.append((len(frame), frame, label))
+    entries.sort(key=lambda e: e[0])
+
+    groups, timings = [], array('H')
+    hashes, label_offsets, labels = [], array('I', [0]), bytearray()
+    for i, (length, frame, label) in enumerate(entries):
+        if not groups or groups[-1][0] != length:
+            groups.append([length, i, 0, len(timings)])
+        groups[-1][2] += 1
+        timings.extend(frame)
+        hashes.append((fingerprint(frame), i))
+        labels += label.encode("utf-8")
+        label_offsets.append(len(labels))
+    hashes.sort()
+    if sys.byteorder == 'big':
+        timings.byteswap()
+        label_offsets.byteswap()
+    hash_values = struct.pack(f"<{len(hashes)}Q", *(h for h, _ in hashes))
+    hash_ids = struct.pack(f"<{len(hashes)}I", *(i for _, i in hashes))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(len(entries), len(groups), len(timings), len(labels)))
+        for group in groups:
+            f.write(_GROUP.pack(*group))
+        f.write(hash_values)
+        f.write(hash_ids)
+        f.write(label_offsets.tobytes())
+        f.write(timings.tobytes())
+        f.write(labels)
+    os.replace(tmp, path)
+    return len(entries)
+
+
+# --- querying -----------------------------------------------------------------
+
+class ReverseIndex:
+    def __init__(self, path=REVERSE_INDEX_PATH):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mm)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a reverse index (bad magic or unsupported version)")
+        if sys.byteorder == 'big':
+            raise ValueError("reverse index lookups need a little-endian host")
+        pos = len(MAGIC)
+        self.count, group_count, timing_count, label_bytes = _HEADER.unpack_from(view, pos)
+        pos += _HEADER.size
+        self.groups = {}
+        for _ in range(group_count):
+            length, first, count, offset = _GROUP.unpack_from(view, pos)
+            self.groups[length] = (first, count, offset)
+            pos += _GROUP.size
+        # the sections are laid out so each cast below is aligned
+        self.hashes = view[pos:pos + 8 * self.count].cast('Q')
+        pos += 8 * self.count
+        self.hash_ids = view[pos:pos + 4 * self.count].cast('I')
+        pos += 4 * self.count
+        self.label_offsets = view[pos:pos + 4 * (self.count + 1)].cast('I')
+        pos += 4 * (self.count + 1)
+        self.timings_offset = pos
+        self.timings = view[pos:pos + 2 * timing_count].cast('H')
+        pos += 2 * timing_count
+        self.labels = view[pos:pos + label_bytes]
+
+    def label(self, entry):
+        start, end = self.label_offsets[entry], self.label_offsets[entry + 1]
+        return str(self.labels[start:end], "utf-8").split("\t")
+
+    def exact(self, frame):
+        """Entries whose fingerprint equals that of `frame`."""
+        key = fingerprint(frame)
+        i = bisect.bisect_left(self.hashes, key)
+        entries = []
+        while i < self.count and self.hashes[i] == key:
+            entries.append(self.hash_ids[i])
+            i += 1
+        return sorted(entries)
+
+    def nearest(self, frame, tolerance=DEFAULT_TOLERANCE, limit=10):
+        """
+        [(score, entry)] of equal-length frames with every timing within
+        `tolerance` (relative) of the query, best (lowest mean deviation) first.
+        """
+        group = self.groups.get(len(frame))
+        if group is None:
+            return []
+        first, count, offset = group
+        n = len(frame)
+        np = numpy_module()
+        if np is not None:
+            block = np.frombuffer(self.mm, dtype='<u2', count=count * n,
+                                  offset=self.timings_offset + 2 * offset).reshape(count, n)
+            query = np.asarray(frame, dtype=np.float32)
+            block = block.astype(np.float32)
+            deviation = np.abs(block - query) / np.maximum(np.maximum(block, query), 1)
+            ok = np.flatnonzero(deviation.max(axis=1) <= tolerance)
+            scores = deviation[ok].mean(axis=1)
+            return [(float(scores[j]), first + int(ok[j]))
+                    for j in np.argsort(scores, kind="stable")[:limit]]
+        found = []
+        for row in range(count):
+            start = offset + row * n
+            total = 0.0
+            for a, b in zip(frame, self.timings[start:start + n]):
+                dev = abs(a - b) / max(a, b, 1)
+                if dev > tolerance:
+                    break
+                total += dev
+            else:
+                found.append((total / n, first + row))
+        found.sort()
+        return found[:limit]
+
+    def lookup(self, timings, tolerance=DEFAULT_TOLERANCE, limit=10):
+        """
+        Candidate IRDB keys for raw `timings`: exact fingerprint matches
+        first (score 0.0), then tolerance matches. Pass tolerance=None for
+        exact matches only.
+        """
+        frame = [min(abs(t), 65535) for t in first_frame(timings)]
+        if not frame:
+            return []
+        seen = set()
+        results = []
+        for entry in self.exact(frame):
+            seen.add(entry)
+            results.append((0.0, entry))
+        if tolerance is not None:
+            results += [(score, entry) for score, entry in self.nearest(frame, tolerance, limit + len(seen))
+                        if entry not in seen]
+        return [Match(score, *self.label(entry)) for score, entry in results[:limit]]
+
+    def lookup_code(self, code, tolerance=DEFAULT_TOLERANCE, limit=10):
+        return self.lookup(decode_ir(code), tolerance, limit)
+
+
+def iter_jsonl(paths):
+    files = [open(p) for p in paths] if paths else [sys.stdin]
+    for f in files:
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the IRDB keys a Tuya code or raw timing belongs to.")
+    parser.add_argument("--index", default=REVERSE_INDEX_PATH, help=f"index file (default {REVERSE_INDEX_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the index from 5_batch_irdb_to_tuya.py JSONL output")
+    build.add_argument("files", nargs="*", help="JSONL files (default: stdin)")
+    lookup = sub.add_parser("lookup", help="look up a Tuya code, or raw timings with --raw")
+    lookup.add_argument("code", nargs="*", help="Tuya code, or timings with --raw")
+    lookup.add_argument("--raw", action="store_true", help="the arguments are raw timings")
+    lookup.add_argument("-t", "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"largest relative deviation per timing (default {DEFAULT_TOLERANCE})")
+    lookup.add_argument("--exact", action="store_true", help="only exact fingerprint matches")
+    lookup.add_argument("-n", "--limit", type=int, default=10, help="most candidates to show")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(iter_jsonl(args.files), args.index)
+        print(f"Indexed {count} keys in {args.index}")
+        return
+
+    try:
+        index = ReverseIndex(args.index)
+    except (OSError, ValueError) as err:
+        print(f"[ERROR] {err}")
+        print("Build the index first: reverse_index.py build all_codes.jsonl")
+        sys.exit(1)
+    tolerance = None if args.exact else args.tolerance
+    try:
+        if args.raw:
+            timings = [int(t) for arg in args.code for t in arg.replace(",", " ").split()]
+            matches = index.lookup(timings, tolerance, args.limit)
+        else:
+            matches = index.lookup_code("".join(args.code), tolerance, args.limit)
+    except (TuyaCodeError, ValueError) as err:
+        print(f"[ERROR] {err}")
+        sys.exit(1)
+    if not matches:
+        print("No matching IRDB keys.")
+        sys.exit(1)
+    for m in matches:
+        kind = "exact" if m.score == 0.0 else f"{m.score:.1%} off"
+        print(f"{kind:>10}  {m.brand} / {m.csv_file} / {m.function}  "
+              f"({m.protocol} {m.device},{m.subdevice},{m.function_code})")
+
+if __name__ == "__main__":
+    main()
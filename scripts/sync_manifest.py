@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Manifest of converted IRDB CSV files for incremental syncs.
+
+For every CSV under the codes tree it records the file's stat, content
+hash and the records 5_batch_irdb_to_tuya.py produced from it. A sync only
+reconverts files that were added or whose content changed, and forgets
+files that disappeared. Files stored with `retry` (rows that timed out or
+crashed) keep their records but are reconverted on the next sync. The manifest is tagged with the conversion
+settings (compression level, protocol override, normalization, encoder
+and pyIRDecoder versions); when they change, everything is reconverted.
+"""
+
+import json
+import os
+import sqlite3
+
+from irdb_common import CACHE_DIR, get_csv_files
+from irdb_index import file_sha1
+
+SYNC_MANIFEST_PATH = os.path.join(CACHE_DIR, "sync_manifest.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    brand TEXT,
+    csv_file TEXT,
+    mtime_ns INTEGER,
+    size INTEGER,
+    sha1 TEXT,
+    records TEXT,
+    PRIMARY KEY (brand, csv_file)
+);
+"""
+
+
+class SyncManifest:
+    def __init__(self, base_dir, settings, path=SYNC_MANIFEST_PATH):
+        self.base_dir = base_dir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.executescript(SCHEMA)
+        self.pending = {}
+        tag = json.dumps(settings, sort_keys=True)
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'settings'").fetchone()
+        if row is None or row[0] != tag:
+            self.db.execute("DELETE FROM files")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (tag,))
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def plan(self, brands, all_brands=False):
+        """
+        Compare `brands` on disk against the manifest. Returns
+        (changed, unchanged, stale): the (brand, csv_file) pairs to convert,
+        the number that can be reused and the pairs that no longer exist.
+        With `all_brands`, brands missing from disk are stale too.
+        """
+        changed, unchanged, stale = [], 0, []
+        for brand in brands:
+            known = {
+                csv_file: (mtime_ns, size, sha1)
+                for csv_file, mtime_ns, size, sha1 in self.db.execute(
+                    "SELECT csv_file, mtime_ns, size, sha1 FROM files WHERE brand = ?", (brand,))
+            }
+            brand_path = os.path.join(self.base_dir, brand)
+            for csv_file in sorted(get_csv_files(brand_path)):
+                path = os.path.join(brand_path, csv_file)
+                st = os.stat(path)
+                old = known.pop(csv_file, None)
+                if old and old[2] is not None and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+                    unchanged += 1
+                    continue
+                sha1 = file_sha1(path)
+                if old and old[2] is not None and old[2] == sha1:
+                    self.db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE brand = ? AND csv_file = ?",
+                                    (st.st_mtime_ns, st.st_size, brand, csv_file))
+                    unchanged += 1
+                    continue
+                # remember what was read now; a later edit is picked up next sync
+                self.pending[brand, csv_file] = (st.st_mtime_ns, st.st_size, sha1)
+                changed.append((brand, csv_file))
+            stale += [(brand, csv_file) for csv_file in known]
+        if all_brands:
+            stale += self.db.execute(
+                f"SELECT brand, csv_file FROM files WHERE brand NOT IN ({','.join('?' * len(brands))})",
+                list(brands)).fetchall()
+        self.db.commit()
+        return changed, unchanged, stale
+
+    def store(self, brand, csv_file, records, retry=False):
+        """Store the records of a converted file; with `retry` it is converted again on the next sync."""
+        mtime_ns, size, sha1 = self.pending.pop((brand, csv_file))
+        if retry:
+            sha1 = None
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                        (brand, csv_file, mtime_ns, size, sha1, json.dumps(records)))
+
+    def drop(self, pairs):
+        self.db.executemany("DELETE FROM files WHERE brand = ? AND csv_file = ?", pairs)
+
+    def commit(self):
+        self.db.commit()
+
+    def iter_records(self, brands):
+        """Stored records of `brands`, ordered by brand and CSV file."""
+        for brand in sorted(brands):
+            for (records,) in self.db.execute(
+                    "SELECT records FROM files WHERE brand = ? ORDER BY csv_file", (brand,)):
+                yield from json.loads(records)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Snap jittered raw timings to a few canonical durations before compression.
+
+Protocol encoders (and captured codes) give slightly different durations
+for what is the same pulse or space: 560, 564, 571, ... The Tuya
+compressor only finds back-references on identical bytes, so every
+jittered value breaks a match. Clustering the durations of a signal and
+replacing each one with its cluster's most common value brings the
+repeats back while keeping every timing within `tolerance` of the
+original. Marks (even indexes) and spaces (odd indexes) are clustered
+separately: a 560 us mark and a 600 us space are different things, and
+snapping one to the other would shift the signal's edges.
+"""
+
+from collections import Counter
+
+DEFAULT_TOLERANCE = 0.1   # IR receivers accept far more than 10% deviation
+VERSION = 2               # bump when normalize_timings() output changes
+
+
+def duration_clusters(timings, tolerance=DEFAULT_TOLERANCE) -> dict[int, int]:
+    """
+    Map every distinct duration in `timings` to its canonical value.
+
+    Durations are binned in ascending order; a bin spans at most
+    `tolerance` above its shortest member, and its canonical value is its
+    most frequent member (the shorter one on ties).
+    """
+    if not 0 <= tolerance < 1:
+        raise ValueError(f"tolerance must be in [0, 1), got {tolerance}")
+    counts = Counter(timings)
+    mapping = {}
+    cluster = []
+    for value in sorted(counts):
+        if cluster and value > cluster[0] * (1 + tolerance):
+            canonical = max(cluster, key=counts.__getitem__)
+            mapping.update(dict.fromkeys(cluster, canonical))
+            cluster = []
+        cluster.append(value)
+    if cluster:
+        canonical = max(cluster, key=counts.__getitem__)
+        mapping.update(dict.fromkeys(cluster, canonical))
+    return mapping
+
+def normalize_timings(timings, tolerance=DEFAULT_TOLERANCE) -> list[int]:
+    """Return `timings` with each mark and space replaced by its canonical value."""
+    normalized = list(timings)
+    for start in (0, 1):
+        mapping = duration_clusters(timings[start::2], tolerance)
+        normalized[start::2] = [mapping[t] for t in timings[start::2]]
+    return normalized
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Small blocking client for tuya_service.py, usable from scripts and shell:
+
+  tuya_client.py encode 9024 4512 564 564 ...
+  tuya_client.py decode BUAjoBE0AsABAZwG...
+  tuya_client.py irdb NEC 0 -1 12
+  tuya_client.py metrics
+
+The connection is kept open between calls on the same client.
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import sys
+
+from tuya_codec import LEVELS
+from tuya_service import DEFAULT_HOST, DEFAULT_PORT
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class TuyaClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=30):
+        if socket_path:
+            self.conn = UnixHTTPConnection(socket_path, timeout)
+        else:
+            self.conn = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload) if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in (1, 2):
+            try:
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                data = json.loads(response.read() or b"{}")
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # the server dropped an idle keep-alive connection; retry once
+                self.conn.close()
+                if attempt == 2:
+                    raise
+        if response.status != 200:
+            raise ServiceError(response.status, data.get("error", response.reason))
+        return data
+
+    def encode(self, timings, level=2, normalize=None):
+        payload = {"timings": list(timings), "level": level}
+        if normalize is not None:
+            payload["normalize"] = normalize
+        return self.request("POST", "/encode", payload)["code"]
+
+    def decode(self, code):
+        return self.request("POST", "/decode", {"code": code})["timings"]
+
+    def irdb(self, protocol, device=0, subdevice=-1, function=0, level=2):
+        """Return (raw timings, Tuya code) for one IRDB key."""
+        data = self.request("POST", "/irdb", {"protocol": protocol, "device": device,
+                                              "subdevice": subdevice, "function": function,
+                                              "level": level})
+        return data["raw"], data["code"]
+
+    def metrics(self):
+        return self.request("GET", "/metrics")
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a running tuya_service.py.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", help="Unix socket of the service")
+    parser.add_argument("-l", "--level", type=int, choices=LEVELS, default=2, help="Tuya compression level")
+    sub = parser.add_subparsers(dest="command", required=True)
+    encode = sub.add_parser("encode", help="raw timings to a Tuya code")
+    encode.add_argument("timings", nargs="+", type=int)
+    encode.add_argument("-n", "--normalize", type=float, metavar="TOLERANCE")
+    decode = sub.add_parser("decode", help="Tuya code to raw timings")
+    decode.add_argument("code")
+    irdb = sub.add_parser("irdb", help="IRDB key to raw timings and a Tuya code")
+    irdb.add_argument("protocol")
+    irdb.add_argument("device", type=int)
+    irdb.add_argument("subdevice", type=int)
+    irdb.add_argument("function", type=int)
+    sub.add_parser("metrics", help="per-endpoint latency and batch statistics")
+    args = parser.parse_args()
+
+    client = TuyaClient(args.host, args.port, args.socket)
+    try:
+        if args.command == "encode":
+            print(client.encode(args.timings, args.level, args.normalize))
+        elif args.command == "decode":
+            print(client.decode(args.code))
+        elif args.command == "irdb":
+            raw, code = client.irdb(args.protocol, args.device, args.subdevice, args.function, args.level)
+            print(f"Raw Timing: {raw}")
+            print(f"Tuya Code : {code}")
+        else:
+            print(json.dumps(client.metrics(), indent=2))
+    except ServiceError as err:
+        print(f"[ERROR] {err.message}")
+        sys.exit(1)
+    except OSError as err:
+        print(f"[ERROR] Could not reach the service: {err}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Tuya IR code codec shared by the conversion scripts.
+
+Tuya blasters (ZS06/ZS08/TS1201/UFO-11) take a base64 string holding a
+little-endian uint16 list of microsecond timings, packed with a small
+LZ77-style block format. Based on the compression script by mildsunrise.
+"""
+
+import io
+import sys
+import atexit
+import base64
+import binascii
+import hashlib
+from array import array
+from itertools import chain
+from typing import Iterable, Iterator
+
+import instrument
+from disk_lru import DiskLRU
+
+ENCODER_VERSION = "5"   # bump when compress() output changes for a level
+WINDOW = 2**13          # largest back-reference distance a block can hold
+MAX_LENGTH = 255 + 9    # longest back-reference a block can hold
+MIN_LENGTH = 3          # shorter matches cost more than literals
+FRAME_GAP = 5000        # a space this long (us) ends an IR frame
+FRAME_LOOKBACK = 8      # earlier frames compared when pairing repeats
+FAST_CHAIN = 8          # positions level 1 keeps per key
+FAST_TAIL = 4           # bytes at the end of a match that level 1 indexes
+NUMPY_MIN_BYTES = 512   # below this the NumPy call overhead outweighs the win
+
+
+class CodeCache(DiskLRU):
+    """
+    Tuya codes keyed by a hash of the packed `<H` payload and compression
+    level, so identical signals are only compressed once. In memory by
+    default; set `path` to keep the codes between runs.
+    """
+
+    table = "tuya_codes"
+
+    def version(self):
+        return ENCODER_VERSION
+
+    def db_key(self, key):
+        return key.hex()
+
+    def dumps(self, code):
+        return code.encode('ascii')
+
+    def loads(self, blob):
+        return blob.decode('ascii')
+
+CODE_CACHE = CodeCache()
+atexit.register(CODE_CACHE.flush)
+
+def payload_key(payload: bytes, level: int) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(bytes((level,)))
+    digest.update(payload)
+    return digest.digest()
+
+
+class TuyaCodeError(ValueError):
+    """
+    A malformed Tuya code. `reason` is a short machine-readable tag
+    ('base64', 'truncated_literal', 'truncated_distance', 'bad_distance',
+    'odd_length'); `offset` is the byte offset in the compressed payload
+    where decoding stopped, when known.
+    """
+
+    def __init__(self, reason, message, offset=None):
+        super().__init__(message)
+        self.reason = reason
+        self.offset = offset
+
+
+def decode_ir(code: str) -> list[int]:
+    """Raises TuyaCodeError for anything that is not a well-formed Tuya code."""
+    try:
+        data = base64.decodebytes(code.encode('ascii'))
+    except (binascii.Error, UnicodeEncodeError) as exc:
+        raise TuyaCodeError('base64', f'not valid base64: {exc}') from None
+    payload = decompress(data)
+    if len(payload) % 2:
+        raise TuyaCodeError('odd_length', f'garbage in decompressed payload: {payload[-1:].hex()}')
+    signal = array('H')
+    signal.frombytes(payload)
+    if sys.byteorder == 'big':
+        signal.byteswap()
+    return signal.tolist()
+
+def iter_decode_ir(codes: Iterable[str]) -> Iterator[tuple[str, list[int], TuyaCodeError]]:
+    """
+    Lazily decode an iterable of Tuya codes (e.g. the lines of a dump file),
+    so only one code is held in memory at a time. Yields (code, timings,
+    error) for each stripped code: a malformed code gives timings None and
+    its TuyaCodeError rather than ending the stream.
+    """
+    for code in codes:
+        code = code.strip()
+        try:
+            yield code, decode_ir(code), None
+        except TuyaCodeError as err:
+            yield code, None, err
+
+_numpy = None
+
+def numpy_module():
+    """NumPy if installed, else None. Imported on first use: it is slow to load."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+def pack_signals(signals: list[list[int]]) -> tuple[bytes, list[int]]:
+    """
+    Pack a ragged batch of timings into one little-endian uint16 buffer,
+    taking absolute values and clamping anything over 65535. Signal i is
+    buffer[offsets[i]:offsets[i + 1]]. Uses NumPy when it is installed.
+    """
+    lengths = [len(signal) for signal in signals]
+    offsets = [0]
+    for length in lengths:
+        offsets.append(offsets[-1] + 2 * length)
+
+    np = numpy_module() if offsets[-1] >= NUMPY_MIN_BYTES else None
+    if np is not None:
+        try:
+            flat = np.fromiter(chain.from_iterable(signals), dtype=np.int64, count=offsets[-1] // 2)
+        except OverflowError:
+            pass    # a timing beyond int64; the array path below clamps Python ints of any size
+        else:
+            # clip before abs(): abs() of the most negative int64 is itself
+            np.clip(flat, -65535, 65535, out=flat)
+            np.abs(flat, out=flat)
+            return flat.astype('<u2').tobytes(), offsets
+
+    timings = array('H', [min(abs(t), 65535) for signal in signals for t in signal])
+    if sys.byteorder == 'big':
+        timings.byteswap()
+    return timings.tobytes(), offsets
+
+def encode_ir(signal: list[int], compression_level=2, cache=None) -> str:
+    return encode_ir_batch([signal], compression_level, cache)[0]
+
+def encode_ir_batch(signals: list[list[int]], compression_level=2, cache=None) -> list[str]:
+    """
+    Encode several signals at once. They are packed into one buffer and
+    each one is handed to the compressor as a zero-copy view into it.
+    """
+    with instrument.timer("pack"):
+        buffer, offsets = pack_signals(signals)
+    view = memoryview(buffer)
+    return [encode_payload(view[start:end], compression_level, cache)
+            for start, end in zip(offsets, offsets[1:])]
+
+def encode_payload(payload: bytes, compression_level=2, cache=None) -> str:
+    """Encode an already packed little-endian uint16 payload (any bytes-like)."""
+    cache = CODE_CACHE if cache is None else cache
+    key = payload_key(payload, compression_level)
+    code = cache.get(key)
+    if code is None:
+        with instrument.timer("compress"):
+            compress(out := io.BytesIO(), payload, compression_level)
+        compressed = out.getvalue()
+        with instrument.timer("base64"):
+            code = base64.encodebytes(compressed).decode('ascii').replace('\n', '')
+        cache.put(key, code)
+        if instrument.ENABLED:
+            instrument.count("payload_bytes", len(payload))
+            instrument.count("compressed_bytes", len(compressed))
+    else:
+        instrument.count("code_cache_hits")
+    return code
+
+def decompress(data) -> bytearray:
+    """
+    Expand a compressed payload. Literals are copied straight out of a
+    memoryview of the input and back-references are resolved against the
+    output buffer in place, without re-slicing its tail per block.
+    """
+    if hasattr(data, 'read'):
+        data = data.read()
+    inp = memoryview(data)
+    end = len(inp)
+    out = bytearray()
+    i = 0
+    while i < end:
+        block = i
+        header = inp[i]
+        i += 1
+        L, D = header >> 5, header & 0b11111
+        if not L:
+            L = D + 1
+            if i + L > end:
+                raise TuyaCodeError('truncated_literal', f'truncated literal block at offset {block}', block)
+            out += inp[i:i + L]
+            i += L
+        else:
+            if L == 7:
+                if i >= end:
+                    raise TuyaCodeError('truncated_distance', f'truncated distance block at offset {block}', block)
+                L += inp[i]
+                i += 1
+            if i >= end:
+                raise TuyaCodeError('truncated_distance', f'truncated distance block at offset {block}', block)
+            L += 2
+            D = (D << 8 | inp[i]) + 1
+            i += 1
+            start = len(out) - D
+            if start < 0:
+                raise TuyaCodeError('bad_distance', f'distance {D} reaches before start of output', block)
+            if D >= L:
+                out += out[start:start + L]
+            else:
+                # overlapping copy: the last D bytes repeat to fill L
+                out += (out[start:] * (L // D + 1))[:L]
+    return out
+
+def emit_literal_blocks(out: io.FileIO, data: bytes):
+    for i in range(0, len(data), 32):
+        emit_literal_block(out, data[i:i+32])
+
+def emit_literal_block(out: io.FileIO, data: bytes):
+    length = len(data) - 1
+    assert 0 <= length < (1 << 5)
+    out.write(bytes([length]))
+    out.write(data)
+
+def emit_distance_block(out: io.FileIO, length: int, distance: int):
+    distance -= 1
+    assert 0 <= distance < (1 << 13)
+    length -= 2
+    assert length > 0
+    block = bytearray()
+    if length >= 7:
+        assert length - 7 < (1 << 8)
+        block.append(length - 7)
+        length = 7
+    block.insert(0, length << 5 | distance >> 8)
+    block.append(distance & 0xFF)
+    out.write(block)
+
+
+def frame_hints(data: bytes) -> dict[int, int]:
+    """
+    Map payload offsets to back-reference distances suggested by repeated
+    frames. The timings are split into frames at long spaces; every frame
+    is paired with the earlier, same-length frame it shares the most
+    timings with, and each of its timings gets that frame's distance as a
+    candidate. Where the repeat holds for a whole block the match is taken
+    without searching the chain.
+    """
+    count = len(data) // 2
+    timings = array('H')
+    timings.frombytes(data[:2 * count])
+    if sys.byteorder == 'big':
+        timings.byteswap()
+
+    frames = []
+    start = 0
+    for i in range(1, count, 2):
+        if timings[i] >= FRAME_GAP:
+            frames.append((start, i + 1))
+            start = i + 1
+    if start < count:
+        frames.append((start, count))
+    if len(frames) < 2:
+        return {}
+
+    hints = {}
+    for j, (start, end) in enumerate(frames):
+        frame = timings[start:end]
+        best_score, best_distance = 2, None
+        for k in range(j - 1, max(j - FRAME_LOOKBACK, 0) - 1, -1):
+            earlier_start, earlier_end = frames[k]
+            distance = start - earlier_start
+            if 2 * distance > WINDOW:
+                break
+            if earlier_end - earlier_start != end - start:
+                continue
+            score = sum(a == b for a, b in zip(frame, timings[earlier_start:earlier_end]))
+            if score > best_score:
+                best_score, best_distance = score, distance
+        if best_distance is not None:
+            for i in range(start, end):
+                hints[2 * i] = 2 * best_distance
+    return hints
+
+
+class MatchFinder:
+    """
+    Hash-chain index over the 3-byte prefixes of `data`.
+
+    Only earlier positions sharing the 3 bytes at `pos` can give a usable
+    match, so `find()` walks that chain (newest first) instead of every
+    distance in the window. The result is the same longest/nearest match
+    the exhaustive scan picks.
+
+    Optional `hints` (offset -> distance, see `frame_hints()`) are tried
+    first. A hint that reaches the longest usable length is taken without
+    walking the chain; a shorter one is ignored, since the chain walk finds
+    a match at least as long anyway.
+    """
+
+    def __init__(self, data: bytes, hints: dict = None):
+        self.data = data
+        self.hints = hints or {}
+        self.chains = {}
+        self.indexed = 0
+
+    def _index_until(self, pos: int):
+        data, chains = self.data, self.chains
+        for p in range(self.indexed, pos):
+            key = data[p] << 16 | data[p + 1] << 8 | data[p + 2]
+            chain = chains.get(key)
+            if chain is None:
+                chains[key] = [p]
+            else:
+                chain.append(p)
+        if pos > self.indexed:
+            self.indexed = pos
+
+    def find(self, pos: int) -> tuple[int, int]:
+        """Return (length, distance) of the best match at `pos`, (0, 0) if none."""
+        data = self.data
+        if pos + MIN_LENGTH > len(data):
+            return 0, 0
+        self._index_until(pos)
+        limit = min(MAX_LENGTH, len(data) - pos)
+        hint = self.hints.get(pos)
+        if hint is not None and hint <= min(pos, WINDOW):
+            start = pos - hint
+            if data[pos:pos + limit] == data[start:start + limit]:
+                return limit, hint
+
+        chain = self.chains.get(data[pos] << 16 | data[pos + 1] << 8 | data[pos + 2])
+        if not chain:
+            return 0, 0
+
+        lowest = pos - WINDOW
+        best_len = best_dist = 0
+        for start in reversed(chain):
+            if start < lowest:
+                break
+            # a longer match must at least agree on the byte past the current best
+            if data[start + best_len] == data[pos + best_len]:
+                length = MIN_LENGTH
+                while length < limit and data[pos + length] == data[start + length]:
+                    length += 1
+                if length > best_len:
+                    best_len, best_dist = length, pos - start
+                    if length == limit:
+                        break
+        return best_len, best_dist
+
+
+class FastMatchFinder:
+    """
+    Level 1 match finder. Payloads are 16-bit timings, so it works on
+    timing boundaries: only even positions are searched and indexed, keyed
+    by the two timings there (4 bytes). Each key keeps a short chain of its
+    last FAST_CHAIN positions, and of the positions inside a match only the
+    last FAST_TAIL bytes are indexed. A frame hint, when there is one, is
+    tried before the chain. Matches are extended by comparing slices.
+    """
+
+    def __init__(self, data: bytes, hints: dict = None):
+        self.data = bytes(data)
+        self.hints = hints or {}
+        self.chains = {}
+        self.indexed = 0
+
+    def _extend(self, pos: int, start: int, limit: int) -> int:
+        data = self.data
+        length = MIN_LENGTH
+        step = 16
+        while step:
+            end = length + step
+            if end <= limit and data[pos + length:pos + end] == data[start + length:start + end]:
+                length = end
+            else:
+                step >>= 2
+        return length
+
+    def _insert(self, key: bytes, pos: int):
+        chain = self.chains.get(key)
+        if chain is None:
+            self.chains[key] = [pos]
+        else:
+            chain.append(pos)
+            if len(chain) > FAST_CHAIN:
+                del chain[0]
+
+    def find(self, pos: int) -> tuple[int, int]:
+        """Return (length, distance) of the match at `pos`, (0, 0) if none."""
+        data = self.data
+        if pos & 1 or pos + MIN_LENGTH > len(data):
+            return 0, 0
+        for p in range(max(self.indexed, pos - FAST_TAIL), pos, 2):
+            self._insert(data[p:p + 4], p)
+        self.indexed = pos + 2
+        key = data[pos:pos + 4]
+        limit = min(MAX_LENGTH, len(data) - pos)
+        best_len = best_dist = 0
+        hint = self.hints.get(pos)
+        if hint is not None and hint <= min(pos, WINDOW):
+            start = pos - hint
+            if data[start:start + MIN_LENGTH] == data[pos:pos + MIN_LENGTH]:
+                best_len, best_dist = self._extend(pos, start, limit), hint
+        chain = self.chains.get(key)
+        if chain and best_len < limit:
+            lowest = pos - WINDOW
+            for start in reversed(chain):
+                if start < lowest:
+                    break
+                # a longer match must at least agree on the byte past the current best
+                if data[start + best_len] == data[pos + best_len]:
+                    length = self._extend(pos, start, limit)
+                    if length > best_len:
+                        best_len, best_dist = length, pos - start
+                        if length == limit:
+                            break
+        self._insert(key, pos)
+        return best_len, best_dist
+
+
+def greedy_parse(data: bytes, finder: MatchFinder):
+    """Take the match at each position as soon as there is one."""
+    pos = 0
+    while pos < len(data):
+        length, distance = finder.find(pos)
+        if length >= MIN_LENGTH:
+            yield pos, length, distance
+            pos += length
+        else:
+            pos += 1
+
+def lazy_parse(data: bytes, finder: MatchFinder):
+    """
+    Like greedy_parse(), but before taking a match look one byte ahead; if
+    a longer match starts there, emit this byte as a literal instead.
+    """
+    pos = 0
+    length, distance = finder.find(pos)
+    while pos < len(data):
+        if length < MIN_LENGTH:
+            pos += 1
+            length, distance = finder.find(pos)
+            continue
+        next_length, next_distance = finder.find(pos + 1)
+        if next_length > length:
+            pos += 1
+            length, distance = next_length, next_distance
+            continue
+        yield pos, length, distance
+        pos += length
+        length, distance = finder.find(pos)
+
+def optimal_parse(data: bytes, finder: MatchFinder):
+    """
+    Smallest output for the matches the finder sees. The block cost only
+    depends on the length (2 bytes up to 8, 3 bytes above; literals cost
+    one byte each plus a header per 32), and every length up to the longest
+    match at a position is available at the same distance, so a backward
+    pass over the positions finds the cheapest split into literal runs and
+    matches.
+
+    Inside a long match the search is skipped and the rest of that match
+    is used, which keeps the level usable on long repeated signals. The
+    positions greedy_parse() would visit are always searched, so its parse
+    is one of the candidates and the result is never larger than level 2.
+    """
+    n = len(data)
+    longest = []
+    length = distance = 0
+    greedy_pos = 0
+    for pos in range(n):
+        if pos == greedy_pos or length <= 9:
+            length, distance = finder.find(pos)
+        else:
+            length -= 1
+        if pos == greedy_pos:
+            greedy_pos += length if length >= MIN_LENGTH else 1
+        longest.append((length, distance))
+    cost = [0] * (n + 1)
+    choice = [0] * n        # > 0: match length, < 0: literal run length
+    for i in range(n - 1, -1, -1):
+        best, pick = cost[i + 1] + 2, -1
+        for k in range(2, min(32, n - i) + 1):
+            c = cost[i + k] + k + 1
+            if c < best:
+                best, pick = c, -k
+        # ties go to the longer match, which is faster to decode
+        for length in range(MIN_LENGTH, longest[i][0] + 1):
+            c = cost[i + length] + (2 if length <= 8 else 3)
+            if c <= best:
+                best, pick = c, length
+        cost[i] = best
+        choice[i] = pick
+    pos = 0
+    while pos < n:
+        pick = choice[pos]
+        if pick > 0:
+            yield pos, pick, longest[pos][1]
+            pos += pick
+        else:
+            pos -= pick
+
+PARSERS = {1: greedy_parse, 2: greedy_parse, 3: lazy_parse, 4: optimal_parse}
+LEVELS = (0, *PARSERS)
+
+def compress(out: io.FileIO, data: bytes, level=2):
+    """
+    Level 0 emits literals only. Level 1 is a greedy fast mode that probes
+    a short chain per timing (`FastMatchFinder`). Level 2 searches
+    the whole window and matches the original exhaustive encoder byte for
+    byte. Level 3 adds one-byte lazy matching and level 4 an optimal parse,
+    for blasters with tight payload limits. Levels 3 and 4 also take the
+    repeated-frame matches from `frame_hints()` that run to the longest
+    usable length, without searching; level 1 probes the hint first.
+    """
+    if level == 0:
+        instrument.count("literal_bytes", len(data))
+        return emit_literal_blocks(out, data)
+    if level not in PARSERS:
+        raise ValueError(f"unknown compression level {level} (expected one of {LEVELS})")
+
+    # the full chain walk of level 2 already finds the longest match, and
+    # must keep the nearest one to match the original encoder
+    hints = frame_hints(data) if level != 2 else None
+    if level == 1:
+        finder = FastMatchFinder(data, hints)
+    else:
+        finder = MatchFinder(data, hints=hints)
+
+    block_start = 0
+    matches = match_bytes = 0
+    for pos, length, distance in PARSERS[level](data, finder):
+        emit_literal_blocks(out, data[block_start:pos])
+        emit_distance_block(out, length, distance)
+        block_start = pos + length
+        matches += 1
+        match_bytes += length
+    emit_literal_blocks(out, data[block_start:])
+    if instrument.ENABLED:
+        instrument.count("matches", matches)
+        instrument.count("match_bytes", match_bytes)
+        instrument.count("literal_bytes", len(data) - match_bytes)
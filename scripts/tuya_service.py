@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Long-running conversion service for callers such as Home Assistant.
+
+Every script run pays for process start-up and the pyIRDecoder import. The
+service pays once: it listens on localhost HTTP (or a Unix socket), keeps
+the protocol modules and the encode/Tuya code caches warm in its worker
+processes, and gathers concurrent requests into batches so a burst of
+keys costs one round trip to the pool.
+
+Endpoints (JSON in, JSON out):
+
+  POST /encode   {"timings": [9024, 4512, ...], "level": 2, "normalize": 0.1}
+                 -> {"code": "..."}
+  POST /decode   {"code": "..."} -> {"timings": [...]}
+  POST /irdb     {"protocol": "NEC", "device": 0, "subdevice": -1, "function": 12, "level": 2}
+                 -> {"raw": [...], "code": "..."}
+  GET  /metrics  request counts, errors and latency per endpoint, batch sizes
+  GET  /health   {"status": "ok"}
+
+`level` and `normalize` are optional. Errors come back as {"error": "..."}
+with status 400 (bad request), 422 (the key could not be encoded) or 503
+(/irdb without pyIRDecoder).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+
+from irdb_common import (
+    CODE_CACHE_PATH, ENCODE_CACHE, PROTOCOLS, PROTOCOL_ALIASES, check_native_encoders, generate_raw_signal,
+)
+from protocol_aliases import trial
+from protocol_registry import pyirdecoder_fingerprint
+from timing_normalize import normalize_timings
+from tuya_codec import CODE_CACHE, LEVELS, decode_ir, encode_ir_batch
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY = 1 << 20
+LATENCY_SAMPLES = 10000     # per endpoint, for the percentiles in /metrics
+
+
+# --- worker side --------------------------------------------------------------
+
+def init_worker(disk_cache=True):
+    """Warm a worker: load the protocol manifest and attach the disk tiers."""
+    if disk_cache:
+        CODE_CACHE.path = CODE_CACHE_PATH
+    else:
+        ENCODE_CACHE.path = None
+    if pyirdecoder_fingerprint() is not None:
+        PROTOCOLS.manifest()
+
+def _flush_caches():
+    # pool workers exit without running atexit hooks
+    ENCODE_CACHE.flush()
+    CODE_CACHE.flush()
+
+def _encode_error(exc):
+    return f"could not encode timings: {exc or type(exc).__name__}"
+
+def _encode_groups(signals, levels):
+    """
+    encode_ir_batch() once per compression level; returns (code, error)
+    in input order. If a batch fails, its signals are encoded one at a time
+    so that only the bad ones get an error.
+    """
+    results = [None] * len(signals)
+    for level in set(levels):
+        indexes = [i for i, lvl in enumerate(levels) if lvl == level]
+        try:
+            codes = encode_ir_batch([signals[i] for i in indexes], level)
+        except Exception:
+            for i in indexes:
+                try:
+                    results[i] = (encode_ir_batch([signals[i]], level)[0], None)
+                except Exception as exc:
+                    results[i] = (None, _encode_error(exc))
+        else:
+            for i, code in zip(indexes, codes):
+                results[i] = (code, None)
+    return results
+
+def encode_jobs(jobs):
+    """[(timings, level, normalize)] -> [(code, error)]"""
+    results = [None] * len(jobs)
+    signals, levels, ok = [], [], []
+    for i, (timings, level, tolerance) in enumerate(jobs):
+        try:
+            signals.append(normalize_timings(timings, tolerance) if tolerance is not None else timings)
+        except Exception as exc:
+            results[i] = (None, _encode_error(exc))
+            continue
+        levels.append(level)
+        ok.append(i)
+    for i, result in zip(ok, _encode_groups(signals, levels)):
+        results[i] = result
+    _flush_caches()
+    return results
+
+def decode_jobs(codes):
+    """[code] -> [(timings, error)]"""
+    results = []
+    for code in codes:
+        try:
+            results.append((decode_ir(code), None))
+        except Exception as exc:
+            results.append((None, f"invalid Tuya code: {exc or type(exc).__name__}"))
+    return results
+
+def irdb_jobs(jobs):
+    """[(protocol, device, subdevice, function, level)] -> [((raw, code), error)]"""
+    raws = [generate_raw_signal(*job[:4]) for job in jobs]
+    ok = [i for i, (rlc, _) in enumerate(raws) if rlc is not None]
+    encoded = _encode_groups([raws[i][0] for i in ok], [jobs[i][4] for i in ok])
+    results = [(None, err) for _, err in raws]
+    for i, (code, err) in zip(ok, encoded):
+        results[i] = ((raws[i][0], code), None) if err is None else (None, err)
+    _flush_caches()
+    return results
+
+
+# --- batching -------------------------------------------------------------------
+
+class Batcher:
+    """
+    Collects items submitted by concurrent requests and runs them through
+    `func` in the pool, up to `max_batch` at a time. A batch goes out as
+    soon as it is full or `max_delay` seconds after its first item. When a
+    worker dies the pool is broken for good; `restart(executor)` is then
+    called to get a replacement for the following batches.
+    """
+
+    def __init__(self, func, executor, max_batch=64, max_delay=0.002, max_in_flight=4, restart=None):
+        self.func = func
+        self.executor = executor
+        self.restart = restart
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.batches = self.items = 0
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            self.batches += 1
+            self.items += len(batch)
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        executor = self.executor
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                executor, self.func, [item for item, _ in batch])
+        except BrokenProcessPool as exc:
+            results = [(None, f"worker failed: {exc}")] * len(batch)
+            if self.restart is not None:
+                self.executor = self.restart(executor)
+        except Exception as exc:
+            results = [(None, f"worker failed: {exc}")] * len(batch)
+        finally:
+            self.slots.release()
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "mean_size": self.items / self.batches if self.batches else 0.0}
+
+
+# --- metrics --------------------------------------------------------------------
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = self.errors = 0
+        self.total_s = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, seconds, ok):
+        self.requests += 1
+        self.errors += not ok
+        self.total_s += seconds
+        self.latencies.append(seconds)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3 if latencies else 0.0
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "mean_ms": self.total_s / self.requests * 1e3 if self.requests else 0.0,
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+        }
+
+
+# --- HTTP front end -------------------------------------------------------------
+
+class BadRequest(Exception):
+    pass
+
+def _int_list(value, name):
+    if not isinstance(value, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+        raise BadRequest(f"'{name}' must be a list of integers")
+    return value
+
+def _level(request):
+    level = request.get("level", 2)
+    if not isinstance(level, int) or isinstance(level, bool) or level not in LEVELS:
+        raise BadRequest(f"'level' must be one of {', '.join(map(str, LEVELS))}")
+    return level
+
+def _normalize(request):
+    tolerance = request.get("normalize")
+    if tolerance is not None and (not isinstance(tolerance, (int, float)) or not 0 <= tolerance < 1):
+        raise BadRequest("'normalize' must be a tolerance in [0, 1)")
+    return tolerance
+
+
+class TuyaService:
+    def __init__(self, workers=None, max_batch=64, max_delay=0.002, disk_cache=True):
+        self.workers = workers or os.cpu_count() or 1
+        self.disk_cache = disk_cache
+        self.executor = self._new_executor()
+        batcher_args = dict(max_batch=max_batch, max_delay=max_delay, max_in_flight=self.workers * 2,
+                            restart=self.restart_executor)
+        self.batchers = {
+            "encode": Batcher(encode_jobs, self.executor, **batcher_args),
+            "decode": Batcher(decode_jobs, self.executor, **batcher_args),
+            "irdb": Batcher(irdb_jobs, self.executor, **batcher_args),
+        }
+        self.routes = {
+            ("POST", "/encode"): self.encode,
+            ("POST", "/decode"): self.decode,
+            ("POST", "/irdb"): self.irdb,
+            ("GET", "/metrics"): self.metrics,
+            ("GET", "/health"): self.health,
+        }
+        self.endpoints = {path: EndpointMetrics() for _, path in self.routes}
+        self.have_decoder = pyirdecoder_fingerprint() is not None
+        self.alias_tasks = {}   # IRDB protocol name -> task trying its alias candidates
+        self.started = time.time()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                   initargs=(self.disk_cache,))
+
+    def restart_executor(self, broken):
+        """Replace the pool `broken` by a dead worker (once, however many batches saw it) in every batcher."""
+        if self.executor is broken:
+            print("[WARNING] A worker died; restarting the pool.", file=sys.stderr, flush=True)
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._new_executor()
+            for batcher in self.batchers.values():
+                batcher.executor = self.executor
+        return self.executor
+
+    async def _protocol(self, name, row):
+        """
+        The pyIRDecoder protocol for IRDB protocol `name`, or None. An
+        unknown name is resolved once, however many requests ask for it,
+        with its candidate trials spread over the pool rather than run one
+        after another inside a batch.
+        """
+        if PROTOCOLS.entry(name):
+            return name
+        result = PROTOCOL_ALIASES.cached(name)
+        if result is False:
+            task = self.alias_tasks.get(name)
+            if task is None:
+                task = self.alias_tasks[name] = asyncio.ensure_future(self._try_aliases(name, row))
+            result = await task
+        return result and result["protocol"]
+
+    async def _try_aliases(self, name, row):
+        loop = asyncio.get_running_loop()
+        samples = {name: [tuple(row)]}
+        jobs = PROTOCOL_ALIASES.trial_jobs(samples)
+        try:
+            scores = await asyncio.gather(
+                *(loop.run_in_executor(self.executor, trial, candidate, rows) for (_, candidate), rows in jobs.items()),
+                return_exceptions=True)
+            scores = {job: (0, 0, 0) if isinstance(score, BaseException) else score
+                      for job, score in zip(jobs, scores)}
+            return PROTOCOL_ALIASES.choose(samples, scores)[name]
+        finally:
+            del self.alias_tasks[name]
+
+    # --- endpoints ---
+
+    async def encode(self, request):
+        timings = _int_list(request.get("timings"), "timings")
+        code, err = await self.batchers["encode"].submit((timings, _level(request), _normalize(request)))
+        return (HTTPStatus.UNPROCESSABLE_ENTITY, {"error": err}) if err else (HTTPStatus.OK, {"code": code})
+
+    async def decode(self, request):
+        code = request.get("code")
+        if not isinstance(code, str):
+            raise BadRequest("'code' must be a string")
+        timings, err = await self.batchers["decode"].submit(code)
+        return (HTTPStatus.BAD_REQUEST, {"error": err}) if err else (HTTPStatus.OK, {"timings": timings})
+
+    async def irdb(self, request):
+        if not self.have_decoder:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "pyIRDecoder is not installed"}
+        protocol = request.get("protocol")
+        if not isinstance(protocol, str):
+            raise BadRequest("'protocol' must be a string")
+        # same string fields the CSV rows give generate_raw_signal()
+        row = [str(request.get(field, default)) for field, default in
+               (("device", 0), ("subdevice", -1), ("function", 0))]
+        resolved = await self._protocol(protocol, row)
+        if resolved is None:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {
+                "error": f"[ERROR] Protocol '{protocol}' not found in pyIRDecoder.protocols."}
+        result, err = await self.batchers["irdb"].submit((resolved, *row, _level(request)))
+        if err:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {"error": err}
+        raw, code = result
+        return HTTPStatus.OK, {"raw": raw, "code": code}
+
+    async def metrics(self, request):
+        return HTTPStatus.OK, {
+            "uptime_s": time.time() - self.started,
+            "workers": self.workers,
+            "endpoints": {path: m.summary() for path, m in self.endpoints.items()},
+            "batches": {name: b.stats() for name, b in self.batchers.items()},
+        }
+
+    async def health(self, request):
+        return HTTPStatus.OK, {"status": "ok"}
+
+    # --- plumbing ---
+
+    async def dispatch(self, method, path, body):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in self.routes):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} not allowed on {path}"}
+            return HTTPStatus.NOT_FOUND, {"error": f"unknown endpoint {path}"}
+        start = time.perf_counter()
+        try:
+            request = json.loads(body) if body else {}
+            if not isinstance(request, dict):
+                raise BadRequest("request body must be a JSON object")
+            status, response = await handler(request)
+        except (BadRequest, ValueError) as exc:
+            status, response = HTTPStatus.BAD_REQUEST, {"error": str(exc)}
+        except Exception as exc:
+            # answer and count it rather than dropping the connection
+            print(f"{method} {path} failed: {type(exc).__name__}: {exc}", file=sys.stderr, flush=True)
+            status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"internal error: {type(exc).__name__}: {exc}"}
+        self.endpoints[path].record(time.perf_counter() - start, status == HTTPStatus.OK)
+        return status, response
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    status, response = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "request too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, response = await self.dispatch(method, target.split("?", 1)[0], body)
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                data = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # malformed request or client went away
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        loop = asyncio.get_running_loop()
+        # start every worker now so the first request does not pay for it
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _flush_caches)
+                               for _ in range(self.workers)))
+        tasks = [asyncio.create_task(b.run()) for b in self.batchers.values()]
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+            where = socket_path
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            where = f"http://{host}:{port}"
+        print(f"Listening on {where} with {self.workers} workers.", file=sys.stderr, flush=True)
+
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        async with server:
+            await stop.wait()
+        for task in tasks:
+            task.cancel()
+        self.executor.shutdown()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Tuya IR conversions over localhost HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"listen address (default {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"listen port (default {DEFAULT_PORT})")
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--max-batch", type=int, default=64, help="most requests per batch (default 64)")
+    parser.add_argument("--max-delay-ms", type=float, default=2.0,
+                        help="longest wait for a batch to fill (default 2 ms)")
+    parser.add_argument("--no-disk-cache", action="store_true",
+                        help="do not read or write the persistent encode and Tuya code caches")
+    args = parser.parse_args()
+
+    # build the protocol manifest once here rather than in every worker;
+    # /encode and /decode still work without pyIRDecoder
+    if pyirdecoder_fingerprint() is not None:
+        PROTOCOLS.manifest()
+        check_native_encoders()
+
+    service = TuyaService(args.workers, args.max_batch, args.max_delay_ms / 1e3,
+                          disk_cache=not args.no_disk_cache)
+    asyncio.run(service.serve(args.host, args.port, args.socket))
+
+if __name__ == "__main__":
+    main()
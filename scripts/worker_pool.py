@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Fault-isolated process pool for bulk conversions.
+
+ProcessPoolExecutor cannot stop a task that hangs, and one worker that
+dies breaks the whole pool. Here every worker has its own pipe, so the
+parent knows which task each one runs and since when:
+
+  timeouts   a task past its deadline has its worker killed and replaced
+  recycling  a worker is replaced after `max_tasks` tasks, or once its
+             peak RSS passes `max_memory` MB, so slow leaks cannot pile up
+  retries    failed tasks (exception, timeout, crashed worker) go to a
+             retry queue that runs after the regular tasks, up to `retries`
+             more attempts each
+
+Tasks that still fail come back with a TaskFailure instead of a result.
+`row_timeout()` bounds single rows inside a task with SIGALRM, which
+also interrupts code that swallows ordinary exceptions.
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, NamedTuple
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+ROW_TIMEOUT = 10        # seconds one row may take in pyIRDecoder
+RETRY_FACTOR = 4        # retried rows get this many times the row timeout
+TIMEOUT_ERROR = "[TIMEOUT]"
+RETRY_ERRORS = (TIMEOUT_ERROR, "[CRASH]")   # errors worth another try
+
+
+class RowTimeout(BaseException):
+    """
+    A row ran past its time limit. A BaseException, so that the broad
+    `except Exception` handlers around protocol code do not swallow it.
+    """
+
+
+class TaskFailure(NamedTuple):
+    kind: str           # "error", "timeout" or "crash"
+    message: str
+    attempts: int
+    seconds: float
+
+    def error(self):
+        """As a record error, e.g. "[CRASH] worker exited with code -9 (after 2 attempts)"."""
+        attempts = f" (after {self.attempts} attempts)" if self.attempts > 1 else ""
+        return f"[{self.kind.upper()}] {self.message}{attempts}"
+
+
+class Done(NamedTuple):
+    key: Any
+    result: Any         # None when the task failed
+    failure: Any        # TaskFailure, or None on success
+
+
+def _raise_timeout(signum, frame):
+    raise RowTimeout("row timed out")
+
+@contextmanager
+def row_timeout(seconds):
+    """Raise RowTimeout in the block after `seconds`. A no-op without SIGALRM, off the main thread or for None."""
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (0 where unknown)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if os.uname().sysname == "Darwin" else peak / 1024
+
+def _worker_main(conn):
+    # the parent handles Ctrl+C and shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args = task
+        try:
+            reply = ("ok", fn(*args))
+        except Exception as exc:
+            reply = ("error", f"{type(exc).__name__}: {exc}")
+        except RowTimeout as exc:
+            reply = ("timeout", str(exc))
+        conn.send((*reply, peak_rss_mb()))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+        self.tasks = 0
+        self.task = None        # (key, fn, args, attempts, started, retries)
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    def __init__(self, workers=None, timeout=None, max_tasks=None, max_memory=None, retries=1):
+        self.size = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.retries = retries
+        self.ctx = multiprocessing.get_context()
+        self.idle = []
+        self.busy = {}          # conn -> _Worker
+        self.queue = deque()    # (key, fn, args, attempts, retries)
+        self.retry_queue = deque()
+        self.recycled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        """Tasks queued or running."""
+        return len(self.queue) + len(self.retry_queue) + len(self.busy)
+
+    def submit(self, key, fn, *args, retries=None):
+        """Queue fn(*args) as task `key`; `retries` overrides the pool's for this task."""
+        self.queue.append((key, fn, args, 0, self.retries if retries is None else retries))
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.queue or self.retry_queue:
+            if not self.idle and len(self.busy) >= self.size:
+                return
+            key, fn, args, attempts, retries = (self.queue or self.retry_queue).popleft()
+            worker = self.idle.pop() if self.idle else _Worker(self.ctx)
+            try:
+                worker.conn.send((fn, args))
+            except OSError:
+                worker.stop(kill=True)
+                worker = _Worker(self.ctx)
+                worker.conn.send((fn, args))
+            worker.task = (key, fn, args, attempts + 1, time.monotonic(), retries)
+            self.busy[worker.conn] = worker
+
+    def _finish(self, worker, kind, payload, replace):
+        key, fn, args, attempts, started, retries = worker.task
+        worker.task = None
+        del self.busy[worker.conn]
+        if replace:
+            worker.stop(kill=kind in ("timeout", "crash"))
+            self.recycled += 1
+        else:
+            self.idle.append(worker)
+        if kind == "ok":
+            return Done(key, payload, None)
+        if attempts <= retries:
+            self.retry_queue.append((key, fn, args, attempts, retries))
+            return None
+        return Done(key, None, TaskFailure(kind, payload, attempts, round(time.monotonic() - started, 3)))
+
+    def wait(self):
+        """
+        Block until at least one task finishes for good (succeeded, or
+        failed with no retries left) and return their Done tuples; an
+        empty list when nothing is left.
+        """
+        while True:
+            self._dispatch()
+            if not self.busy:
+                return []
+            now = time.monotonic()
+            wait_for = None
+            if self.timeout:
+                wait_for = max(0.0, min(w.task[4] for w in self.busy.values()) + self.timeout - now)
+            done = []
+            for conn in multiprocessing.connection.wait(list(self.busy), wait_for):
+                worker = self.busy[conn]
+                try:
+                    kind, payload, rss = conn.recv()
+                except (EOFError, OSError):
+                    worker.process.join(1)
+                    outcome = self._finish(worker, "crash", f"worker exited with code {worker.process.exitcode}",
+                                           replace=True)
+                else:
+                    worker.tasks += 1
+                    recycle = ((self.max_tasks and worker.tasks >= self.max_tasks)
+                               or (self.max_memory and rss > self.max_memory))
+                    outcome = self._finish(worker, kind, payload, replace=recycle)
+                if outcome:
+                    done.append(outcome)
+            if self.timeout:
+                now = time.monotonic()
+                for worker in [w for w in self.busy.values() if now - w.task[4] >= self.timeout]:
+                    outcome = self._finish(worker, "timeout", f"task took longer than {self.timeout}s", replace=True)
+                    if outcome:
+                        done.append(outcome)
+            if done:
+                return done
+
+    def close(self):
+        for worker in self.idle:
+            worker.stop()
+        for worker in self.busy.values():
+            worker.stop(kill=True)
+        self.idle, self.busy = [], {}
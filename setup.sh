@@ -51,15 +51,37 @@ wget --no-check-certificate --content-disposition -P "$HOME/irdb_to_tuya/scripts
 wget --no-check-certificate --content-disposition -P "$HOME/irdb_to_tuya/scripts" \
     "https://raw.githubusercontent.com/burkminipup/irdb-to-tuya/main/scripts/4_bulk_raw_to_tuya.py"
 
+wget --no-check-certificate --content-disposition -P "$HOME/irdb_to_tuya/scripts" \
+    "https://raw.githubusercontent.com/burkminipup/irdb-to-tuya/main/scripts/5_batch_irdb_to_tuya.py"
+
+wget --no-check-certificate --content-disposition -P "$HOME/irdb_to_tuya/scripts" \
+    "https://raw.githubusercontent.com/burkminipup/irdb-to-tuya/main/scripts/6_bulk_verify_tuya.py"
+
+wget --no-check-certificate --content-disposition -P "$HOME/irdb_to_tuya/scripts" \
+    "https://raw.githubusercontent.com/burkminipup/irdb-to-tuya/main/scripts/tuya_service.py"
+
+wget --no-check-certificate --content-disposition -P "$HOME/irdb_to_tuya/scripts" \
+    "https://raw.githubusercontent.com/burkminipup/irdb-to-tuya/main/scripts/tuya_client.py"
+
 wget --no-check-certificate --content-disposition -P "$HOME/irdb_to_tuya/scripts" \
     "https://raw.githubusercontent.com/burkminipup/irdb-to-tuya/main/scripts/brands"
 
+# Shared modules imported by the conversion scripts
+for module in tuya_codec.py irdb_common.py irdb_index.py disk_lru.py raw_records.py protocol_registry.py timing_normalize.py instrument.py sync_manifest.py reverse_index.py native_encoders.py key_search.py protocol_aliases.py code_store.py protocol_decode.py worker_pool.py; do
+    wget --no-check-certificate --content-disposition -O "$HOME/irdb_to_tuya/scripts/$module" \
+        "https://raw.githubusercontent.com/burkminipup/irdb-to-tuya/main/scripts/$module"
+done
+
 chmod +x \
     "$HOME/irdb_to_tuya/scripts/brands" \
     "$HOME/irdb_to_tuya/scripts/1_prompt_irdb_to_raw.py" \
     "$HOME/irdb_to_tuya/scripts/2_prompt_raw_to_tuya.py" \
     "$HOME/irdb_to_tuya/scripts/3_bulk_irdb_to_raw.py" \
-    "$HOME/irdb_to_tuya/scripts/4_bulk_raw_to_tuya.py"
+    "$HOME/irdb_to_tuya/scripts/4_bulk_raw_to_tuya.py" \
+    "$HOME/irdb_to_tuya/scripts/5_batch_irdb_to_tuya.py" \
+    "$HOME/irdb_to_tuya/scripts/6_bulk_verify_tuya.py" \
+    "$HOME/irdb_to_tuya/scripts/tuya_service.py" \
+    "$HOME/irdb_to_tuya/scripts/tuya_client.py"
 #
 # -------------------------
 #